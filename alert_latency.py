@@ -0,0 +1,151 @@
+# alert_latency.py
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from metrics import ALERT_LATENCY_SECONDS
+
+# =========================
+# End-to-end alert latency
+# =========================
+# Каждый алерт несёт отметки времени:
+#   bar_close → fetched → evaluated → enqueued → delivered
+# FIRST MOVE — delivered = send_message в чат вернулся;
+# CONFIRM LIGHT — delivered = confirm-entry принял payload (дальше — его зона).
+# Перцентили по (тип, биржа) — скользящее окно + суточный итог в Telegram.
+ALERT_LATENCY_WINDOW = int(os.getenv("ALERT_LATENCY_WINDOW", "1000"))
+ALERT_LATENCY_SUMMARY_UTC_HOUR = int(os.getenv("ALERT_LATENCY_SUMMARY_UTC_HOUR", "0"))
+
+STAMPS = ("bar_close", "fetched", "evaluated", "enqueued", "delivered")
+# hop -> (from, to)
+HOPS = {
+    "fetch": ("bar_close", "fetched"),
+    "evaluate": ("fetched", "evaluated"),
+    "queue": ("evaluated", "enqueued"),
+    "deliver": ("enqueued", "delivered"),
+    "total": ("bar_close", "delivered"),
+}
+
+Key = Tuple[str, str]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    v = sorted(values)
+    n = len(v)
+
+    def pick(q: float) -> float:
+        return round(v[min(n - 1, max(0, int(q * n + 0.5) - 1))], 3)
+
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(v[-1], 3)}
+
+
+class LatencyTracker:
+    def __init__(self, window: int = ALERT_LATENCY_WINDOW):
+        self.window = window
+        # (type, exchange) -> последние window записей {hop: sec}
+        self._recent: Dict[Key, Deque[Dict[str, float]]] = {}
+        # то же с последнего суточного итога
+        self._daily: Dict[Key, List[Dict[str, float]]] = {}
+        self._daily_since = time.time()
+        # record() зовут и из потока drainer'а confirm-entry
+        self._lock = threading.Lock()
+
+    def track(self, alert_type: str, exchange: str, stamps: Dict[str, float]) -> Callable[[float], None]:
+        """
+        Отметка enqueued + callback для момента доставки.
+        """
+        stamps["enqueued"] = time.time()
+
+        def delivered(ts: float) -> None:
+            stamps["delivered"] = ts
+            self.record(alert_type, exchange, stamps)
+
+        return delivered
+
+    def record(self, alert_type: str, exchange: str, stamps: Dict[str, float]) -> None:
+        hops = {
+            hop: max(0.0, stamps[b] - stamps[a])
+            for hop, (a, b) in HOPS.items()
+            if stamps.get(a) and stamps.get(b)
+        }
+        if "total" not in hops:
+            return
+
+        key = (alert_type, exchange or "?")
+        with self._lock:
+            self._recent.setdefault(key, deque(maxlen=self.window)).append(hops)
+            self._daily.setdefault(key, []).append(hops)
+        ALERT_LATENCY_SECONDS.observe(hops["total"], type=alert_type, exchange=key[1])
+
+    @staticmethod
+    def _summarize(rows) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"n": len(rows)}
+        for hop in HOPS:
+            p = percentiles([r[hop] for r in rows if hop in r])
+            if p:
+                out[hop] = p
+        return out
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._recent.items()]
+        return {f"{t}/{ex}": self._summarize(rows) for (t, ex), rows in sorted(items)}
+
+    def daily_summary(self) -> Optional[str]:
+        """
+        Текст суточного итога (None — алертов не было); окно сбрасывается.
+        """
+        with self._lock:
+            daily, self._daily = self._daily, {}
+            since, self._daily_since = self._daily_since, time.time()
+        if not daily:
+            return None
+
+        hours = (time.time() - since) / 3600.0
+        lines = [f"⏱ <b>ALERT LATENCY</b> ({hours:.0f}h, bar close → delivered)"]
+        for (t, ex), rows in sorted(daily.items()):
+            s = self._summarize(rows)
+            total = s["total"]
+            lines.append(
+                f"\n<b>{t}</b> {ex.upper()} ×{s['n']}\n"
+                f"p50 {total['p50']:.1f}s · p90 {total['p90']:.1f}s · p99 {total['p99']:.1f}s · max {total['max']:.1f}s"
+            )
+            hops = " · ".join(
+                f"{hop} {s[hop]['p50']:.1f}s" for hop in ("fetch", "evaluate", "queue", "deliver") if hop in s
+            )
+            if hops:
+                lines.append(f"p50: {hops}")
+        return "\n".join(lines)
+
+
+def _next_summary_at(now: float) -> float:
+    day = 86400.0
+    at = (now // day) * day + ALERT_LATENCY_SUMMARY_UTC_HOUR * 3600.0
+    return at if at > now else at + day
+
+
+async def run_daily_summary(
+    tracker: LatencyTracker,
+    post: Callable[[str], None],
+    is_leader: Callable[[], bool] = lambda: True,
+) -> None:
+    """
+    Итог шлёт только лидер (при нескольких воркерах); остальные просто
+    сбрасывают суточное окно.
+    """
+    while True:
+        await asyncio.sleep(max(1.0, _next_summary_at(time.time()) - time.time()))
+        try:
+            text = tracker.daily_summary()
+            if text and is_leader():
+                post(text)
+        except Exception as e:
+            print("⚠️ LATENCY SUMMARY ERROR:", repr(e), flush=True)
+
+
+LATENCY = LatencyTracker()
@@ -1,6 +1,6 @@
 import os
 import time
-import requests
+import http_pool
 from typing import List, Dict, Any
 
 BINANCE_BASE = "https://api.binance.com"
@@ -25,7 +25,7 @@ def _sym(symbol: str) -> str:
 
 def _fetch_klines(symbol: str, interval: str, limit: int) -> List[Dict[str, Any]]:
     params = {"symbol": _sym(symbol), "interval": interval, "limit": int(limit)}
-    r = requests.get(BINANCE_KLINES, params=params, timeout=HTTP_TIMEOUT)
+    r = http_pool.get(BINANCE_KLINES, params=params, timeout=HTTP_TIMEOUT)
     r.raise_for_status()
     data = r.json()
 
@@ -1,4 +1,4 @@
-import requests
+import http_pool
 from typing import List, Dict, Any, Optional
 
 BASE = "https://api.bybit.com"
@@ -25,7 +25,7 @@ def _fetch_kline(category: str, symbol: str, interval: str, limit: int = 200) ->
         "limit": str(limit),
     }
 
-    r = requests.get(url, params=params, timeout=10)
+    r = http_pool.get(url, params=params, timeout=10)
     r.raise_for_status()
     data = r.json()
 
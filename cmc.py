@@ -1,5 +1,5 @@
 import datetime as dt
-import requests
+import http_pool
 from typing import Any, Dict, List, Optional
 
 CMC_BASE = "https://pro-api.coinmarketcap.com"
@@ -16,7 +16,7 @@ class CMCClient:
             "X-CMC_PRO_API_KEY": self.api_key,
             "Accept": "application/json",
         }
-        r = requests.get(url, headers=headers, params=params, timeout=self.timeout)
+        r = http_pool.get(url, headers=headers, params=params, timeout=self.timeout)
         r.raise_for_status()
         return r.json()
 
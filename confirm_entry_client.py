@@ -1,11 +1,19 @@
 import os
-import requests
 import time
 
+import http_pool
+from alert_latency import LATENCY
+
+from spool import Spool, run_drainer
+
 CONFIRM_ENTRY_URL = os.getenv("CONFIRM_ENTRY_URL")  # например: https://confirm-entry.up.railway.app/webhook/listing
 CONFIRM_ENTRY_TIMEOUT = float(os.getenv("CONFIRM_ENTRY_TIMEOUT", "5"))
 
-def send_to_confirm_entry(symbol, exchange, tf, candles, mode_hint="CONFIRM_LIGHT"):
+def send_to_confirm_entry(symbol, exchange, tf, candles, mode_hint="CONFIRM_LIGHT", alert=None):
+    """
+    alert — {"type", "exchange", "stamps"} для alert_latency: едет в spool
+    рядом с payload (наружу не отправляется), delivered — по 200 от confirm-entry.
+    """
     if not CONFIRM_ENTRY_URL:
         return False, "no_url"
 
@@ -15,21 +23,54 @@ def send_to_confirm_entry(symbol, exchange, tf, candles, mode_hint="CONFIRM_LIGH
         "tf": tf,
         "mode_hint": mode_hint,
         "candles": [
+            # свечи бирж — open/high/..., упакованные (detectors) — o/h/...
             {
-                "o": c["o"],
-                "h": c["h"],
-                "l": c["l"],
-                "c": c["c"],
-                "v": c["v"],
+                "o": c.get("open", c.get("o")),
+                "h": c.get("high", c.get("h")),
+                "l": c.get("low", c.get("l")),
+                "c": c.get("close", c.get("c")),
+                "v": c.get("volume", c.get("v")),
             }
             for c in candles
         ],
     }
 
+    if alert is not None:
+        alert["stamps"]["enqueued"] = time.time()
+        payload["_alert"] = alert
+
+    # сначала в spool: если confirm-entry лежит, payload дождётся восстановления
+    _spool().append(payload)
+    return True, "spooled"
+
+
+# ================= SPOOL / DRAINER =================
+CONFIRM_ENTRY_BATCH = int(os.getenv("CONFIRM_ENTRY_BATCH", "100"))
+
+_SPOOL = None
+
+
+def _spool() -> Spool:
+    global _SPOOL
+    if _SPOOL is None:
+        _SPOOL = Spool("confirm_entry")
+    return _SPOOL
+
+
+def queue_depth() -> int:
+    return _spool().pending
+
+
+def lag_sec() -> float:
+    return _spool().lag_sec()
+
+
+def _post(payload):
+    body = {k: v for k, v in payload.items() if k != "_alert"}
     try:
-        r = requests.post(
+        r = http_pool.post(
             CONFIRM_ENTRY_URL,
-            json=payload,
+            json=body,
             timeout=CONFIRM_ENTRY_TIMEOUT,
         )
         if r.status_code == 200:
@@ -37,3 +78,29 @@ def send_to_confirm_entry(symbol, exchange, tf, candles, mode_hint="CONFIRM_LIGH
         return False, f"http_{r.status_code}"
     except Exception as e:
         return False, str(e)
+
+
+def _deliver(payloads):
+    """
+    Шлём по порядку; останавливаемся на первой временной ошибке.
+    4xx (кроме 408/429) — payload битый, повтор не поможет: выкидываем.
+    """
+    done = 0
+    for payload in payloads:
+        ok, reason = _post(payload)
+        if not ok:
+            permanent = reason.startswith("http_4") and reason not in ("http_408", "http_429")
+            print(f"⚠️ CONFIRM ENTRY {payload.get('symbol')}: {reason}", flush=True)
+            if not permanent:
+                break
+        elif payload.get("_alert"):
+            alert = payload["_alert"]
+            LATENCY.record(alert["type"], alert["exchange"], dict(alert["stamps"], delivered=time.time()))
+        done += 1
+    return done
+
+
+async def run_confirm_entry_drainer():
+    if not CONFIRM_ENTRY_URL:
+        return
+    await run_drainer(_spool(), _deliver, batch_max=CONFIRM_ENTRY_BATCH)
@@ -1,7 +1,7 @@
 # confirm_sender.py
-import requests
+import http_pool
 
 def send_to_confirm_engine(payload: dict, url: str):
-    r = requests.post(url, json=payload, timeout=15)
+    r = http_pool.post(url, json=payload, timeout=15)
     r.raise_for_status()
     return r.json()
@@ -0,0 +1,422 @@
+# coordination.py
+import asyncio
+import bisect
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from state import STATE_DIR
+
+# =========================
+# Multi-worker coordination
+# =========================
+# COORD_ENABLED=1 — несколько uvicorn-воркеров / процессов на одном STATE_DIR:
+#   * leader lease (SQLite) — singleton-задачи (CMC, списки инструментов)
+#     выполняет только лидер, остальные читают опубликованный им снимок;
+#   * consistent-hash ring по живым воркерам — каждый cmc_id (и его алерты)
+#     обрабатывает ровно один воркер;
+#   * слот воркера (flock) — стабильный id и свой каталог spool, который
+#     после рестарта подхватит следующий процесс.
+COORD_ENABLED = os.getenv("COORD_ENABLED", "0") == "1"
+COORD_DB = os.getenv("COORD_DB", os.path.join(STATE_DIR, "coord.sqlite"))
+COORD_LEASE_SEC = float(os.getenv("COORD_LEASE_SEC", "30"))
+COORD_HEARTBEAT_SEC = float(os.getenv("COORD_HEARTBEAT_SEC", "10"))
+COORD_VNODES = int(os.getenv("COORD_VNODES", "64"))
+COORD_MAX_SLOTS = int(os.getenv("COORD_MAX_SLOTS", "64"))
+# пересланное воркеру, но не забранное дольше этого, — выкидываем (устарело)
+COORD_INBOX_TTL_SEC = float(os.getenv("COORD_INBOX_TTL_SEC", "600"))
+
+LEADER_LEASE = "leader"
+
+# singleton() у не-лидера: опубликованное не менялось с прошлого чтения
+UNCHANGED = object()
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing с виртуальными узлами: при смене состава воркеров
+    переезжает только ~1/N монет.
+    """
+
+    def __init__(self, members: List[str], vnodes: int = COORD_VNODES):
+        self.members = sorted(members)
+        points = sorted(
+            (_hash(f"{m}#{i}"), m)
+            for m in self.members
+            for i in range(vnodes)
+        )
+        self._keys = [h for h, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[i]
+
+
+# ---------- worker slot ----------
+_SLOT_LOCK = threading.Lock()
+_SLOT: Optional[str] = None
+_SLOT_FH = None
+
+
+def worker_slot() -> str:
+    """
+    Первый свободный slot-N (flock держим до конца процесса).
+    Без COORD_ENABLED — всегда "" (старые пути spool).
+    """
+    global _SLOT, _SLOT_FH
+    if not COORD_ENABLED:
+        return ""
+
+    with _SLOT_LOCK:
+        if _SLOT is not None:
+            return _SLOT
+
+        slots_dir = os.path.join(STATE_DIR, "slots")
+        os.makedirs(slots_dir, exist_ok=True)
+        for i in range(COORD_MAX_SLOTS):
+            fh = open(os.path.join(slots_dir, f"slot-{i}.lock"), "a")
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                continue
+            _SLOT, _SLOT_FH = f"slot-{i}", fh
+            return _SLOT
+
+        raise RuntimeError(f"no free worker slot in {slots_dir} (COORD_MAX_SLOTS={COORD_MAX_SLOTS})")
+
+
+class Coordinator:
+    def __init__(self, enabled: bool = COORD_ENABLED, path: str = COORD_DB):
+        self.enabled = enabled
+        self.path = path
+        self.worker_id = f"{socket.gethostname()}/{worker_slot()}" if enabled else "single"
+
+        self.leader = not enabled
+        self.ring = HashRing([self.worker_id])
+        self.heartbeats = 0
+        self.errors = 0
+
+        # смена ring из run(): сначала on_rebalance (подтянуть общий state
+        # для переехавших к нам монет), потом новый ring
+        self.on_rebalance: Optional[Callable[[], Awaitable[None]]] = None
+        self._pending_ring: Optional[HashRing] = None
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        # singleton name -> sha1 последнего опубликованного (лидер) /
+        # версия последнего прочитанного blob'а (остальные)
+        self._published_hash: Dict[str, str] = {}
+        self._seen_version: Dict[str, int] = {}
+
+    # ---------- sqlite ----------
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS members (worker TEXT PRIMARY KEY, seen REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS blobs "
+                "(name TEXT PRIMARY KEY, version INTEGER, payload TEXT, updated REAL)"
+            )
+            # адресные сообщения воркеру (webhook по чужому шарду);
+            # key — ключ ring (cmc_id), по нему строка переадресуется, если адресат умер
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS inbox "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, worker TEXT, kind TEXT, payload TEXT, created REAL, key TEXT)"
+            )
+            try:
+                db.execute("ALTER TABLE inbox ADD COLUMN key TEXT")
+            except sqlite3.OperationalError:
+                pass
+            # общий dedupe (webhook'и, принятые разными воркерами)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS dedupe "
+                "(kind TEXT, key TEXT, ts REAL, PRIMARY KEY (kind, key))"
+            )
+            # общий бюджет отправок (Telegram): отметки за последние 60с + блок по 429
+            db.execute("CREATE TABLE IF NOT EXISTS rate_slots (name TEXT, ts REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS rate_blocks (name TEXT PRIMARY KEY, until REAL)")
+            self._db = db
+        return self._db
+
+    # ---------- membership / leadership ----------
+    def heartbeat(self) -> None:
+        """
+        Отметка «жив» + продление / захват leader lease + пересборка ring.
+        Лидер переадресует inbox умерших воркеров новым владельцам.
+        Синхронно (SQLite) — из потока.
+        """
+        if not self.enabled:
+            return
+
+        now = time.time()
+        with self._db_lock:
+            db = self._conn()
+            db.execute(
+                "INSERT INTO members (worker, seen) VALUES (?, ?) "
+                "ON CONFLICT(worker) DO UPDATE SET seen = excluded.seen",
+                (self.worker_id, now),
+            )
+            db.execute("DELETE FROM members WHERE seen < ?", (now - COORD_LEASE_SEC,))
+
+            # захват, только если lease свободен / истёк / уже наш
+            db.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.owner = excluded.owner OR leases.expires < ?",
+                (LEADER_LEASE, self.worker_id, now + COORD_LEASE_SEC, now),
+            )
+            owner = db.execute("SELECT owner FROM leases WHERE name = ?", (LEADER_LEASE,)).fetchone()
+            members = [r[0] for r in db.execute("SELECT worker FROM members")]
+
+            was_leader = self.leader
+            self.leader = bool(owner) and owner[0] == self.worker_id
+            ring = self.ring if sorted(members) == self.ring.members else HashRing(members)
+            if self.leader:
+                self._reroute_inbox(db, ring, now)
+
+        if self.leader != was_leader:
+            print(f"COORD {self.worker_id}: leader={self.leader}", flush=True)
+
+        if ring is not self.ring:
+            if self.on_rebalance is None:
+                self._set_ring(ring)
+            else:
+                self._pending_ring = ring
+
+        self.heartbeats += 1
+
+    def _set_ring(self, ring: HashRing) -> None:
+        self.ring = ring
+        self._pending_ring = None
+        print(f"COORD {self.worker_id}: ring {self.ring.members}", flush=True)
+
+    def _reroute_inbox(self, db: sqlite3.Connection, ring: HashRing, now: float) -> None:
+        db.execute("DELETE FROM inbox WHERE created < ?", (now - COORD_INBOX_TTL_SEC,))
+        placeholders = ",".join("?" * len(ring.members))
+        rows = db.execute(
+            f"SELECT id, key FROM inbox WHERE worker NOT IN ({placeholders})",
+            ring.members,
+        ).fetchall()
+        for row_id, key in rows:
+            owner = ring.owner(key) if key is not None else None
+            if owner is None:
+                db.execute("DELETE FROM inbox WHERE id = ?", (row_id,))
+            else:
+                db.execute("UPDATE inbox SET worker = ? WHERE id = ?", (owner, row_id))
+
+    def release(self) -> None:
+        if not self.enabled:
+            return
+        with self._db_lock:
+            db = self._conn()
+            db.execute("DELETE FROM members WHERE worker = ?", (self.worker_id,))
+            db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (LEADER_LEASE, self.worker_id))
+        self.leader = False
+
+    def owns(self, cid: int) -> bool:
+        if not self.enabled:
+            return True
+        return self.ring.owner(str(cid)) == self.worker_id
+
+    def owner_of(self, cid: int) -> Optional[str]:
+        if not self.enabled:
+            return self.worker_id
+        return self.ring.owner(str(cid))
+
+    # ---------- singleton jobs ----------
+    def publish(self, name: str, value: Any) -> bool:
+        """
+        False — содержимое то же, что в прошлый раз: версию не поднимаем,
+        чтобы остальные воркеры не пересканировали впустую.
+        """
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        if self._published_hash.get(name) == digest:
+            return False
+
+        with self._db_lock:
+            self._conn().execute(
+                "INSERT INTO blobs (name, version, payload, updated) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET version = blobs.version + 1, "
+                "payload = excluded.payload, updated = excluded.updated",
+                (name, payload, time.time()),
+            )
+        self._published_hash[name] = digest
+        return True
+
+    def published(self, name: str) -> Any:
+        """
+        Последнее опубликованное; UNCHANGED — версия та же, что при прошлом
+        чтении (payload не читаем и не разбираем).
+        """
+        with self._db_lock:
+            db = self._conn()
+            row = db.execute("SELECT version FROM blobs WHERE name = ?", (name,)).fetchone()
+            if not row:
+                return None
+            if self._seen_version.get(name) == row[0]:
+                return UNCHANGED
+            row = db.execute("SELECT version, payload FROM blobs WHERE name = ?", (name,)).fetchone()
+        self._seen_version[name] = row[0]
+        return json.loads(row[1])
+
+    def singleton(
+        self,
+        name: str,
+        fetch: Callable[[], Any],
+        encode: Callable[[Any], Any] = lambda v: v,
+        decode: Callable[[Any], Any] = lambda v: v,
+    ) -> Callable[[], Any]:
+        """
+        fetch для refresh-цикла: лидер ходит в API и публикует результат,
+        остальные берут последний опубликованный (None — пока нечего,
+        UNCHANGED — лидер с прошлого раза ничего нового не публиковал).
+        """
+        if not self.enabled:
+            return fetch
+
+        def run() -> Any:
+            if self.leader:
+                value = fetch()
+                if value is not None:
+                    self.publish(name, encode(value))
+                return value
+            raw = self.published(name)
+            return raw if raw is None or raw is UNCHANGED else decode(raw)
+
+        return run
+
+    # ---------- worker inbox ----------
+    def forward(self, worker: str, kind: str, payload: Any, key: Optional[str] = None) -> None:
+        """
+        key — ключ ring (str(cid)): если worker умрёт, не забрав строку,
+        лидер переадресует её новому владельцу key.
+        """
+        with self._db_lock:
+            self._conn().execute(
+                "INSERT INTO inbox (worker, kind, payload, created, key) VALUES (?, ?, ?, ?, ?)",
+                (worker, kind, json.dumps(payload, ensure_ascii=False), time.time(), key),
+            )
+
+    def take_forwarded(self, kind: str) -> List[Any]:
+        """
+        Всё, что переслали этому воркеру (с удалением). Синхронно — из потока.
+        """
+        with self._db_lock:
+            db = self._conn()
+            rows = db.execute(
+                "SELECT id, payload FROM inbox WHERE worker = ? AND kind = ? ORDER BY id",
+                (self.worker_id, kind),
+            ).fetchall()
+            if rows:
+                db.execute(
+                    "DELETE FROM inbox WHERE worker = ? AND kind = ? AND id <= ?",
+                    (self.worker_id, kind, rows[-1][0]),
+                )
+        return [json.loads(p) for _, p in rows]
+
+    # ---------- shared dedupe ----------
+    def claim_once(self, kind: str, key: str, window: float) -> bool:
+        """
+        Dedupe на все воркеры: True — key первый в окне window сек (наш),
+        False — его уже взял кто-то (или мы сами). Синхронно — из потока.
+        """
+        if not self.enabled:
+            return True
+
+        now = time.time()
+        with self._db_lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM dedupe WHERE kind = ? AND ts < ?", (kind, now - window))
+                row = db.execute("SELECT 1 FROM dedupe WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+                if row is None:
+                    db.execute("INSERT INTO dedupe (kind, key, ts) VALUES (?, ?, ?)", (kind, key, now))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return row is None
+
+    # ---------- shared send budget ----------
+    def take_rate_slot(self, name: str, min_interval: float, per_min: int) -> float:
+        """
+        Общий для всех воркеров лимит: 0 — слот взят, иначе сколько ждать (сек).
+        Синхронно (SQLite, BEGIN IMMEDIATE) — из потока.
+        """
+        now = time.time()
+        with self._db_lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM rate_slots WHERE name = ? AND ts < ?", (name, now - 60.0))
+                n, first, last = db.execute(
+                    "SELECT COUNT(*), MIN(ts), MAX(ts) FROM rate_slots WHERE name = ?", (name,)
+                ).fetchone()
+                until = db.execute("SELECT until FROM rate_blocks WHERE name = ?", (name,)).fetchone()
+
+                wait = max(0.0, until[0] - now) if until else 0.0
+                if last is not None:
+                    wait = max(wait, last + min_interval - now)
+                if per_min and n >= per_min:
+                    wait = max(wait, first + 60.0 - now)
+
+                if wait <= 0:
+                    db.execute("INSERT INTO rate_slots (name, ts) VALUES (?, ?)", (name, now))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return max(0.0, wait)
+
+    def block_rate(self, name: str, sec: float) -> None:
+        with self._db_lock:
+            self._conn().execute(
+                "INSERT INTO rate_blocks (name, until) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET until = MAX(rate_blocks.until, excluded.until)",
+                (name, time.time() + sec),
+            )
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.heartbeat)
+                if self._pending_ring is not None:
+                    # монеты, переехавшие к нам, не оцениваем по устаревшему state:
+                    # ошибка on_rebalance — ring не меняем, повтор на следующем heartbeat
+                    if self.on_rebalance is not None:
+                        await self.on_rebalance()
+                    self._set_ring(self._pending_ring)
+            except Exception as e:
+                self.errors += 1
+                print("⚠️ COORD HEARTBEAT ERROR:", e, flush=True)
+            await asyncio.sleep(COORD_HEARTBEAT_SEC)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "worker": self.worker_id,
+            "leader": self.leader,
+            "members": list(self.ring.members),
+            "heartbeats": self.heartbeats,
+            "errors": self.errors,
+        }
@@ -13,10 +13,10 @@ def crowd_engine_ok(candles: List[Dict[str, Any]]) -> bool:
         return False
 
     try:
-        volumes = [float(c[5]) for c in candles]
-        highs = [float(c[2]) for c in candles]
-        lows = [float(c[3]) for c in candles]
-        closes = [float(c[4]) for c in candles]
+        volumes = [float(c["volume"]) for c in candles]
+        highs = [float(c["high"]) for c in candles]
+        lows = [float(c["low"]) for c in candles]
+        closes = [float(c["close"]) for c in candles]
     except Exception:
         return False
 
@@ -45,8 +45,8 @@ def crowd_wave_v2(candles: List[Dict[str, Any]]) -> bool:
         return False
 
     try:
-        volumes = [float(c[5]) for c in candles]
-        closes = [float(c[4]) for c in candles]
+        volumes = [float(c["volume"]) for c in candles]
+        closes = [float(c["close"]) for c in candles]
     except Exception:
         return False
 
@@ -69,7 +69,7 @@ def second_wave_detect(candles: List[Dict[str, Any]]) -> bool:
         return False
 
     try:
-        volumes = [float(c[5]) for c in candles]
+        volumes = [float(c["volume"]) for c in candles]
     except Exception:
         return False
 
@@ -88,7 +88,7 @@ def crowd_pressure_build(candles: List[Dict[str, Any]]) -> bool:
         return False
 
     try:
-        volumes = [float(c[5]) for c in candles]
+        volumes = [float(c["volume"]) for c in candles]
     except Exception:
         return False
 
@@ -105,8 +105,8 @@ def early_momentum_shift(candles: List[Dict[str, Any]]) -> bool:
         return False
 
     try:
-        highs = [float(c[2]) for c in candles]
-        volumes = [float(c[5]) for c in candles]
+        highs = [float(c["high"]) for c in candles]
+        volumes = [float(c["volume"]) for c in candles]
     except Exception:
         return False
 
@@ -123,8 +123,8 @@ def liquidity_compression(candles: List[Dict[str, Any]]) -> bool:
         return False
 
     try:
-        highs = [float(c[2]) for c in candles]
-        lows = [float(c[3]) for c in candles]
+        highs = [float(c["high"]) for c in candles]
+        lows = [float(c["low"]) for c in candles]
     except Exception:
         return False
 
@@ -149,10 +149,10 @@ def institutional_stack_detect(candles: List[Dict[str, Any]]) -> bool:
         return False
 
     try:
-        volumes = [float(c[5]) for c in candles]
-        highs = [float(c[2]) for c in candles]
-        lows = [float(c[3]) for c in candles]
-        closes = [float(c[4]) for c in candles]
+        volumes = [float(c["volume"]) for c in candles]
+        highs = [float(c["high"]) for c in candles]
+        lows = [float(c["low"]) for c in candles]
+        closes = [float(c["close"]) for c in candles]
     except Exception:
         return False
 
@@ -186,7 +186,7 @@ def smart_silence_filter(candles: List[Dict[str, Any]]) -> bool:
         return False
 
     try:
-        volumes = [float(c[5]) for c in candles]
+        volumes = [float(c["volume"]) for c in candles]
     except Exception:
         return False
 
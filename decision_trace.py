@@ -0,0 +1,159 @@
+# decision_trace.py
+import asyncio
+import gzip
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from coordination import worker_slot
+from state import STATE_DIR
+
+# =========================
+# Per-coin decision trace
+# =========================
+# TRACE_ENABLED=1 — по записи на монету на проход:
+#   "discover" — гейты discovery (bad word / age / volume / clean / CEX) и исход;
+#   "eval"     — гейты сигнальных стадий (anti_scam, liquidity_*, FIRST MOVE /
+#                CONFIRM reason — SCORE, WAIT, cooldown'ы), сигналы, тайминги стадий.
+# emit() только кладёт в очередь; запись — батчами из отдельной task в
+# gzip JSONL (TRACE_DIR/<slot>/trace-*.jsonl.gz) с ротацией по размеру / времени.
+# Полная очередь — запись теряется (dropped), скан не ждёт.
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(STATE_DIR, "trace"))
+TRACE_QUEUE_MAX = int(os.getenv("TRACE_QUEUE_MAX", "20000"))
+TRACE_BATCH = int(os.getenv("TRACE_BATCH", "500"))
+TRACE_ROTATE_BYTES = int(os.getenv("TRACE_ROTATE_BYTES", str(32 * 1024 * 1024)))
+TRACE_ROTATE_SEC = float(os.getenv("TRACE_ROTATE_SEC", "3600"))
+TRACE_KEEP_FILES = int(os.getenv("TRACE_KEEP_FILES", "48"))
+TRACE_COMPRESSLEVEL = int(os.getenv("TRACE_COMPRESSLEVEL", "6"))
+
+
+def new_record(kind: str, cid: int, symbol: str) -> Dict[str, Any]:
+    return {
+        "k": kind,
+        "ts": round(time.time(), 3),
+        "cid": cid,
+        "sym": symbol,
+        "gates": {},
+        "ms": {},
+    }
+
+
+@contextmanager
+def timed(rec: Dict[str, Any], stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = rec["ms"]
+        ms[stage] = round(ms.get(stage, 0.0) + (time.perf_counter() - t0) * 1000.0, 2)
+
+
+class TraceWriter:
+    def __init__(self, enabled: bool = TRACE_ENABLED, root: str = TRACE_DIR):
+        self.enabled = enabled
+        self.root = root
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=TRACE_QUEUE_MAX)
+
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+        self._fh = None
+        self._path: Optional[str] = None
+        self._opened_at = 0.0
+        self._bytes = 0
+
+    def emit(self, rec: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.queue.put_nowait(rec)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    # ---------- writer ----------
+    async def run(self) -> None:
+        if not self.enabled:
+            return
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < TRACE_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            await self._write_batch(batch)
+
+    async def drain(self) -> None:
+        """
+        Shutdown: остаток очереди на диск и закрыть файл (gzip trailer).
+        """
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            await self._write_batch(batch)
+        await asyncio.to_thread(self.close)
+
+    async def _write_batch(self, batch) -> None:
+        data = "".join(
+            json.dumps(r, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+            for r in batch
+        ).encode("utf-8")
+        try:
+            await asyncio.to_thread(self._write, data)
+            self.written += len(batch)
+        except Exception as e:
+            self.errors += 1
+            self.dropped += len(batch)
+            print("⚠️ TRACE WRITE ERROR:", repr(e), flush=True)
+            await asyncio.to_thread(self.close)
+
+    def _write(self, data: bytes) -> None:
+        if (
+            self._fh is None
+            or self._bytes >= TRACE_ROTATE_BYTES
+            or time.time() - self._opened_at >= TRACE_ROTATE_SEC
+        ):
+            self._rotate()
+        self._fh.write(data)
+        self._bytes += len(data)
+
+    def _rotate(self) -> None:
+        self.close()
+        # при нескольких воркерах у каждого слота свой каталог (как spool)
+        d = os.path.join(self.root, worker_slot())
+        os.makedirs(d, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        self._path = os.path.join(d, f"trace-{stamp}.jsonl.gz")
+        # "ab": повтор имени в ту же секунду — ещё один gzip member, файл валиден
+        self._fh = gzip.open(self._path, "ab", compresslevel=TRACE_COMPRESSLEVEL)
+        self._opened_at = time.time()
+        self._bytes = 0
+        self._prune(d)
+
+    def _prune(self, d: str) -> None:
+        files = sorted(f for f in os.listdir(d) if f.startswith("trace-") and f.endswith(".jsonl.gz"))
+        for f in files[:-TRACE_KEEP_FILES] if TRACE_KEEP_FILES > 0 else []:
+            try:
+                os.remove(os.path.join(d, f))
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "depth": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "file": self._path,
+        }
+
+
+TRACE = TraceWriter()
@@ -0,0 +1,165 @@
+# depth.py
+import os
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+
+import http_pool
+
+# =========================
+# Order-book depth / slippage
+# =========================
+# Стакан (DEPTH_LIMIT уровней) тянем только для монет с готовым
+# FIRST MOVE / CONFIRM — кэш и бюджет запросов в snapshots.DepthStore.
+# Проскальзывание — средняя цена исполнения рыночного ордера на $size
+# против mid: один проход накопленных сумм по уровням + bisect на размер.
+BINANCE_BASE = os.getenv("BINANCE_BASE", "https://api.binance.com")
+BYBIT_BASE = os.getenv("BYBIT_BASE", "https://api.bybit.com")
+
+DEPTH_LIMIT = int(os.getenv("DEPTH_LIMIT", "50"))
+DEPTH_ORDER_SIZES_USD = sorted(
+    float(x) for x in os.getenv("DEPTH_ORDER_SIZES_USD", "1000,5000,20000").split(",") if x.strip()
+)
+# veto (при LIQUIDITY_VETO=1): покупка на DEPTH_VETO_USD дороже mid больше чем на N%
+DEPTH_VETO_USD = float(os.getenv("DEPTH_VETO_USD", "5000"))
+DEPTH_MAX_SLIPPAGE_PCT = float(os.getenv("DEPTH_MAX_SLIPPAGE_PCT", "1.0"))
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+# (prices, qtys) — bids по убыванию цены, asks по возрастанию
+Side = Tuple[List[float], List[float]]
+
+
+def _sym_usdt(symbol: str) -> str:
+    s = (symbol or "").upper().strip()
+    return s if s.endswith("USDT") else s + "USDT"
+
+
+def _side(rows) -> Side:
+    prices: List[float] = []
+    qtys: List[float] = []
+    for row in rows or []:
+        try:
+            p, q = float(row[0]), float(row[1])
+        except (TypeError, ValueError, IndexError):
+            continue
+        if p > 0 and q > 0:
+            prices.append(p)
+            qtys.append(q)
+    return prices, qtys
+
+
+def fetch_depth_binance(symbol: str) -> Dict[str, Side]:
+    r = http_pool.get(
+        f"{BINANCE_BASE}/api/v3/depth",
+        params={"symbol": _sym_usdt(symbol), "limit": DEPTH_LIMIT},
+        timeout=HTTP_TIMEOUT,
+    )
+    r.raise_for_status()
+    data = r.json() or {}
+    return {"bids": _side(data.get("bids")), "asks": _side(data.get("asks"))}
+
+
+def _fetch_depth_bybit(category: str, symbol: str) -> Optional[Dict[str, Side]]:
+    r = http_pool.get(
+        f"{BYBIT_BASE}/v5/market/orderbook",
+        params={"category": category, "symbol": _sym_usdt(symbol), "limit": DEPTH_LIMIT},
+        timeout=HTTP_TIMEOUT,
+    )
+    r.raise_for_status()
+    data = r.json() or {}
+    if str(data.get("retCode")) != "0":
+        return None
+    result = data.get("result") or {}
+    book = {"bids": _side(result.get("b")), "asks": _side(result.get("a"))}
+    return book if book["bids"][0] and book["asks"][0] else None
+
+
+def fetch_depth_bybit(symbol: str) -> Dict[str, Side]:
+    """
+    spot, иначе linear — как свечи Bybit.
+    """
+    book = _fetch_depth_bybit("spot", symbol) or _fetch_depth_bybit("linear", symbol)
+    return book or {"bids": ([], []), "asks": ([], [])}
+
+
+# ================= SLIPPAGE =================
+def _walk(side: Side, sizes: List[float], mid: float) -> Dict[float, Optional[float]]:
+    """
+    size USD -> % отклонения средней цены исполнения от mid
+    (None — глубины стакана не хватает).
+    """
+    prices, qtys = side
+    cum_usd = list(accumulate(p * q for p, q in zip(prices, qtys)))
+    cum_qty = list(accumulate(qtys))
+
+    out: Dict[float, Optional[float]] = {}
+    for size in sizes:
+        i = bisect_left(cum_usd, size)
+        if i >= len(cum_usd):
+            out[size] = None
+            continue
+        prev_usd = cum_usd[i - 1] if i else 0.0
+        prev_qty = cum_qty[i - 1] if i else 0.0
+        qty = prev_qty + (size - prev_usd) / prices[i]
+        out[size] = abs(size / qty / mid - 1.0) * 100.0
+    return out
+
+
+def slippage(book: Dict[str, Side], sizes: List[float] = DEPTH_ORDER_SIZES_USD) -> Optional[Dict[str, Any]]:
+    bids, asks = book.get("bids") or ([], []), book.get("asks") or ([], [])
+    if not bids[0] or not asks[0]:
+        return None
+
+    mid = (bids[0][0] + asks[0][0]) / 2.0
+    sizes = sorted(set(sizes) | {DEPTH_VETO_USD})
+    return {
+        "mid": mid,
+        "buy": _walk(asks, sizes, mid),
+        "sell": _walk(bids, sizes, mid),
+        "ask_usd": sum(p * q for p, q in zip(*asks)),
+        "bid_usd": sum(p * q for p, q in zip(*bids)),
+    }
+
+
+def depth_ok(slip: Optional[Dict[str, Any]]) -> Tuple[bool, str]:
+    if slip is None:
+        return False, "Нет данных по стакану"
+    pct = slip["buy"].get(DEPTH_VETO_USD)
+    if pct is None:
+        return False, f"Стакан тоньше ${DEPTH_VETO_USD:,.0f} (asks ${slip['ask_usd']:,.0f})"
+    if pct > DEPTH_MAX_SLIPPAGE_PCT:
+        return False, f"Проскальзывание ${DEPTH_VETO_USD:,.0f}: {pct:.2f}%"
+    return True, "OK"
+
+
+def format_slippage(slip: Optional[Dict[str, Any]]) -> str:
+    """
+    Строка для текста алерта.
+    """
+    if slip is None:
+        return "💧 <b>Стакан</b>: нет данных"
+
+    def usd(x: float) -> str:
+        return f"${x / 1000:g}k" if x >= 1000 else f"${x:g}"
+
+    parts = [
+        f"{usd(size)} {'n/a' if pct is None else f'{pct:.2f}%'}"
+        for size, pct in slip["buy"].items()
+        if size in DEPTH_ORDER_SIZES_USD
+    ]
+    return "💧 <b>Проскальзывание (buy)</b>: " + " · ".join(parts)
+
+
+def slippage_summary(slip: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Компактно для trace: {"buy": {"1000": 0.12, ...}, "ask_usd": ...}.
+    """
+    if slip is None:
+        return None
+    return {
+        "buy": {f"{k:g}": None if v is None else round(v, 3) for k, v in slip["buy"].items()},
+        "sell": {f"{k:g}": None if v is None else round(v, 3) for k, v in slip["sell"].items()},
+        "ask_usd": round(slip["ask_usd"]),
+        "bid_usd": round(slip["bid_usd"]),
+    }
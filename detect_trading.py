@@ -1,4 +1,6 @@
-import requests
+from typing import Any, Callable, Dict, Optional, Set
+
+import http_pool
 
 
 HEADERS = {
@@ -8,7 +10,7 @@ HEADERS = {
 
 def _safe_get(url, timeout=10):
     try:
-        r = requests.get(url, headers=HEADERS, timeout=timeout)
+        r = http_pool.get(url, headers=HEADERS, timeout=timeout)
         if r.status_code == 200:
             return r.json()
     except Exception:
@@ -16,100 +18,128 @@ def _safe_get(url, timeout=10):
     return None
 
 
+# Каждый список инструментов разбирается в множество торгуемых пар
+# в формате биржи — тогда проверка монеты это просто `target in set`.
+
 # ================= BINANCE =================
-def check_binance(symbol: str) -> bool:
-    data = _safe_get("https://api.binance.com/api/v3/exchangeInfo")
+def _parse_binance(data: Any) -> Set[str]:
     if not data or "symbols" not in data:
-        return False
-
-    target = f"{symbol.upper()}USDT"
-    for item in data["symbols"]:
-        if item.get("symbol") == target and item.get("status") == "TRADING":
-            return True
-    return False
-
-
-# ================= BYBIT SPOT =================
-def check_bybit(symbol: str) -> bool:
-    data = _safe_get("https://api.bybit.com/v5/market/instruments-info?category=spot")
-    try:
-        items = data["result"]["list"]
-    except Exception:
-        return False
+        return set()
+    return {item.get("symbol") for item in data["symbols"] if item.get("status") == "TRADING"}
 
-    target = f"{symbol.upper()}USDT"
-    for item in items:
-        if item.get("symbol") == target and item.get("status") == "Trading":
-            return True
-    return False
 
-
-# ================= BYBIT LINEAR =================
-def check_bybit_linear(symbol: str) -> bool:
-    data = _safe_get("https://api.bybit.com/v5/market/instruments-info?category=linear")
+# ================= BYBIT SPOT / LINEAR =================
+def _parse_bybit(data: Any) -> Set[str]:
     try:
         items = data["result"]["list"]
     except Exception:
-        return False
-
-    target = f"{symbol.upper()}USDT"
-    for item in items:
-        if item.get("symbol") == target and item.get("status") == "Trading":
-            return True
-    return False
+        return set()
+    return {item.get("symbol") for item in items if item.get("status") == "Trading"}
 
 
 # ================= MEXC =================
-def check_mexc(symbol: str) -> bool:
-    data = _safe_get("https://api.mexc.com/api/v3/exchangeInfo")
+def _parse_mexc(data: Any) -> Set[str]:
     if not data or "symbols" not in data:
-        return False
-
-    target = f"{symbol.upper()}USDT"
-    for item in data["symbols"]:
-        if item.get("symbol") == target and item.get("status") == "1":
-            return True
-    return False
+        return set()
+    return {item.get("symbol") for item in data["symbols"] if item.get("status") == "1"}
 
 
 # ================= GATE =================
-def check_gate(symbol: str) -> bool:
-    data = _safe_get("https://api.gateio.ws/api/v4/spot/currency_pairs")
+def _parse_gate(data: Any) -> Set[str]:
     if not isinstance(data, list):
-        return False
-
-    target = f"{symbol.upper()}_USDT"
-    for item in data:
-        if item.get("id") == target and item.get("trade_status") == "tradable":
-            return True
-    return False
+        return set()
+    return {item.get("id") for item in data if item.get("trade_status") == "tradable"}
 
 
 # ================= BITGET =================
-def check_bitget(symbol: str) -> bool:
-    data = _safe_get("https://api.bitget.com/api/v2/spot/public/symbols")
+def _parse_bitget(data: Any) -> Set[str]:
     try:
         items = data["data"]
     except Exception:
-        return False
-
-    target = f"{symbol.upper()}USDT"
-    for item in items:
-        if item.get("symbol") == target and item.get("status") == "online":
-            return True
-    return False
+        return set()
+    return {item.get("symbol") for item in items if item.get("status") == "online"}
 
 
 # ================= KUCOIN =================
-def check_kucoin(symbol: str) -> bool:
-    data = _safe_get("https://api.kucoin.com/api/v2/symbols")
+def _parse_kucoin(data: Any) -> Set[str]:
     try:
         items = data["data"]
     except Exception:
-        return False
+        return set()
+    return {item.get("symbol") for item in items if item.get("enableTrading") is True}
+
+
+# name -> (url, parser, symbol -> пара в формате биржи)
+EXCHANGES: Dict[str, tuple] = {
+    "binance": (
+        "https://api.binance.com/api/v3/exchangeInfo",
+        _parse_binance,
+        lambda s: f"{s}USDT",
+    ),
+    "bybit_spot": (
+        "https://api.bybit.com/v5/market/instruments-info?category=spot",
+        _parse_bybit,
+        lambda s: f"{s}USDT",
+    ),
+    "bybit_linear": (
+        "https://api.bybit.com/v5/market/instruments-info?category=linear",
+        _parse_bybit,
+        lambda s: f"{s}USDT",
+    ),
+    "mexc": (
+        "https://api.mexc.com/api/v3/exchangeInfo",
+        _parse_mexc,
+        lambda s: f"{s}USDT",
+    ),
+    "gate": (
+        "https://api.gateio.ws/api/v4/spot/currency_pairs",
+        _parse_gate,
+        lambda s: f"{s}_USDT",
+    ),
+    "bitget": (
+        "https://api.bitget.com/api/v2/spot/public/symbols",
+        _parse_bitget,
+        lambda s: f"{s}USDT",
+    ),
+    "kucoin": (
+        "https://api.kucoin.com/api/v2/symbols",
+        _parse_kucoin,
+        lambda s: f"{s}-USDT",
+    ),
+}
+
 
-    target = f"{symbol.upper()}-USDT"
-    for item in items:
-        if item.get("symbol") == target and item.get("enableTrading") is True:
-            return True
-    return False
+def fetch_instruments(exchange: str) -> Optional[Set[str]]:
+    """
+    Полный список торгуемых пар биржи (None — не смогли получить).
+    """
+    url, parse, _ = EXCHANGES[exchange]
+    data = _safe_get(url)
+    if data is None:
+        return None
+    # пустой разбор — битый ответ, а не биржа без единой пары
+    return parse(data) or None
+
+
+def is_listed(exchange: str, symbol: str, instruments: Optional[Set[str]]) -> Optional[bool]:
+    """
+    True / False по списку биржи; None — списка нет (не загрузился),
+    и «не торгуется» из этого не следует.
+    """
+    if instruments is None:
+        return None
+    _, _, target = EXCHANGES[exchange]
+    return target(symbol.upper()) in instruments
+
+
+def trading_status(symbol: str, get_instruments: Callable[[str], Optional[Set[str]]]) -> Dict[str, bool]:
+    """
+    {"binance": bool, ..., "any": bool, "unknown": bool} по уже загруженным
+    спискам инструментов. unknown — монета не найдена, но списки части бирж
+    ещё не получены: отсутствие CEX-торговли не доказано.
+    """
+    listed = {ex: is_listed(ex, symbol, get_instruments(ex)) for ex in EXCHANGES}
+    out = {ex: bool(v) for ex, v in listed.items()}
+    out["any"] = any(out.values())
+    out["unknown"] = not out["any"] and any(v is None for v in listed.values())
+    return out
@@ -0,0 +1,251 @@
+# detectors.py
+import asyncio
+import multiprocessing
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from first_move import first_move_eval
+from funding_flow import funding_flow_ok
+from confirm_light import confirm_light_eval
+from crowd_engine import crowd_engine_signal, crowd_engine_explain
+from liquidity_growth import liquidity_growth_ok
+from liquidity_memory import liquidity_memory_ok
+from metrics import DETECTOR_SECONDS
+from profiler import PROFILER
+
+# =========================
+# Detector stack (inline / process pool)
+# =========================
+# Чистые CPU-детекторы по свечам монеты: CROWD ENGINE, FIRST MOVE, CONFIRM LIGHT.
+# DETECT_EXECUTOR=process — считаются в пуле процессов (свечи уходят
+# компактными массивами, обратно — маленькая запись с результатом), чтобы
+# пачка монет после закрытия бара не держала event loop (Telegram, webhook).
+# Мелкие наборы свечей (< DETECT_OFFLOAD_MIN_CANDLES) дешевле посчитать на месте.
+DETECT_EXECUTOR = (os.getenv("DETECT_EXECUTOR", "inline") or "inline").strip().lower()
+DETECT_WORKERS = int(os.getenv("DETECT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+DETECT_OFFLOAD_MIN_CANDLES = int(os.getenv("DETECT_OFFLOAD_MIN_CANDLES", "200"))
+
+ANTI_SCAM_MIN_CANDLES = int(os.getenv("ANTI_SCAM_MIN_CANDLES", "25"))
+ANTI_SCAM_MAX_RANGE = float(os.getenv("ANTI_SCAM_MAX_RANGE", "2.5"))
+ANTI_SCAM_VOL_DROP_K = float(os.getenv("ANTI_SCAM_VOL_DROP_K", "0.7"))
+
+
+# ================= SHARP FILTER =================
+def anti_scam_filter(candles):
+    if not candles or len(candles) < ANTI_SCAM_MIN_CANDLES:
+        return False
+
+    try:
+        # свечи загрузчиков — dict'ы (high / low / volume есть у обеих бирж)
+        highs = [float(c["high"]) for c in candles]
+        lows = [float(c["low"]) for c in candles]
+        volumes = [float(c["volume"]) for c in candles]
+    except Exception:
+        return False
+
+    low_min = min(lows)
+    high_max = max(highs)
+
+    if low_min <= 0:
+        return False
+
+    price_range = (high_max - low_min) / max(low_min, 1e-12)
+    if price_range > ANTI_SCAM_MAX_RANGE:
+        return False
+
+    half = len(volumes) // 2
+    v1 = sum(volumes[:half])
+    v2 = sum(volumes[half:])
+
+    if v1 > 0 and v2 < v1 * ANTI_SCAM_VOL_DROP_K:
+        return False
+
+    return True
+
+
+# ================= EVALUATION =================
+def evaluate_stack(
+    symbol: str,
+    candles_5m: List[Dict[str, Any]],
+    candles_15m: List[Dict[str, Any]],
+    first_move: bool = True,
+    funding_flow: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    Все детекторы монеты. Без state / сети — только свечи
+    (+ funding_flow, посчитанный в родителе).
+    Ошибка стадии FIRST MOVE / CONFIRM попадает в "error", следующие
+    стадии не считаются (как раньше: исключение прерывало оценку).
+    """
+    timings: Dict[str, float] = {}
+    out: Dict[str, Any] = {
+        "crowd": False,
+        "crowd_explain": None,
+        "first_move": None,
+        "confirm": None,
+        "error": None,
+        # gate -> bool, для decision trace (не посчитанные — отсутствуют)
+        "gates": {},
+        # detector -> сек (в пуле процессов метрики родителя недоступны —
+        # время едет обратно в записи)
+        "timings": timings,
+    }
+
+    def timed(name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - t0
+
+    try:
+        if candles_5m and timed("crowd_engine", crowd_engine_signal, candles_5m):
+            out["crowd"] = True
+            out["crowd_explain"] = timed("crowd_engine", crowd_engine_explain, candles_5m)
+    except Exception:
+        out["crowd"] = False
+
+    gates = out["gates"]
+
+    def gate(name, fn, *args):
+        ok = gates[name] = bool(timed(name, fn, *args))
+        return ok
+
+    try:
+        if first_move and (
+            candles_5m
+            and gate("anti_scam", anti_scam_filter, candles_5m)
+            and gate("liquidity_growth", liquidity_growth_ok, candles_5m)
+            and gate("liquidity_memory", liquidity_memory_ok, candles_5m)
+        ):
+            out["first_move"] = timed("first_move", first_move_eval, symbol, candles_5m, funding_flow)
+
+        if candles_15m:
+            out["confirm"] = timed("confirm_light", confirm_light_eval, symbol, candles_15m)
+    except Exception as e:
+        out["error"] = f"{type(e).__name__}: {e}"
+
+    return out
+
+
+# ================= COMPACT CANDLES =================
+# (short_keys, ts, open, high, low, close, volume) — 6 массивов double
+# вместо списка dict'ов: в pickle в разы меньше.
+Packed = Tuple[bool, array, array, array, array, array, array]
+
+
+def pack_candles(candles: List[Dict[str, Any]]) -> Packed:
+    short = bool(candles) and "o" in candles[0]
+    cols = tuple(array("d") for _ in range(6))
+    for c in candles:
+        cols[0].append(float(c["ts"]) if "ts" in c else float(c.get("t") or 0) / 1000.0)
+        cols[1].append(float(c.get("open", c.get("o"))))
+        cols[2].append(float(c.get("high", c.get("h"))))
+        cols[3].append(float(c.get("low", c.get("l"))))
+        cols[4].append(float(c.get("close", c.get("c"))))
+        cols[5].append(float(c.get("volume", c.get("v"))))
+    return (short,) + cols
+
+
+def unpack_candles(packed: Packed) -> List[Dict[str, Any]]:
+    """
+    Тот же вид dict'ов, что отдают candles_binance / candles_bybit.
+    """
+    short, ts, o, h, l, c, v = packed
+    out = []
+    for i in range(len(ts)):
+        d = {"open": o[i], "high": h[i], "low": l[i], "close": c[i], "volume": v[i]}
+        if short:
+            d.update({"t": int(round(ts[i] * 1000)), "o": o[i], "h": h[i], "l": l[i], "c": c[i], "v": v[i]})
+        else:
+            d["ts"] = ts[i]
+        out.append(d)
+    return out
+
+
+def _evaluate_packed(
+    symbol: str,
+    p5: Packed,
+    p15: Packed,
+    first_move: bool,
+    funding_flow: Optional[bool],
+) -> Dict[str, Any]:
+    return evaluate_stack(symbol, unpack_candles(p5), unpack_candles(p15), first_move, funding_flow)
+
+
+# ================= EXECUTOR =================
+_POOL: Optional[ProcessPoolExecutor] = None
+
+# счётчики для /status и метрик
+STATS = {"inline": 0, "offloaded": 0, "pool_errors": 0}
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        # spawn: в родителе крутятся потоки (to_thread, Sheets) — fork небезопасен
+        _POOL = ProcessPoolExecutor(
+            max_workers=DETECT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _POOL
+
+
+async def evaluate(
+    symbol: str,
+    candles_5m: List[Dict[str, Any]],
+    candles_15m: List[Dict[str, Any]],
+    first_move: bool = True,
+) -> Dict[str, Any]:
+    result = await _evaluate(symbol, candles_5m, candles_15m, first_move)
+    for name, sec in result.get("timings", {}).items():
+        DETECTOR_SECONDS.observe(sec, detector=name)
+    return result
+
+
+async def _evaluate(
+    symbol: str,
+    candles_5m: List[Dict[str, Any]],
+    candles_15m: List[Dict[str, Any]],
+    first_move: bool,
+) -> Dict[str, Any]:
+    # буферы funding — только в этом процессе: lookup здесь, в пул — bool
+    funding_flow = funding_flow_ok(symbol)
+
+    size = len(candles_5m or []) + len(candles_15m or [])
+    # под профилировщиком — на месте: дочерние процессы ему не видны
+    if DETECT_EXECUTOR != "process" or size < DETECT_OFFLOAD_MIN_CANDLES or PROFILER.active:
+        STATS["inline"] += 1
+        return evaluate_stack(symbol, candles_5m, candles_15m, first_move, funding_flow)
+
+    try:
+        p5 = pack_candles(candles_5m or [])
+        p15 = pack_candles(candles_15m or [])
+    except Exception:
+        # нестандартные свечи — считаем как есть
+        STATS["inline"] += 1
+        return evaluate_stack(symbol, candles_5m, candles_15m, first_move, funding_flow)
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(_pool(), _evaluate_packed, symbol, p5, p15, first_move, funding_flow)
+    except Exception as e:
+        # упал / убит воркер пула — не теряем оценку
+        STATS["pool_errors"] += 1
+        print("⚠️ DETECT POOL ERROR:", repr(e), flush=True)
+        shutdown()
+        STATS["inline"] += 1
+        return evaluate_stack(symbol, candles_5m, candles_15m, first_move, funding_flow)
+
+    STATS["offloaded"] += 1
+    return result
+
+
+def shutdown() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from score_engine import Candle, score_market
 from entry_window import build_entry_plan
@@ -34,7 +34,15 @@ def _to_ohlcv_dict(c: Dict[str, Any]) -> Dict[str, float]:
 # =====================================================
 # FIRST MOVE ENGINE (SHARP + CROWD DETECT)
 # =====================================================
-def first_move_eval(symbol: str, candles_raw: List[Dict[str, Any]]) -> Dict[str, Any]:
+def first_move_eval(
+    symbol: str,
+    candles_raw: List[Dict[str, Any]],
+    funding_flow: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    funding_flow — посчитанный заранее funding_flow_ok(symbol): в пуле
+    процессов буферов funding нет, значение приезжает из родителя.
+    """
 
     if not candles_raw or len(candles_raw) < 6:
         return {"ok": False, "reason": "Недостаточно свечей"}
@@ -80,7 +88,12 @@ def first_move_eval(symbol: str, candles_raw: List[Dict[str, Any]]) -> Dict[str,
     # =====================================================
     # ENTRY WINDOW
     # =====================================================
-    plan = build_entry_plan(ohlcv, tf="5m")
+    # entry_window работает на коротких ключах {"o","h","l","c","v"}
+    plan = build_entry_plan(
+        symbol,
+        [{"o": x["open"], "h": x["high"], "l": x["low"], "c": x["close"], "v": x["volume"]} for x in ohlcv],
+        tf="5m",
+    )
 
     if plan.mode == "WAIT":
         return {"ok": False, "reason": "WAIT — окно входа не готово"}
@@ -91,7 +104,9 @@ def first_move_eval(symbol: str, candles_raw: List[Dict[str, Any]]) -> Dict[str,
     crowd_entered = False
 
     try:
-        if liquidity_memory_ok(symbol) and funding_flow_ok(symbol):
+        if funding_flow is None:
+            funding_flow = funding_flow_ok(symbol)
+        if funding_flow and liquidity_memory_ok(candles_raw):
             crowd_entered = True
     except Exception:
         crowd_entered = False
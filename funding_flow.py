@@ -1,16 +1,195 @@
 # funding_flow.py
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import http_pool
+
+# =========================
+# Funding / OI crowd signal
+# =========================
+# Раз в FUNDING_REFRESH_SEC (цикл в snapshots.DataHub) два bulk-запроса:
+#   Bybit linear /v5/market/tickers — funding + open interest всех перпов;
+#   Binance futures /fapi/v1/premiumIndex — funding всех перпов.
+# На символ — кольцевой буфер (ts, funding, oi_usd); проверки ниже —
+# только чтение буфера, без HTTP.
+BYBIT_BASE = os.getenv("BYBIT_BASE", "https://api.bybit.com")
+BINANCE_FAPI_BASE = os.getenv("BINANCE_FAPI_BASE", "https://fapi.binance.com")
+
+FUNDING_HISTORY = int(os.getenv("FUNDING_HISTORY", "120"))
+# окно сравнения «сейчас vs тогда»
+FUNDING_WINDOW_SEC = float(os.getenv("FUNDING_WINDOW_SEC", "3600"))
+# толпа вошла: OI вырос на N% за окно, funding положительный (лонги платят)
+FUNDING_OI_GROWTH_PCT = float(os.getenv("FUNDING_OI_GROWTH_PCT", "10"))
+FUNDING_MIN_RATE = float(os.getenv("FUNDING_MIN_RATE", "0.0001"))
+# выше — перегрев, толпа уже внутри
+FUNDING_MAX_RATE = float(os.getenv("FUNDING_MAX_RATE", "0.001"))
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+# (ts, funding или None, oi_usd или None)
+Point = Tuple[float, Optional[float], Optional[float]]
+
+
+def _sym_usdt(symbol: str) -> str:
+    s = (symbol or "").upper().strip()
+    return s if s.endswith("USDT") else s + "USDT"
+
+
+def _f(x: Any) -> Optional[float]:
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_bybit_linear() -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    r = http_pool.get(f"{BYBIT_BASE}/v5/market/tickers", params={"category": "linear"}, timeout=HTTP_TIMEOUT)
+    r.raise_for_status()
+    data = r.json() or {}
+    if str(data.get("retCode")) != "0":
+        raise RuntimeError(f"bybit linear tickers: {data.get('retMsg')}")
+
+    out = {}
+    for row in (data.get("result") or {}).get("list") or []:
+        out[row.get("symbol")] = (_f(row.get("fundingRate")), _f(row.get("openInterestValue")))
+    return out
+
+
+def fetch_binance_premium() -> Dict[str, float]:
+    r = http_pool.get(f"{BINANCE_FAPI_BASE}/fapi/v1/premiumIndex", timeout=HTTP_TIMEOUT)
+    r.raise_for_status()
+
+    out = {}
+    for row in r.json() or []:
+        rate = _f(row.get("lastFundingRate"))
+        if rate is not None:
+            out[row.get("symbol")] = rate
+    return out
+
+
+class FundingStore:
+    def __init__(self, history: int = FUNDING_HISTORY):
+        self.history = history
+        # "bybit" / "binance" -> SYMBOLUSDT -> deque[Point]
+        self._series: Dict[str, Dict[str, Deque[Point]]] = {"bybit": {}, "binance": {}}
+        self._lock = threading.Lock()
+
+    def _append(self, exchange: str, rows: Dict[str, Point]) -> None:
+        series = self._series[exchange]
+        with self._lock:
+            for sym, point in rows.items():
+                q = series.get(sym)
+                if q is None:
+                    q = series[sym] = deque(maxlen=self.history)
+                q.append(point)
+            # делистинг — серия уходит вместе с символом
+            for sym in [s for s in series if s not in rows]:
+                del series[sym]
+
+    def refresh(self) -> Optional[Dict[str, int]]:
+        """
+        Оба bulk-запроса; упавшая биржа не мешает второй.
+        Синхронно — из refresh_loop через to_thread. None — обе упали.
+        """
+        now = time.time()
+        out: Dict[str, int] = {}
+        errors = []
+
+        try:
+            bybit = fetch_bybit_linear()
+            self._append("bybit", {s: (now, fr, oi) for s, (fr, oi) in bybit.items()})
+            out["bybit"] = len(bybit)
+        except Exception as e:
+            errors.append(f"bybit: {e}")
+
+        try:
+            binance = fetch_binance_premium()
+            self._append("binance", {s: (now, fr, None) for s, fr in binance.items()})
+            out["binance"] = len(binance)
+        except Exception as e:
+            errors.append(f"binance: {e}")
+
+        if errors:
+            print("⚠️ FUNDING REFRESH:", "; ".join(errors), flush=True)
+        return out or None
+
+    # ---------- lookups ----------
+    def _window(self, exchange: str, symbol: str) -> Optional[Tuple[Point, Point]]:
+        """
+        (точка ~FUNDING_WINDOW_SEC назад или самая старая, последняя).
+        """
+        with self._lock:
+            q = self._series[exchange].get(_sym_usdt(symbol))
+            if not q or len(q) < 2:
+                return None
+            last = q[-1]
+            then = q[0]
+            for p in q:
+                if p[0] > last[0] - FUNDING_WINDOW_SEC:
+                    break
+                then = p
+        return then, last
+
+    def funding(self, symbol: str) -> Optional[float]:
+        """
+        Последний funding: среднее по биржам, где символ есть.
+        """
+        rates = []
+        for ex in ("bybit", "binance"):
+            q = self._series[ex].get(_sym_usdt(symbol))
+            if q and q[-1][1] is not None:
+                rates.append(q[-1][1])
+        return sum(rates) / len(rates) if rates else None
+
+    def funding_rising(self, symbol: str) -> bool:
+        for ex in ("bybit", "binance"):
+            w = self._window(ex, symbol)
+            if w and w[0][1] is not None and w[1][1] is not None and w[1][1] > w[0][1]:
+                return True
+        return False
+
+    def oi_growth_pct(self, symbol: str) -> Optional[float]:
+        w = self._window("bybit", symbol)
+        if not w:
+            return None
+        then, last = w
+        if not then[2] or last[2] is None:
+            return None
+        return (last[2] / then[2] - 1.0) * 100.0
+
+    def explain(self, symbol: str) -> Dict[str, Any]:
+        return {
+            "funding": self.funding(symbol),
+            "funding_rising": self.funding_rising(symbol),
+            "oi_growth_pct": self.oi_growth_pct(symbol),
+        }
+
+    def status(self) -> Dict[str, int]:
+        return {ex: len(series) for ex, series in self._series.items()}
+
+
+FUNDING = FundingStore()
+
+
+def _funding_in_band(symbol: str) -> bool:
+    rate = FUNDING.funding(symbol)
+    return rate is not None and FUNDING_MIN_RATE <= rate <= FUNDING_MAX_RATE
+
 
 def funding_flow_ok(symbol: str) -> bool:
     """
-    Старый слой (если где-то ещё импортируется).
-    Безопасная заглушка, чтобы бот не падал.
+    Старый слой: лонги платят, и funding растёт за окно.
     """
-    return False
+    return _funding_in_band(symbol) and FUNDING.funding_rising(symbol)
 
 
 def funding_crowd_ok(symbol: str) -> bool:
     """
-    PRO слой: сигнал 'толпы'.
-    Пока безопасная заглушка — позже подключим реальные funding/OI.
+    PRO слой: сигнал 'толпы' — OI вырос на FUNDING_OI_GROWTH_PCT+ за окно
+    при положительном (но не перегретом) funding.
     """
-    return False
+    growth = FUNDING.oi_growth_pct(symbol)
+    return growth is not None and growth >= FUNDING_OI_GROWTH_PCT and _funding_in_band(symbol)
@@ -0,0 +1,42 @@
+# http_pool.py
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import http_stats
+
+# =========================
+# Shared HTTP pool
+# =========================
+# Один requests.Session на процесс: keep-alive соединения к CMC / биржам /
+# confirm-entry переиспользуются всеми запросами (scan, webhook, to_thread).
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "16"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+SESSION = requests.Session()
+
+_adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# ответы учитывает response hook, таймауты / обрывы — _request
+http_stats.instrument_session(SESSION)
+
+
+def _request(method, url, **kwargs) -> requests.Response:
+    t0 = time.perf_counter()
+    try:
+        return SESSION.request(method, url, **kwargs)
+    except requests.RequestException as e:
+        http_stats.record_error(url, e, time.perf_counter() - t0)
+        raise
+
+
+def get(url, **kwargs) -> requests.Response:
+    return _request("GET", url, **kwargs)
+
+
+def post(url, **kwargs) -> requests.Response:
+    return _request("POST", url, **kwargs)
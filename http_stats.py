@@ -0,0 +1,229 @@
+# http_stats.py
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from metrics import HTTP_BYTES, HTTP_RATE_LIMIT, HTTP_RESPONSES, HTTP_SECONDS
+
+# =========================
+# Outbound HTTP accounting
+# =========================
+# Каждый исходящий запрос (http_pool: CMC / биржи / klines / bookTicker /
+# confirm-entry; gspread-сессии; httpx-клиент бота) проходит через record():
+# латентность, байты ответа, статус и rate-limit заголовки по host + endpoint.
+# snapshot() — для GET /debug/http, те же данные — в /metrics.
+RATE_LIMIT_HEADERS = (
+    "x-mbx-used-weight-1m",
+    "x-mbx-used-weight",
+    "x-mbx-order-count-1m",
+    "x-sapi-used-ip-weight-1m",
+    "x-bapi-limit",
+    "x-bapi-limit-status",
+    "x-bapi-limit-reset-timestamp",
+    "x-ratelimit-limit",
+    "x-ratelimit-remaining",
+    "x-ratelimit-reset",
+    "retry-after",
+)
+
+# окно для error_rates() (/status, /health)
+HTTP_ERROR_WINDOW_MIN = int(os.getenv("HTTP_ERROR_WINDOW_MIN", "15"))
+
+_LOCK = threading.Lock()
+# (host, endpoint) -> stats
+_STATS: Dict[Tuple[str, str], Dict[str, Any]] = {}
+# service -> [[minute, requests, errors], ...] за последние HTTP_ERROR_WINDOW_MIN минут
+_RECENT: Dict[str, Deque[List[int]]] = {}
+
+
+def service_of(host: str) -> str:
+    """
+    api.binance.com / fapi.binance.com -> binance, api.telegram.org -> telegram.
+    """
+    parts = host.split(".")
+    return parts[-2] if len(parts) >= 2 else host
+
+
+def _count_recent(host: str, error: bool) -> None:
+    minute = int(time.time() // 60)
+    q = _RECENT.setdefault(service_of(host), deque(maxlen=HTTP_ERROR_WINDOW_MIN))
+    if not q or q[-1][0] != minute:
+        q.append([minute, 0, 0])
+    q[-1][1] += 1
+    q[-1][2] += int(error)
+
+
+def _segment(seg: str) -> str:
+    # токен бота и id таблиц / диапазоны в путь метрик не попадают
+    if seg.startswith("bot") and ":" in seg:
+        return "bot*"
+    op = ""
+    if ":" in seg:
+        seg, op = seg.rsplit(":", 1)
+        op = ":" + op
+    if len(seg) >= 20 or "!" in seg or (len(seg) > 12 and any(c.isdigit() for c in seg)):
+        seg = "*"
+    return seg + op
+
+
+def endpoint_of(url: str) -> Tuple[str, str]:
+    u = urlsplit(str(url))
+    path = "/".join(_segment(s) for s in u.path.split("/") if s)
+    return (u.hostname or "?"), "/" + path
+
+
+def _entry(host: str, endpoint: str) -> Dict[str, Any]:
+    st = _STATS.get((host, endpoint))
+    if st is None:
+        st = _STATS[(host, endpoint)] = {
+            "requests": 0,
+            "errors": 0,
+            "status": {},
+            "bytes": 0,
+            "latency_sum": 0.0,
+            "latency_max": 0.0,
+            "rate_limit": {},
+            "last_error": None,
+            "last_at": 0.0,
+        }
+    return st
+
+
+def record(
+    url: str,
+    status: int,
+    latency: float,
+    nbytes: int,
+    headers: Optional[Any] = None,
+) -> None:
+    host, endpoint = endpoint_of(url)
+    limits = {}
+    if headers is not None:
+        for h in RATE_LIMIT_HEADERS:
+            v = headers.get(h)
+            if v is not None:
+                limits[h] = v
+
+    with _LOCK:
+        st = _entry(host, endpoint)
+        st["requests"] += 1
+        st["status"][status] = st["status"].get(status, 0) + 1
+        st["bytes"] += nbytes
+        st["latency_sum"] += latency
+        st["latency_max"] = max(st["latency_max"], latency)
+        st["rate_limit"].update(limits)
+        st["last_at"] = time.time()
+        _count_recent(host, status >= 400)
+
+    HTTP_SECONDS.observe(latency, host=host, endpoint=endpoint)
+    HTTP_RESPONSES.inc(host=host, status=str(status))
+    HTTP_BYTES.inc(nbytes, host=host)
+    for h, v in limits.items():
+        try:
+            HTTP_RATE_LIMIT.set(float(v), host=host, header=h)
+        except (TypeError, ValueError):
+            pass
+
+
+def record_error(url: str, error: BaseException, latency: float) -> None:
+    host, endpoint = endpoint_of(url)
+    kind = type(error).__name__
+
+    with _LOCK:
+        st = _entry(host, endpoint)
+        st["requests"] += 1
+        st["errors"] += 1
+        st["status"][kind] = st["status"].get(kind, 0) + 1
+        st["latency_sum"] += latency
+        st["latency_max"] = max(st["latency_max"], latency)
+        st["last_error"] = f"{kind}: {error}"[:300]
+        st["last_at"] = time.time()
+        _count_recent(host, True)
+
+    HTTP_SECONDS.observe(latency, host=host, endpoint=endpoint)
+    HTTP_RESPONSES.inc(host=host, status=kind)
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """
+    {host: {endpoint: {...}}} — копия для отдачи наружу.
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    with _LOCK:
+        for (host, endpoint), st in _STATS.items():
+            n = st["requests"] or 1
+            out.setdefault(host, {})[endpoint] = {
+                "requests": st["requests"],
+                "errors": st["errors"],
+                "status": {str(k): v for k, v in st["status"].items()},
+                "bytes": st["bytes"],
+                "latency_avg_ms": round(st["latency_sum"] / n * 1000.0, 1),
+                "latency_max_ms": round(st["latency_max"] * 1000.0, 1),
+                "rate_limit": dict(st["rate_limit"]),
+                "last_error": st["last_error"],
+                "last_at": st["last_at"],
+            }
+    return out
+
+
+def error_rates() -> Dict[str, Dict[str, Any]]:
+    """
+    service -> запросы / ошибки (исключения + HTTP >= 400) за окно.
+    """
+    since = int(time.time() // 60) - HTTP_ERROR_WINDOW_MIN
+    out: Dict[str, Dict[str, Any]] = {}
+    with _LOCK:
+        for service, q in _RECENT.items():
+            n = sum(r[1] for r in q if r[0] > since)
+            err = sum(r[2] for r in q if r[0] > since)
+            out[service] = {
+                "window_min": HTTP_ERROR_WINDOW_MIN,
+                "requests": n,
+                "errors": err,
+                "error_rate": round(err / n, 4) if n else 0.0,
+            }
+    return out
+
+
+# ---------- requests ----------
+def _requests_hook(r, *args, **kwargs):
+    try:
+        size = r.headers.get("content-length")
+        nbytes = int(size) if size is not None else len(r.content or b"")
+        record(r.url, r.status_code, r.elapsed.total_seconds(), nbytes, r.headers)
+    except Exception:
+        pass
+    return r
+
+
+def instrument_session(session) -> None:
+    """
+    requests.Session (в т.ч. AuthorizedSession gspread) — response hook.
+    """
+    hooks = session.hooks.setdefault("response", [])
+    if _requests_hook not in hooks:
+        hooks.append(_requests_hook)
+
+
+# ---------- httpx (python-telegram-bot) ----------
+async def _httpx_request_hook(request) -> None:
+    request.extensions["radar_t0"] = time.perf_counter()
+
+
+async def _httpx_response_hook(response) -> None:
+    try:
+        t0 = response.request.extensions.get("radar_t0")
+        latency = time.perf_counter() - t0 if t0 is not None else 0.0
+        nbytes = int(response.headers.get("content-length") or 0)
+        record(str(response.request.url), response.status_code, latency, nbytes, response.headers)
+    except Exception:
+        pass
+
+
+HTTPX_EVENT_HOOKS = {
+    "request": [_httpx_request_hook],
+    "response": [_httpx_response_hook],
+}
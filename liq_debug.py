@@ -1,19 +1,18 @@
 import time
 from typing import Dict, Any
 
+from state import BotState
 
-def should_send_liq_debug(state: Dict[str, Any], cid: int, every_sec: int = 3600) -> bool:
-    state.setdefault("liq_debug", {})
-    rec = state["liq_debug"].get(str(int(cid)))
-    if not rec:
+
+def should_send_liq_debug(state: BotState, cid: int, every_sec: int = 3600) -> bool:
+    last_ts = state.liq_debug.get(cid)
+    if last_ts is None:
         return True
-    last_ts = float(rec.get("ts") or 0)
     return (time.time() - last_ts) >= float(every_sec)
 
 
-def mark_liq_debug_sent(state: Dict[str, Any], cid: int) -> None:
-    state.setdefault("liq_debug", {})
-    state["liq_debug"][str(int(cid))] = {"ts": time.time()}
+def mark_liq_debug_sent(state: BotState, cid: int) -> None:
+    state.liq_debug[cid] = float(time.time())
 
 
 def build_liq_debug_text(symbol: str, liq: Dict[str, Any]) -> str:
@@ -1,6 +1,6 @@
 import os
-import requests
-from typing import Dict, Any, List, Optional, Tuple
+import http_pool
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
 
 BINANCE_BASE = os.getenv("BINANCE_BASE", "https://api.binance.com")
@@ -14,6 +14,13 @@ MAX_SPREAD_PCT = float(os.getenv("MAX_SPREAD_PCT", "1.0"))
 MIN_NOTIONAL_5M = float(os.getenv("MIN_NOTIONAL_5M", "50000"))
 MIN_NOTIONAL_15M = float(os.getenv("MIN_NOTIONAL_15M", "150000"))
 
+# LIQUIDITY_VETO=1 — провал гейта блокирует FIRST MOVE / CONFIRM
+# (иначе гейт только считается: trace / debug)
+LIQUIDITY_VETO = os.getenv("LIQUIDITY_VETO", "0") == "1"
+
+# SYMBOLUSDT -> (bid, ask)
+Book = Dict[str, Tuple[float, float]]
+
 
 def _sym_usdt(symbol: str) -> str:
     s = (symbol or "").upper().strip()
@@ -44,55 +51,61 @@ def _notional_from_candles(candles: List[Dict[str, Any]], last_n: int = 1) -> fl
     chunk = candles[-last_n:] if len(candles) >= last_n else candles
     total = 0.0
     for c in chunk:
-        v = _safe_float(c.get("v")) or 0.0
-        close = _safe_float(c.get("c")) or 0.0
+        # Bybit отдаёт и "v"/"c", Binance — только "volume"/"close"
+        v = _safe_float(c.get("v", c.get("volume"))) or 0.0
+        close = _safe_float(c.get("c", c.get("close"))) or 0.0
         total += v * close
     return total
 
 
-def get_spread_binance(symbol: str) -> Optional[float]:
-    """
-    Binance best bid/ask spread % via /ticker/bookTicker
-    """
-    try:
-        url = f"{BINANCE_BASE}/api/v3/ticker/bookTicker"
-        r = requests.get(url, params={"symbol": _sym_usdt(symbol)}, timeout=10)
-        r.raise_for_status()
-        data = r.json() or {}
-        bid = _safe_float(data.get("bidPrice"))
-        ask = _safe_float(data.get("askPrice"))
-        if not bid or not ask:
-            return None
-        return _spread_pct(bid, ask)
-    except Exception:
-        return None
+# ================= BULK BOOK TICKERS =================
+# Вся таблица best bid/ask одним запросом на биржу — снимок обновляет
+# snapshots.DataHub (BOOK_TICKER_REFRESH_SEC), гейт читает из dict.
+def fetch_book_binance() -> Book:
+    url = f"{BINANCE_BASE}/api/v3/ticker/bookTicker"
+    r = http_pool.get(url, timeout=10)
+    r.raise_for_status()
+
+    out: Book = {}
+    for row in r.json() or []:
+        bid = _safe_float(row.get("bidPrice"))
+        ask = _safe_float(row.get("askPrice"))
+        if bid and ask:
+            out[row.get("symbol")] = (bid, ask)
+    return out
+
+
+def _fetch_book_bybit(category: str) -> Book:
+    url = f"{BYBIT_BASE}/v5/market/tickers"
+    r = http_pool.get(url, params={"category": category}, timeout=10)
+    r.raise_for_status()
+    data = r.json() or {}
+    if str(data.get("retCode")) != "0":
+        raise RuntimeError(f"bybit tickers {category}: {data.get('retMsg')}")
+
+    out: Book = {}
+    for row in (data.get("result") or {}).get("list") or []:
+        bid = _safe_float(row.get("bid1Price"))
+        ask = _safe_float(row.get("ask1Price"))
+        if bid and ask:
+            out[row.get("symbol")] = (bid, ask)
+    return out
 
 
-def get_spread_bybit(symbol: str) -> Optional[float]:
+def fetch_book_bybit() -> Book:
     """
-    Bybit spread % via v5 tickers (linear)
+    linear + spot; при наличии обоих — spot (свечи Bybit тоже сначала spot).
     """
-    try:
-        url = f"{BYBIT_BASE}/v5/market/tickers"
-        r = requests.get(
-            url,
-            params={"category": "linear", "symbol": _sym_usdt(symbol)},
-            timeout=10,
-        )
-        r.raise_for_status()
-        data = r.json() or {}
-        result = data.get("result") or {}
-        lst = result.get("list") or []
-        if not lst:
-            return None
-        row = lst[0]
-        bid = _safe_float(row.get("bid1Price"))
-        ask = _safe_float(row.get("ask1Price"))
-        if not bid or not ask:
-            return None
-        return _spread_pct(bid, ask)
-    except Exception:
+    out = _fetch_book_bybit("linear")
+    out.update(_fetch_book_bybit("spot"))
+    return out
+
+
+def spread_from_book(book: Book, symbol: str) -> Optional[float]:
+    row = book.get(_sym_usdt(symbol))
+    if row is None:
         return None
+    return _spread_pct(*row)
 
 
 def liquidity_gate(
@@ -100,17 +113,19 @@ def liquidity_gate(
     market: str,  # "BINANCE" | "BYBIT"
     candles_5m: List[Dict[str, Any]],
     candles_15m: List[Dict[str, Any]],
+    get_book: Optional[Callable[[str], Optional[Book]]] = None,
 ) -> Tuple[bool, Dict[str, Any]]:
     """
     Возвращает (ok, metrics).
     ok=False → НЕ даём FIRST MOVE / CONFIRM (пока ликвидность плохая)
+    get_book(market) — снимок bid/ask биржи. Нет свежего снимка — спред
+    неизвестен: зовут из event loop, запрос по символу здесь не делаем.
     """
 
     spread = None
-    if market == "BINANCE":
-        spread = get_spread_binance(symbol)
-    elif market == "BYBIT":
-        spread = get_spread_bybit(symbol)
+    book = get_book(market) if get_book is not None else None
+    if book is not None:
+        spread = spread_from_book(book, symbol)
 
     notional_5m = _notional_from_candles(candles_5m, last_n=1)
     notional_15m = _notional_from_candles(candles_15m, last_n=1)
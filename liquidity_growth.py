@@ -6,8 +6,8 @@ def liquidity_growth_ok(candles):
         return False
 
     try:
-        closes = [float(c[4]) for c in candles[-12:]]
-        volumes = [float(c[5]) for c in candles[-12:]]
+        closes = [float(c["close"]) for c in candles[-12:]]
+        volumes = [float(c["volume"]) for c in candles[-12:]]
     except Exception:
         return False
 
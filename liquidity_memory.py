@@ -10,8 +10,10 @@ def liquidity_memory_ok(candles):
         return False
 
     try:
-        volumes = [float(c[5]) for c in candles]
-        closes = [float(c[4]) for c in candles]
+        if isinstance(candles[0], dict):
+            volumes = [float(c.get("volume", c.get("v"))) for c in candles]
+        else:
+            volumes = [float(c[5]) for c in candles]
     except Exception:
         return False
 
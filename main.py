@@ -2,24 +2,32 @@ import asyncio
 import os
 import time
 import traceback
-from telegram.constants import ParseMode
-from telegram.ext import Application
 
 from config import Settings
-from cmc import CMCClient, age_days
+from cmc import CMCClient, age_days, parse_date_added
 from sheets import SheetsClient, now_iso_utc
 from noise_filter import is_clean_token
-import asyncio
-import threading
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
 from contextlib import asynccontextmanager
-from confirm_entry_client import send_to_confirm_entry
+from telegram_out import TelegramOutbox, PRIORITY_HIGH, PRIORITY_LOW, build_application
+from webhook_inbox import WebhookInbox
+from scheduler import TF_SEC, SymbolScheduler, bar_ts, candle_volatility_pct, closed_bars
+from confirm_entry_client import send_to_confirm_entry, run_confirm_entry_drainer
+import confirm_entry_client
+from pipeline import Pipeline
+import metrics
+import http_stats
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from profiler import PROFILER
+import decision_trace
+from decision_trace import TRACE
+from alert_latency import LATENCY, run_daily_summary
 
 from state import (
     early_sent,
     mark_early_sent,
     load_state,
-    save_state,
+    save_state_async,
     seen_ids,
     mark_seen,
     tracked_ids,
@@ -33,52 +41,84 @@ from state import (
     mark_startup_sent,
     ultra_seen,
     mark_ultra_seen,
+    mark_coin_added,
+    coin_first_seen,
+    mark_crowd_memory,
+    crowd_memory_ts,
+    mark_crowd_flow_sent,
+    crowd_flow_cooldown_ok,
+    compact_state,
+    enable_shared_state,
+    merge_state,
 )
 
-from detect_trading import (
-    check_binance,
-    check_bybit,
-    check_bybit_linear,
-    check_mexc,
-    check_gate,
-    check_bitget,
-    check_kucoin,
-)
-from first_move import first_move_eval
-from confirm_light import confirm_light_eval
+from detect_trading import trading_status
+from snapshots import DataHub, snapshot_status
+from coordination import Coordinator
+import detectors
+
+from funding_flow import FUNDING, funding_crowd_ok
+from liquidity import LIQUIDITY_VETO, liquidity_gate
+from depth import depth_ok, format_slippage, slippage, slippage_summary
+from liq_debug import build_liq_debug_text, mark_liq_debug_sent, should_send_liq_debug
+
+# ================= FASTAPI + SCANNER TASK ===============
+
+class Runtime:
+    """
+    Всё, что живёт весь процесс и делится между сканером и web-эндпоинтами
+    (один event loop uvicorn): бот + httpx-пул, outbox, Sheets, state.
+    """
+
+    def __init__(self, settings: Settings, tg):
+        self.settings = settings
+        self.tg = tg
+        self.outbox = None
+        self.cmc = None
+        # CMC / списки инструментов / свечи — снимки со своими циклами обновления
+        self.data = None
+        self.sheets = None
+        self.state = None
 
-from candles_binance import get_candles_5m as get_binance_5m
-from candles_bybit import get_candles_5m as get_bybit_5m
+        # leader lease + шардирование cmc_id между воркерами (COORD_ENABLED)
+        self.coord = Coordinator()
 
-from crowd_engine import crowd_engine_signal, crowd_engine_explain
-from liquidity_growth import liquidity_growth_ok
-from liquidity_memory import liquidity_memory_ok
-from funding_flow import funding_crowd_ok
+        self.webhooks = WebhookInbox(coord=self.coord)
+        # SYMBOL -> (cid, symbol, trading) из последнего скана
+        self.symbols = {}
+        self.symbol_locks = {}
 
-try:
-    from candles_binance import get_candles_15m as get_binance_15m
-except Exception:
-    get_binance_15m = None
+        self.scheduler = SymbolScheduler()
+        # trading → candles → detect → alert (см. build_pipeline)
+        self.pipeline = None
 
-try:
-    from candles_bybit import get_candles_15m as get_bybit_15m
-except Exception:
-    get_bybit_15m = None
+        # для /health и /status
+        self.started_at = time.time()
+        self.scanner = None
+        self.scan = {"started": 0.0, "finished": 0.0, "duration": None, "count": 0, "errors": 0}
 
-# ================= FASTAPI + BACKGROUND LOOP ===============
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print(">>> LIFESPAN STARTED", flush=True)
 
-    def start_background_loop():
-        asyncio.run(main())
+    # один инициализированный бот (и httpx-пул) на сканер и все POST /webhook
+    settings = Settings.load()
+    tg = build_application(settings.bot_token)
+    await tg.initialize()
+
+    rt = Runtime(settings, tg)
+    app.state.rt = rt
 
-    thread = threading.Thread(target=start_background_loop)
-    thread.daemon = True
-    thread.start()
+    # сканер — обычная task на loop'е uvicorn, а не отдельный поток со своим loop
+    scanner = rt.scanner = asyncio.create_task(main(rt))
 
-    yield
+    try:
+        yield
+    finally:
+        scanner.cancel()
+        await asyncio.gather(scanner, return_exceptions=True)
+        await tg.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -87,27 +127,260 @@ app = FastAPI(lifespan=lifespan)
 async def tradingview_webhook(request: Request):
     data = await request.json()
 
-    symbol = data.get("symbol", "UNKNOWN")
-    action = data.get("action", "signal")
-
     print(f"WEBHOOK RECEIVED: {data}", flush=True)
 
+    # только в очередь — ответ TradingView сразу, обработка в webhook_worker
+    status = request.app.state.rt.webhooks.submit(data)
+
+    return {"status": "ok", "queue": status}
+
+
+@app.get("/metrics")
+async def prometheus_metrics(request: Request):
+    rt = request.app.state.rt
+    if rt.pipeline is not None:
+        # gauges — снимок в момент запроса
+        for name, depth in _queue_depths(rt).items():
+            metrics.QUEUE_DEPTH.set(depth, queue=name)
+        for sink, lag in _sink_lags(rt).items():
+            metrics.SINK_LAG_SECONDS.set(lag, sink=sink)
+        for tier, n in rt.scheduler.tier_counts().items():
+            metrics.SCHEDULED.set(n, tier=tier)
+        metrics.KLINES_CACHED.set(len(rt.data.klines))
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/http")
+async def outbound_http_stats():
+    # host -> endpoint -> латентность / байты / статусы / rate-limit заголовки
+    return http_stats.snapshot()
+
+
+# ---------- health / status ----------
+# всё из памяти процесса, без внешних вызовов
+HEALTH_MAX_SCAN_SEC = float(os.getenv("HEALTH_MAX_SCAN_SEC", "900"))
+HEALTH_STARTUP_GRACE_SEC = float(os.getenv("HEALTH_STARTUP_GRACE_SEC", "300"))
+# 0 — 3 интервала CMC_REFRESH_SEC
+HEALTH_MAX_CMC_AGE_SEC = float(os.getenv("HEALTH_MAX_CMC_AGE_SEC", "0"))
+
+
+def _ago(ts, now):
+    return round(now - ts, 1) if ts else None
+
+
+def health_problems(rt):
+    now = time.time()
+    problems = []
+
+    if rt.scanner is None or rt.scanner.done():
+        problems.append("scanner task is not running")
+
+    scan = rt.scan
+    if scan["started"] > scan["finished"] and now - scan["started"] > HEALTH_MAX_SCAN_SEC:
+        problems.append(f"scan running for {now - scan['started']:.0f}s")
+
+    if now - rt.started_at > HEALTH_STARTUP_GRACE_SEC:
+        max_age = HEALTH_MAX_CMC_AGE_SEC or 3 * (rt.data.cmc_refresh_sec if rt.data else 3600)
+        cmc_age = rt.data.listings.age() if rt.data else float("inf")
+        if cmc_age > max_age:
+            problems.append(f"no CMC snapshot for {cmc_age:.0f}s")
+        if not scan["finished"] or now - scan["finished"] > max_age + HEALTH_MAX_SCAN_SEC:
+            problems.append(f"last scan finished {_ago(scan['finished'], now)}s ago")
+
+    return problems
+
+
+@app.get("/health")
+async def health(request: Request):
+    problems = health_problems(request.app.state.rt)
+    return JSONResponse(
+        {"ok": not problems, "problems": problems},
+        status_code=503 if problems else 200,
+    )
+
+
+@app.get("/status")
+async def status(request: Request):
+    rt = request.app.state.rt
+    now = time.time()
+    scan = rt.scan
+    running = scan["started"] > scan["finished"]
+
+    out = {
+        "ok": not health_problems(rt),
+        "uptime_sec": round(now - rt.started_at, 1),
+        "worker": rt.coord.status(),
+        "scan": {
+            "running": running,
+            "running_sec": _ago(scan["started"], now) if running else None,
+            "last_start_ago_sec": _ago(scan["started"], now),
+            "last_end_ago_sec": _ago(scan["finished"], now),
+            "last_duration_sec": scan["duration"],
+            "count": scan["count"],
+            "errors": scan["errors"],
+        },
+        "caches": {
+            "symbols": len(rt.symbols),
+            "symbol_locks": len(rt.symbol_locks),
+            "scheduled": rt.scheduler.tier_counts(),
+        },
+        "errors": {
+            "http": http_stats.error_rates(),
+            "coin": {st: metrics.COIN_ERRORS.value(stage=st) for st in ("trading", "candles", "detect", "alert")},
+        },
+        "detectors": dict(detectors.STATS),
+        "trace": TRACE.stats(),
+    }
+    if rt.data is not None:
+        out["cmc_last_ok_ago_sec"] = snapshot_status(rt.data.listings)["age_sec"]
+        out["data"] = rt.data.status()
+    if rt.pipeline is not None:
+        out["queues"] = _queue_depths(rt)
+        out["sink_lag_sec"] = _sink_lags(rt)
+        out["pipeline"] = pipeline_stats(rt)
+    return out
+
+
+@app.get("/status/latency")
+async def alert_latency_status():
+    # "<TYPE>/<exchange>" -> n + перцентили (сек) по участкам bar close → delivered
+    return LATENCY.status()
+
+
+# ---------- admin ----------
+# без ADMIN_TOKEN admin-ручки выключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "").strip()
+
+
+def _require_admin(request: Request) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not set")
+    if request.headers.get("x-admin-token", "") != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="bad admin token")
+
+
+@app.post("/debug/profile")
+async def profile_arm(request: Request, scans: int = 1, mode: str = "sample", interval_ms: float = 5.0):
+    """
+    Профилировать следующие `scans` проходов: scan_once + стадии пайплайна
+    до следующего снимка CMC (sample | cprofile).
+    """
+    _require_admin(request)
     try:
-        settings = Settings()
-        application = Application.builder().token(settings.bot_token).build()
-        await application.bot.send_message(
-            chat_id=settings.chat_id,
-            text=(
-                f"📩 <b>TRADINGVIEW SIGNAL</b>\n\n"
-                f"Монета: <b>{symbol}</b>\n"
-                f"Действие: {action}"
-            ),
-            parse_mode=ParseMode.HTML,
-        )
-    except Exception as e:
-        print("Webhook send error:", e, flush=True)
+        return PROFILER.arm(scans, mode, interval_ms)
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 
-    return {"status": "ok"}
+@app.delete("/debug/profile")
+async def profile_disarm(request: Request):
+    _require_admin(request)
+    return PROFILER.disarm()
+
+
+@app.get("/debug/profile")
+async def profile_status(request: Request):
+    _require_admin(request)
+    return PROFILER.status()
+
+
+@app.get("/debug/profile/result")
+async def profile_result(request: Request):
+    """
+    Последний результат: .folded (collapsed stacks) или .prof (pstats).
+    """
+    _require_admin(request)
+    last = PROFILER.last or {}
+    path = last.get("path")
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="no profile yet")
+    if path.endswith(".folded"):
+        return FileResponse(path, media_type="text/plain", filename=os.path.basename(path))
+    return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
+
+
+WEBHOOK_FORWARD_POLL_SEC = float(os.getenv("WEBHOOK_FORWARD_POLL_SEC", "1"))
+
+
+def _webhook_cid(rt, symbol):
+    """
+    cmc_id монеты из снимка CMC (по нему — воркер-владелец); None — не нашли.
+    """
+    for coin in (rt.data.listings.value if rt.data else None) or []:
+        if (coin.get("symbol") or "").strip().upper() == symbol:
+            return int(coin.get("id") or 0)
+    return None
+
+
+async def webhook_worker(rt):
+    """
+    Алерт TradingView → сообщение в чат + немедленный скан этого символа
+    (свечи / CROWD / FIRST MOVE / CONFIRM), не дожидаясь CHECK_INTERVAL_MIN.
+    Монета из чужого шарда — пересылается воркеру-владельцу.
+    """
+    while True:
+        item = await rt.webhooks.get()
+        raw = item["raw"]
+        forwarded = item.get("forwarded")
+
+        # сообщение в чат — один раз, от воркера, принявшего POST
+        if not forwarded:
+            rt.outbox.post(
+                (
+                    f"📩 <b>TRADINGVIEW SIGNAL</b>\n\n"
+                    f"Монета: <b>{raw.get('symbol', 'UNKNOWN')}</b>\n"
+                    f"Действие: {raw.get('action', 'signal')}"
+                ),
+                priority=PRIORITY_HIGH,
+            )
+
+        # cid и биржи — из кэша последнего скана (только свой шард)
+        known = rt.symbols.get(item["symbol"])
+        if not known:
+            cid = _webhook_cid(rt, item["symbol"]) if rt.coord.enabled and not forwarded else None
+            owner = rt.coord.owner_of(cid) if cid else None
+            if owner and owner != rt.coord.worker_id:
+                try:
+                    await asyncio.to_thread(
+                        rt.coord.forward, owner, "webhook", dict(item, forwarded=True), str(cid)
+                    )
+                except Exception as e:
+                    print(f"WEBHOOK FORWARD ERROR {item['symbol']}:", e, flush=True)
+            # незнакомый символ не сканируем
+            continue
+
+        cid, symbol, t = known
+        try:
+            async with symbol_lock(rt, item["symbol"]):
+                await evaluate_symbol(rt, cid, symbol, t)
+        except Exception as e:
+            print(f"WEBHOOK SCAN ERROR {symbol}:", e, flush=True)
+
+        rt.outbox.flush_key(symbol)
+
+
+async def reload_shared_state(rt):
+    """
+    Ring сменился — часть монет переехала к нам: подтягиваем из общего
+    state отметки прошлого владельца (cooldown'ы, *_sent), пока новый
+    ring не применён и эти монеты ещё не оцениваются здесь.
+    """
+    merge_state(rt.state, await asyncio.to_thread(load_state))
+    print("COORD: shared state reloaded for rebalance", flush=True)
+
+
+async def forwarded_webhooks(rt):
+    """
+    Webhook'и, принятые другими воркерами для монет нашего шарда.
+    """
+    while True:
+        try:
+            for item in await asyncio.to_thread(rt.coord.take_forwarded, "webhook"):
+                rt.webhooks.resubmit(item)
+        except Exception as e:
+            print("⚠️ WEBHOOK INBOX ERROR:", e, flush=True)
+        await asyncio.sleep(WEBHOOK_FORWARD_POLL_SEC)
 
 
 # ================= ENV =================
@@ -115,355 +388,648 @@ FIRST_COOLDOWN = int(os.getenv("FIRST_COOLDOWN_SEC", str(60 * 60)))
 CONFIRM_COOLDOWN = int(os.getenv("CONFIRM_COOLDOWN_SEC", str(2 * 60 * 60)))
 STARTUP_GUARD_SEC = int(os.getenv("STARTUP_GUARD_SEC", "3600"))
 
-ANTI_SCAM_MIN_CANDLES = int(os.getenv("ANTI_SCAM_MIN_CANDLES", "25"))
-ANTI_SCAM_MAX_RANGE = float(os.getenv("ANTI_SCAM_MAX_RANGE", "2.5"))
-ANTI_SCAM_VOL_DROP_K = float(os.getenv("ANTI_SCAM_VOL_DROP_K", "0.7"))
-
 CROWD_MEMORY_SEC = int(os.getenv("CROWD_MEMORY_SEC", "1200"))
+CROWD_FLOW_COOLDOWN = int(os.getenv("CROWD_FLOW_COOLDOWN_SEC", str(4 * 60 * 60)))
+
+SCHED_IDLE_SEC = float(os.getenv("SCHED_IDLE_SEC", "5"))
 
 
 def _now():
     return float(time.time())
 
 
-# ================= SAFE SEND =================
-async def safe_send(app, chat_id, text, parse_mode=ParseMode.HTML, retries=3):
-    last_err = None
-    for _ in range(retries):
-        try:
-            return await app.bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode=parse_mode,
-            )
-        except Exception as e:
-            last_err = e
-            await asyncio.sleep(1.5)
-    raise last_err
+# ================= DETECT TRADING =================
+def detect_trading(rt, symbol):
+    # по последним снимкам списков инструментов, без запросов к биржам
+    return trading_status(symbol, rt.data.instruments_for)
 
 
-# ================= DETECT TRADING =================
-def detect_trading(symbol):
-    binance_ok = check_binance(symbol)
-    bybit_spot_ok = check_bybit(symbol)
-    bybit_linear_ok = check_bybit_linear(symbol)
-    mexc_ok = check_mexc(symbol)
-    gate_ok = check_gate(symbol)
-    bitget_ok = check_bitget(symbol)
-    kucoin_ok = check_kucoin(symbol)
+def candle_market(t):
+    if t["binance"]:
+        return "binance"
+    if t["bybit_spot"] or t["bybit_linear"]:
+        return "bybit"
+    return None
+
 
+# ================= SCAN LOOP =================
+BAD_WORDS = [
+    "usd", "usdt", "usdc", "eur", "eurc",
+    "rusd", "reur",
+    "wrapped", "bridged",
+    "stock", "shares", "ondo"
+]
+
+
+def symbol_lock(rt, symbol: str) -> asyncio.Lock:
+    """
+    Один lock на символ: периодический скан и webhook-скан
+    не оценивают одну монету одновременно.
+    """
+    lock = rt.symbol_locks.get(symbol)
+    if lock is None:
+        lock = rt.symbol_locks[symbol] = asyncio.Lock()
+    return lock
+
+
+async def scan_once(rt, coins):
+    """
+    discover: монеты из снимка CMC → стадия trading; ждём, пока она
+    разберёт весь список, и подводим итог (расписание, state).
+    """
+    settings = rt.settings
+    state = rt.state
+
+    evicted = compact_state(state, settings.max_age_days)
+    if evicted:
+        print(f"STATE COMPACT: evicted {sum(evicted.values())} {evicted}", flush=True)
+
+    await rt.data.instruments_ready()
+
+    counters = {"passed": 0, "tracked": 0, "active": set(), "scan": int(time.time())}
+
+    # SCAN START muted
+
+    trading = rt.pipeline["trading"]
+    for coin in coins:
+        # чужой шард — монету (и её алерты) ведёт другой воркер
+        if not rt.coord.owns(int(coin.get("id") or 0)):
+            continue
+        await trading.put((coin, counters))
+
+    await trading.join()
+
+    # SCAN REPORT muted
+
+    rt.scheduler.retain(counters["active"])
+    scheduled = {e.symbol.upper() for e in rt.scheduler.entries.values()}
+    rt.data.klines.retain(scheduled)
+    rt.data.depth.retain(scheduled)
+
+    await save_state_async(state)
+
+
+async def scheduler_loop(rt):
+    """
+    Монеты, которым пора (см. scheduler.py), — в стадию candles.
+    Полная очередь стадии притормаживает только этот цикл.
+    """
+    candles = rt.pipeline["candles"]
+
+    while True:
+        for e in rt.scheduler.pop_due():
+            await candles.put(e)
+
+        nxt = rt.scheduler.next_due()
+        wait = SCHED_IDLE_SEC if nxt is None else nxt - time.time()
+        await asyncio.sleep(min(max(wait, 0.0), SCHED_IDLE_SEC))
+
+
+# ================= PIPELINE =================
+# Очередь Telegram длиннее этого — стадия alert ждёт (backpressure от sink'а).
+# Sheets / confirm-entry пишут в дисковый spool и не тормозят.
+PIPE_OUTBOX_HIGH_WATER = int(os.getenv("PIPE_OUTBOX_HIGH_WATER", "200"))
+
+
+def build_pipeline(rt) -> Pipeline:
+    p = Pipeline()
+    p.add("trading", lambda job: stage_trading(rt, job), concurrency=4, maxsize=100)
+    p.add("candles", lambda e: stage_candles(rt, e), concurrency=8, maxsize=200)
+    p.add("detect", lambda job: stage_detect(rt, job), concurrency=2, maxsize=50)
+    p.add("alert", lambda job: stage_alert(rt, job), concurrency=1, maxsize=100)
+    return p
+
+
+def _sink_depths(rt):
     return {
-        "binance": binance_ok,
-        "bybit_spot": bybit_spot_ok,
-        "bybit_linear": bybit_linear_ok,
-        "mexc": mexc_ok,
-        "gate": gate_ok,
-        "bitget": bitget_ok,
-        "kucoin": kucoin_ok,
-        "any": (
-            binance_ok
-            or bybit_spot_ok
-            or bybit_linear_ok
-            or mexc_ok
-            or gate_ok
-            or bitget_ok
-            or kucoin_ok
-        ),
+        "telegram": rt.outbox.queue_depth(),
+        "sheets": rt.sheets.queue_depth(),
+        "confirm_entry": confirm_entry_client.queue_depth(),
     }
 
 
-# ================= SHARP FILTER =================
-def anti_scam_filter(candles):
-    if not candles or len(candles) < ANTI_SCAM_MIN_CANDLES:
-        return False
+def _sink_lags(rt):
+    # сек, сколько ждёт самая старая ещё не записанная строка spool
+    return {
+        "sheets": round(rt.sheets.lag_sec(), 1),
+        "confirm_entry": round(confirm_entry_client.lag_sec(), 1),
+    }
 
-    try:
-        highs = [float(c[2]) for c in candles]
-        lows = [float(c[3]) for c in candles]
-        volumes = [float(c[5]) for c in candles]
-    except Exception:
-        return False
 
-    low_min = min(lows)
-    high_max = max(highs)
+def _queue_depths(rt):
+    out = {name: s.queue.qsize() for name, s in rt.pipeline.stages.items()}
+    out.update(_sink_depths(rt))
+    out["webhooks"] = rt.webhooks.depth()
+    return out
 
-    if low_min <= 0:
-        return False
 
-    price_range = (high_max - low_min) / max(low_min, 1e-12)
-    if price_range > ANTI_SCAM_MAX_RANGE:
-        return False
+def pipeline_stats(rt):
+    out = rt.pipeline.stats()
+    out["sinks"] = _sink_depths(rt)
+    return out
 
-    half = len(volumes) // 2
-    v1 = sum(volumes[:half])
-    v2 = sum(volumes[half:])
 
-    if v1 > 0 and v2 < v1 * ANTI_SCAM_VOL_DROP_K:
-        return False
+def _coin_error(rt, symbol, ex, stage):
+    metrics.COIN_ERRORS.inc(stage=stage)
+    rt.outbox.post(
+        f"⚠️ COIN ERROR: {symbol}\n<pre>{str(ex)[:1000]}</pre>",
+        priority=PRIORITY_LOW,
+    )
 
-    return True
 
+def _finish(rt, e):
+    rt.scheduler.reschedule(e, rt.state)
+    rt.outbox.flush_key(e.symbol)
 
-# ================= SCAN LOOP =================
-async def scan_once(app, settings, cmc, sheets):
-    
-    state = load_state()
-    seen = seen_ids(state)
-    tracked = tracked_ids(state)
 
-    coins = cmc.fetch_recent_listings(limit=settings.limit)
-    
+async def stage_trading(rt, job):
+    coin, counters = job
+    tr = decision_trace.new_record("discover", int(coin.get("id") or 0), coin.get("symbol") or "")
+    tr["scan"] = counters["scan"]
+    try:
+        with decision_trace.timed(tr, "process"):
+            await process_coin(rt, coin, counters, tr)
+    except Exception as ex:
+        tr["error"] = repr(ex)[:300]
+        _coin_error(rt, coin.get("symbol", "UNKNOWN"), ex, "trading")
+    finally:
+        TRACE.emit(tr)
+
+
+async def stage_candles(rt, e):
+    if not rt.coord.owns(e.cid):
+        # ring поменялся — монета уйдёт из расписания на следующем discovery
+        rt.scheduler.reschedule(e, rt.state)
+        return
+
+    tr = decision_trace.new_record("eval", e.cid, e.symbol)
+    try:
+        with decision_trace.timed(tr, "candles"):
+            candles_5m, candles_15m = await fetch_candles(rt, e.symbol, e.trading)
+        tr["at"] = {"fetched": time.time()}
+    except Exception as ex:
+        tr["error"] = repr(ex)[:300]
+        TRACE.emit(tr)
+        _coin_error(rt, e.symbol, ex, "candles")
+        _finish(rt, e)
+        return
+
+    # оцениваем только по новому закрытому 5m-бару; если биржа его ещё
+    # не отдала — короткий повтор, а не полный интервал
+    if candles_5m:
+        last = bar_ts(candles_5m[-1])
+        tr["bar"] = last
+        if last <= e.last_bar:
+            tr["gates"]["new_bar"] = False
+            TRACE.emit(tr)
+            rt.scheduler.retry_soon(e, rt.state)
+            return
+        e.last_bar = last
+
+    e.volatility = candle_volatility_pct(candles_5m)
+    await rt.pipeline["detect"].put((e, candles_5m, candles_15m, tr))
+
+
+async def stage_detect(rt, job):
+    e, candles_5m, candles_15m, tr = job
+    try:
+        with decision_trace.timed(tr, "detect"):
+            det = await detectors.evaluate(
+                e.symbol,
+                candles_5m,
+                candles_15m,
+                first_move=not confirm_light_sent(rt.state, e.cid),
+            )
+        tr["at"]["evaluated"] = time.time()
+    except Exception as ex:
+        tr["error"] = repr(ex)[:300]
+        TRACE.emit(tr)
+        _coin_error(rt, e.symbol, ex, "detect")
+        _finish(rt, e)
+        return
 
-    passed_count = 0
-    tracked_count = 0
-    signal_count = 0
+    await rt.pipeline["alert"].put((e, candles_5m, candles_15m, det, tr))
 
-    # SCAN START muted
 
-    for coin in coins:
-        try:
-            cid = int(coin.get("id") or 0)
-            if not cid:
-                continue
-
-            usd = (coin.get("quote") or {}).get("USD") or {}
-            vol = float(usd.get("volume_24h") or 0)
-            age = age_days(coin.get("date_added"))
-
-            symbol = (coin.get("symbol") or "").strip()
-            name = (coin.get("name") or "").strip()
-            text_check = f"{symbol} {name}".lower()
-            
-            
-            
-            bad_words = [
-                "usd", "usdt", "usdc", "eur", "eurc",
-                "rusd", "reur",
-                "wrapped", "bridged",
-                "stock", "shares", "ondo"
-            ]
-            
-            if any(word in text_check for word in bad_words):
-                print(f"SKIP BAD WORD {symbol}", flush=True)
-                continue
-            
-            if age is not None and age > settings.max_age_days:
-                
-                continue
-            
-            if vol < settings.min_volume_usd:
-                
-                continue
-            
-            
-            
-            passed_count += 1
-        
-            # ================= ULTRA =================
-            if cid not in seen and not ultra_seen(state, cid):
-                allowed, reason = is_clean_token(coin, settings)
-            
-            
-
-                if not allowed:
-                    continue
-
-                await safe_send(
-                    app,
-                    settings.chat_id,
-                    f"🟢 <b>CLEAN LISTING</b>\n\n<b>{name}</b> ({symbol})",
-                    parse_mode=ParseMode.HTML,
+async def stage_alert(rt, job):
+    e, candles_5m, candles_15m, det, tr = job
+    await rt.outbox.wait_room(PIPE_OUTBOX_HIGH_WATER)
+    try:
+        async with symbol_lock(rt, e.symbol.upper()):
+            with decision_trace.timed(tr, "alert"):
+                await apply_signals(rt, e.cid, e.symbol, e.trading, candles_5m, candles_15m, det, tr)
+    except Exception as ex:
+        tr["error"] = repr(ex)[:300]
+        _coin_error(rt, e.symbol, ex, "alert")
+    finally:
+        TRACE.emit(tr)
+        _finish(rt, e)
+
+
+def _outcome(tr, outcome):
+    metrics.COINS.inc(outcome=outcome)
+    tr["out"] = outcome
+
+
+async def process_coin(rt, coin, counters, tr):
+    settings = rt.settings
+    state = rt.state
+    sheets = rt.sheets
+    outbox = rt.outbox
+
+    cid = int(coin.get("id") or 0)
+    if not cid:
+        _outcome(tr, "no_id")
+        return
+
+    usd = (coin.get("quote") or {}).get("USD") or {}
+    vol = float(usd.get("volume_24h") or 0)
+    age = age_days(coin.get("date_added"))
+    if age is None:
+        # без date_added фильтр возраста монету пропускает; first_seen нужен
+        # compact_state — антидубли такой монеты по возрасту не выкидываются
+        coin_first_seen(state, cid, _now())
+
+    symbol = (coin.get("symbol") or "").strip()
+    name = (coin.get("name") or "").strip()
+    text_check = f"{symbol} {name}".lower()
+    gates = tr["gates"]
+    tr["age"] = None if age is None else round(age, 2)
+    tr["vol"] = round(vol)
+
+    gates["bad_word"] = any(word in text_check for word in BAD_WORDS)
+    if gates["bad_word"]:
+        print(f"SKIP BAD WORD {symbol}", flush=True)
+        _outcome(tr, "bad_word")
+        return
+
+    gates["age"] = age is None or age <= settings.max_age_days
+    if not gates["age"]:
+        _outcome(tr, "too_old")
+        return
+
+    gates["volume"] = vol >= settings.min_volume_usd
+    if not gates["volume"]:
+        _outcome(tr, "low_volume")
+        return
+
+    counters["passed"] += 1
+
+    added_dt = parse_date_added(coin.get("date_added"))
+    if added_dt:
+        mark_coin_added(state, cid, added_dt.timestamp())
+
+    # ================= ULTRA =================
+    if cid not in seen_ids(state) and not ultra_seen(state, cid):
+        allowed, reason = is_clean_token(coin, settings)
+        gates["clean"] = allowed if allowed else str(reason)[:80]
+
+        if not allowed:
+            _outcome(tr, "not_clean")
+            return
+
+        outbox.post(
+            f"🟢 <b>CLEAN LISTING</b>\n\n<b>{name}</b> ({symbol})",
+            key=symbol,
+        )
+        metrics.SIGNALS.inc(type="CLEAN_LISTING")
+
+        sheets.buffer_append({
+            "detected_at": now_iso_utc(),
+            "cmc_id": cid,
+            "symbol": symbol,
+            "status": "ULTRA",
+        })
+
+        mark_seen(state, cid)
+        mark_ultra_seen(state, cid)
+        await save_state_async(state)
+
+    # ================= TRACK =================
+    already_tracked = cid in tracked_ids(state)
+
+    with metrics.DETECTOR_SECONDS.time(detector="trading_status"), decision_trace.timed(tr, "trading_status"):
+        t = detect_trading(rt, symbol)
+    gates["cex"] = bool(t["any"])
+
+    # списки части бирж не загружены — ни EARLY, ни записи в state
+    if t["unknown"]:
+        gates["cex"] = None
+        _outcome(tr, "cex_unknown")
+        return
+
+    if not already_tracked:
+        if not t["any"]:
+            if not early_sent(state, cid):
+                outbox.post(
+                    f"🟡 EARLY LISTING\n{symbol}\nПока нет CEX-торговли\nВозможен DEX / pre-market stage",
+                    priority=PRIORITY_LOW,
                 )
+                metrics.SIGNALS.inc(type="EARLY_LISTING")
+                mark_early_sent(state, cid, _now())
+                await save_state_async(state)
+            _outcome(tr, "no_cex")
+            return
+
+        counters["tracked"] += 1
+
+        mark_tracked(state, cid)
+        await save_state_async(state)
+
+        sheets.buffer_append({
+            "detected_at": now_iso_utc(),
+            "cmc_id": cid,
+            "symbol": symbol,
+            "status": "TRACK",
+        })
+
+    elif t["any"]:
+        counters["tracked"] += 1
+
+    # кэш для webhook-сканов: символ -> (cid, где торгуется)
+    rt.symbols[symbol.upper()] = (cid, symbol, t)
+
+    # сами сигнальные стадии — по расписанию монеты (scheduler_loop)
+    if t["any"]:
+        _outcome(tr, "tracked")
+        rt.scheduler.upsert(cid, symbol, t)
+        counters["active"].add(cid)
+    else:
+        _outcome(tr, "no_cex")
+
+
+async def fetch_candles(rt, symbol, t):
+    """
+    Закрытые 5m / 15m бары из KlineStore (текущий бар ещё формируется и шумит).
+    """
+    market = candle_market(t)
+    if not market:
+        return [], []
+
+    candles_5m = closed_bars(await rt.data.klines.get(market, symbol, "5m"), "5m")
+    candles_15m = closed_bars(await rt.data.klines.get(market, symbol, "15m"), "15m")
+    return candles_5m, candles_15m
+
+
+async def evaluate_symbol(rt, cid, symbol, t) -> int:
+    """
+    Все стадии по одной монете сразу (webhook-скан, под symbol_lock):
+    свечи → детекторы → CROWD / FIRST MOVE / CONFIRM.
+    Возвращает количество сигналов.
+    """
+    tr = decision_trace.new_record("eval", cid, symbol)
+    tr["src"] = "webhook"
+    try:
+        with decision_trace.timed(tr, "candles"):
+            candles_5m, candles_15m = await fetch_candles(rt, symbol, t)
+        tr["at"] = {"fetched": time.time()}
+        if candles_5m:
+            tr["bar"] = bar_ts(candles_5m[-1])
+
+        entry = rt.scheduler.entries.get(cid)
+        if entry is not None:
+            entry.volatility = candle_volatility_pct(candles_5m)
+
+        with decision_trace.timed(tr, "detect"):
+            det = await detectors.evaluate(
+                symbol,
+                candles_5m,
+                candles_15m,
+                first_move=not confirm_light_sent(rt.state, cid),
+            )
+        tr["at"]["evaluated"] = time.time()
+
+        with decision_trace.timed(tr, "alert"):
+            return await apply_signals(rt, cid, symbol, t, candles_5m, candles_15m, det, tr)
+    except Exception as ex:
+        tr["error"] = repr(ex)[:300]
+        raise
+    finally:
+        TRACE.emit(tr)
+
+
+async def attach_depth(rt, symbol, t, det, tr):
+    """
+    Стакан + проскальзывание (det["depth"]). Зовёт apply_signals прямо перед
+    отправкой — когда FIRST MOVE / CONFIRM прошёл спред и cooldown:
+    остальным монетам стакан не нужен.
+    """
+    market = candle_market(t)
+    if not market:
+        return
+
+    with decision_trace.timed(tr, "depth"):
+        book = await rt.data.depth.get(market, symbol)
+    det["depth"] = slippage(book) if book else None
+
+
+def _alert_stamps(tr, bar_open, tf):
+    """
+    Отметки alert_latency до постановки в очередь: закрытие бара, свечи, оценка.
+    """
+    at = tr.get("at") or {}
+    return {
+        "bar_close": bar_open + TF_SEC[tf] if bar_open else None,
+        "fetched": at.get("fetched"),
+        "evaluated": at.get("evaluated"),
+    }
 
-                sheets.buffer_append({
-                    "detected_at": now_iso_utc(),
-                    "cmc_id": cid,
-                    "symbol": symbol,
-                    "status": "ULTRA",
-                })
-
-                mark_seen(state, cid)
-                mark_ultra_seen(state, cid)
-                save_state(state)
-
-            # ================= TRACK =================
-            already_tracked = cid in tracked
-
-            if not already_tracked:
-                t = detect_trading(symbol)
-
-                if not t["any"]:
-                    if not early_sent(state, cid):
-                        await safe_send(
-                            app,
-                            settings.chat_id,
-                            f"🟡 EARLY LISTING\n{symbol}\nПока нет CEX-торговли\nВозможен DEX / pre-market stage"
-                        )
-                        mark_early_sent(state, cid, _now())
-                        save_state(state)
-                    continue
-
-                tracked_count += 1
-
-                mark_tracked(state, cid)
-                save_state(state)
-
-                sheets.buffer_append({
-                    "detected_at": now_iso_utc(),
-                    "cmc_id": cid,
-                    "symbol": symbol,
-                    "status": "TRACK",
-                })
-
-            else:
-                t = detect_trading(symbol)
-                if t["any"]:
-                    tracked_count += 1
-
-            # ================= GET 5m candles =================
-            candles_5m = []
-
-            if t["binance"]:
-                candles_5m = get_binance_5m(symbol)
-            elif t["bybit_spot"] or t["bybit_linear"]:
-                candles_5m = get_bybit_5m(symbol)
-
-            # ================= CROWD FLOW =================
-            try:
-                if funding_crowd_ok(symbol):
-                    await safe_send(
-                        app,
-                        settings.chat_id,
-                        f"🟢 <b>CROWD FLOW</b>\n(Толпа вошла — рынок заряжается)\n\n<b>{symbol}</b>",
-                    )
 
-                    sheets.buffer_append({
-                        "detected_at": now_iso_utc(),
-                        "cmc_id": cid,
-                        "symbol": symbol,
-                        "status": "CROWD_FLOW",
-                    })
-            except Exception:
-                pass
-
-            # ================= CROWD ENGINE + EXPLAIN =================
-            crowd_recent = False
-
-            try:
-                if candles_5m and crowd_engine_signal(candles_5m):
-                    crowd_recent = True
-                    state.setdefault("crowd_memory", {})[str(cid)] = _now()
-
-                    explain = crowd_engine_explain(candles_5m)
-
-                    await safe_send(
-                        app,
-                        settings.chat_id,
-                        f"🟢 <b>CROWD ENGINE</b>\n\n{explain}\n\n<b>{symbol}</b>",
-                    )
+def _verdict(res):
+    # для trace: "ok" / причина отказа (SCORE C, WAIT, ...) / None — не считали
+    if not res:
+        return None
+    return "ok" if res.get("ok") else str(res.get("reason") or "no")[:80]
 
-                    sheets.buffer_append({
-                        "detected_at": now_iso_utc(),
-                        "cmc_id": cid,
-                        "symbol": symbol,
-                        "status": "CROWD_ENGINE",
-                    })
-            except Exception:
-                pass
-
-            try:
-                crowd_ts = state.get("crowd_memory", {}).get(str(cid))
-                if crowd_ts and _now() - crowd_ts < CROWD_MEMORY_SEC:
-                    crowd_recent = True
-            except Exception:
-                pass
-
-            # ================= FIRST MOVE =================
-            if not confirm_light_sent(state, cid):
-                if (
-                    candles_5m
-                    and anti_scam_filter(candles_5m)
-                    and liquidity_growth_ok(candles_5m)
-                    and liquidity_memory_ok(symbol, candles_5m)
-                ):
-                    fm = first_move_eval(symbol, candles_5m)
-
-                    if fm.get("ok") and first_move_cooldown_ok(state, cid, FIRST_COOLDOWN):
-                        if crowd_recent:
-                            fm["text"] = "🔥 CROWD BOOSTED\n" + fm["text"]
-
-                        await safe_send(
-                            app,
-                            settings.chat_id,
-                            fm["text"] + "\n\n<b>Действие:</b> импульс начался → следи за входом по плану (Entry/Stop).",
-                        )
-
-                        signal_count += 1
-
-                        sheets.buffer_append({
-                            "detected_at": now_iso_utc(),
-                            "cmc_id": cid,
-                            "symbol": symbol,
-                            "status": "FIRST_MOVE",
-                        })
-
-                        mark_first_move_sent(state, cid, _now())
-                        save_state(state)
-
-            # ================= CONFIRM LIGHT =================
-            candles_15m = []
-
-            if t["binance"] and get_binance_15m:
-                candles_15m = get_binance_15m(symbol)
-            elif (t["bybit_spot"] or t["bybit_linear"]) and get_bybit_15m:
-                candles_15m = get_bybit_15m(symbol)
-
-            if candles_15m:
-                cl = confirm_light_eval(symbol, candles_15m)
-
-                if cl.get("ok") and confirm_light_cooldown_ok(state, cid, CONFIRM_COOLDOWN):
-                    exchange = "BINANCE" if t["binance"] else "BYBIT"
-
-                    signal_count += 1
-
-                    mark_confirm_light_sent(state, cid, _now())
-                    save_state(state)
-
-                    sheets.buffer_append({
-                        "detected_at": now_iso_utc(),
-                        "cmc_id": cid,
-                        "symbol": symbol,
-                        "status": "CONFIRM_LIGHT",
-                    })
-
-                    send_to_confirm_entry(
-                        symbol=symbol,
-                        exchange=exchange,
-                        tf="15m",
-                        candles=candles_15m,
-                        mode_hint="CONFIRM_LIGHT",
-                    )
 
-        except Exception as e:
-            try:
-                await safe_send(
-                    app,
-                    settings.chat_id,
-                    f"⚠️ COIN ERROR: {coin.get('symbol', 'UNKNOWN')}\n<pre>{str(e)[:1000]}</pre>",
-                    parse_mode=ParseMode.HTML
-                )
-            except Exception:
-                pass
+async def apply_signals(rt, cid, symbol, t, candles_5m, candles_15m, det, tr) -> int:
+    """
+    Результат детекторов → state / cooldown'ы / сообщения / Sheets.
+    Возвращает количество сигналов; исходы гейтов — в tr (decision trace).
+    """
+    state = rt.state
+    sheets = rt.sheets
+    outbox = rt.outbox
+    signal_count = 0
 
-    # SCAN REPORT muted
+    gates = tr["gates"]
+    gates.update(det.get("gates") or {})
+    gates["crowd"] = bool(det["crowd"])
+    gates["first_move"] = _verdict(det["first_move"])
+    gates["confirm"] = _verdict(det["confirm"])
+    tr["ms"].update({k: round(v * 1000.0, 2) for k, v in (det.get("timings") or {}).items()})
+    signals = tr["signals"] = []
+
+    # ================= CROWD FLOW =================
+    try:
+        gates["crowd_flow"] = funding_crowd_ok(symbol)
+        if gates["crowd_flow"] and crowd_flow_cooldown_ok(state, cid, CROWD_FLOW_COOLDOWN):
+            fx = FUNDING.explain(symbol)
+            outbox.post(
+                f"🟢 <b>CROWD FLOW</b>\n(Толпа вошла — рынок заряжается)\n\n<b>{symbol}</b>\n"
+                f"OI: <b>+{fx['oi_growth_pct']:.1f}%</b> · funding: <b>{fx['funding'] * 100:.3f}%</b>",
+                key=symbol,
+            )
+            mark_crowd_flow_sent(state, cid, _now())
+            metrics.SIGNALS.inc(type="CROWD_FLOW")
+            signals.append("CROWD_FLOW")
+
+            sheets.buffer_append({
+                "detected_at": now_iso_utc(),
+                "cmc_id": cid,
+                "symbol": symbol,
+                "status": "CROWD_FLOW",
+            })
+    except Exception:
+        pass
+
+    # ================= CROWD ENGINE + EXPLAIN =================
+    crowd_recent = False
+
+    if det["crowd"]:
+        crowd_recent = True
+        mark_crowd_memory(state, cid, _now())
+
+        outbox.post(
+            f"🟢 <b>CROWD ENGINE</b>\n\n{det['crowd_explain']}\n\n<b>{symbol}</b>",
+            key=symbol,
+        )
+        metrics.SIGNALS.inc(type="CROWD_ENGINE")
+        signals.append("CROWD_ENGINE")
+
+        sheets.buffer_append({
+            "detected_at": now_iso_utc(),
+            "cmc_id": cid,
+            "symbol": symbol,
+            "status": "CROWD_ENGINE",
+        })
+
+    try:
+        crowd_ts = crowd_memory_ts(state, cid)
+        if crowd_ts and _now() - crowd_ts < CROWD_MEMORY_SEC:
+            crowd_recent = True
+    except Exception:
+        pass
+
+    fm = det["first_move"]
+    cl = det["confirm"]
+
+    # ================= LIQUIDITY =================
+    # только для готовых FIRST MOVE / CONFIRM; спред — из снимка bid/ask
+    liq_ok = True
+    if (fm and fm.get("ok")) or (cl and cl.get("ok")):
+        liq_ok, liq = liquidity_gate(
+            symbol,
+            (candle_market(t) or "").upper(),
+            candles_5m,
+            candles_15m,
+            get_book=rt.data.book_for,
+        )
+        gates["liquidity"] = True if liq_ok else liq.get("reason")
+        tr["spread_pct"] = liq.get("spread_pct")
+
+    if fm and fm.get("ok"):
+        gates["first_move_cooldown"] = first_move_cooldown_ok(state, cid, FIRST_COOLDOWN)
+        tr["score"] = fm.get("score")
+
+    if cl and cl.get("ok"):
+        gates["confirm_cooldown"] = confirm_light_cooldown_ok(state, cid, CONFIRM_COOLDOWN)
+
+    # ================= DEPTH =================
+    # стакан — последним, только если алерт иначе ушёл бы (спред / cooldown)
+    spread_pass = liq_ok or not LIQUIDITY_VETO
+    if spread_pass and (gates.get("first_move_cooldown") or gates.get("confirm_cooldown")):
+        await attach_depth(rt, symbol, t, det, tr)
+
+        if "depth" in det:
+            d_ok, d_reason = depth_ok(det["depth"])
+            gates["depth"] = True if d_ok else d_reason
+            tr["slippage"] = slippage_summary(det["depth"])
+            if liq_ok and not d_ok:
+                liq_ok, liq["reason"] = False, d_reason
+
+    if (fm and fm.get("ok")) or (cl and cl.get("ok")):
+        if not LIQUIDITY_VETO:
+            liq_ok = True
+        elif not liq_ok and should_send_liq_debug(state, cid):
+            outbox.post(build_liq_debug_text(symbol, liq), priority=PRIORITY_LOW)
+            mark_liq_debug_sent(state, cid)
+
+    # ================= FIRST MOVE =================
+
+    if fm and fm.get("ok") and gates["first_move_cooldown"] and liq_ok:
+        if crowd_recent:
+            fm["text"] = "🔥 CROWD BOOSTED\n" + fm["text"]
+        if "depth" in det:
+            fm["text"] += "\n" + format_slippage(det["depth"]) + "\n"
+
+        outbox.post(
+            fm["text"] + "\n\n<b>Действие:</b> импульс начался → следи за входом по плану (Entry/Stop).",
+            priority=PRIORITY_HIGH,
+            on_delivered=LATENCY.track(
+                "FIRST_MOVE",
+                candle_market(t) or "",
+                _alert_stamps(tr, tr.get("bar"), "5m"),
+            ),
+        )
+
+        signal_count += 1
+        metrics.SIGNALS.inc(type="FIRST_MOVE")
+        signals.append("FIRST_MOVE")
+
+        sheets.buffer_append({
+            "detected_at": now_iso_utc(),
+            "cmc_id": cid,
+            "symbol": symbol,
+            "status": "FIRST_MOVE",
+        })
+
+        mark_first_move_sent(state, cid, _now())
+        await save_state_async(state)
+
+    if det["error"]:
+        raise RuntimeError(det["error"])
+
+    # ================= CONFIRM LIGHT =================
+
+    if cl and cl.get("ok") and gates["confirm_cooldown"] and liq_ok:
+        exchange = "BINANCE" if t["binance"] else "BYBIT"
+
+        # сначала в spool: если payload не лёг, cooldown не ставим —
+        # следующая проверка повторит CONFIRM LIGHT
+        send_to_confirm_entry(
+            symbol=symbol,
+            exchange=exchange,
+            tf="15m",
+            candles=candles_15m,
+            mode_hint="CONFIRM_LIGHT",
+            alert={
+                "type": "CONFIRM_LIGHT",
+                "exchange": exchange.lower(),
+                "stamps": _alert_stamps(tr, bar_ts(candles_15m[-1]) if candles_15m else None, "15m"),
+            },
+        )
+
+        signal_count += 1
+        metrics.SIGNALS.inc(type="CONFIRM_LIGHT")
+        signals.append("CONFIRM_LIGHT")
+
+        mark_confirm_light_sent(state, cid, _now())
+        await save_state_async(state)
+
+        sheets.buffer_append({
+            "detected_at": now_iso_utc(),
+            "cmc_id": cid,
+            "symbol": symbol,
+            "status": "CONFIRM_LIGHT",
+        })
 
-    sheets.flush()
-    save_state(state)
+    return signal_count
 
 
 # ================= MAIN =================
-async def main():
-    settings = Settings.load()
+async def main(rt: Runtime):
+    settings = rt.settings
 
     print(
         "SETTINGS:",
@@ -473,55 +1039,134 @@ async def main():
         flush=True
     )
 
-    app = Application.builder().token(settings.bot_token).build()
-    cmc = CMCClient(settings.cmc_api_key)
+    rt.cmc = CMCClient(settings.cmc_api_key)
+    rt.data = DataHub(
+        rt.cmc,
+        cmc_limit=settings.limit,
+        cmc_refresh_sec=float(os.getenv("CMC_REFRESH_SEC", str(settings.check_interval_min * 60))),
+        coord=rt.coord,
+    )
+
+    if rt.coord.enabled:
+        # state общий для всех воркеров: запись = слияние с сохранённым
+        enable_shared_state(settings.max_age_days)
+        await asyncio.to_thread(rt.coord.heartbeat)
 
-    sheets = SheetsClient(
+    rt.sheets = await asyncio.to_thread(
+        SheetsClient,
         settings.google_sheet_url,
         settings.google_service_account_json,
         settings.sheet_tab_name,
     )
 
-    await app.initialize()
-    await app.start()
+    rt.outbox = TelegramOutbox(rt.tg, settings.chat_id, coord=rt.coord)
+    rt.pipeline = build_pipeline(rt)
+
+    workers = [
+        asyncio.create_task(rt.outbox.run()),
+        asyncio.create_task(rt.outbox.run_flusher()),
+        asyncio.create_task(rt.sheets.run_writer()),
+        asyncio.create_task(run_confirm_entry_drainer()),
+        asyncio.create_task(webhook_worker(rt)),
+        asyncio.create_task(scheduler_loop(rt)),
+        asyncio.create_task(rt.coord.run()),
+        asyncio.create_task(TRACE.run()),
+        asyncio.create_task(run_daily_summary(
+            LATENCY,
+            lambda text: rt.outbox.post(text, priority=PRIORITY_HIGH),
+            is_leader=lambda: rt.coord.leader,
+        )),
+        *rt.data.tasks(due_soon=lambda sec: _due_markets(rt, sec)),
+        *rt.pipeline.start(),
+    ]
+    if rt.coord.enabled:
+        workers.append(asyncio.create_task(forwarded_webhooks(rt)))
+
+    # при нескольких воркерах — одно сообщение от лидера, а не N
+    if rt.coord.leader:
+        rt.outbox.post(
+            f"⚙️ SETTINGS\nAGE={settings.max_age_days}\nVOL={settings.min_volume_usd}\nLIMIT={settings.limit}",
+            priority=PRIORITY_HIGH,
+        )
 
-    await safe_send(
-        app,
-        settings.chat_id,
-        f"⚙️ SETTINGS\nAGE={settings.max_age_days}\nVOL={settings.min_volume_usd}\nLIMIT={settings.limit}"
-    )
+        rt.outbox.post(
+            "✅ Listings Radar ONLINE\n(бот запущен и работает)",
+            priority=PRIORITY_HIGH,
+        )
 
-    await safe_send(
-        app,
-        settings.chat_id,
-        "✅ Listings Radar ONLINE\n(бот запущен и работает)",
-    )
+    rt.state = await asyncio.to_thread(load_state)
+    if not startup_sent_recent(rt.state, cooldown_sec=STARTUP_GUARD_SEC):
+        mark_startup_sent(rt.state)
+        await save_state_async(rt.state)
 
-    state = load_state()
-    if not startup_sent_recent(state, cooldown_sec=STARTUP_GUARD_SEC):
-        mark_startup_sent(state)
-        save_state(state)
+    if rt.coord.enabled:
+        rt.coord.on_rebalance = lambda: reload_shared_state(rt)
 
-    while True:
-        print(">>> SCAN LOOP TICK", flush=True)
-        try:
-            await scan_once(app, settings, cmc, sheets)
-
-        except Exception:
-            err = traceback.format_exc()[:3500]
-            print("MAIN LOOP ERROR:", err, flush=True)
-
-            try:
-                await safe_send(
-                    app,
-                    settings.chat_id,
-                    f"❌ <b>MAIN LOOP ERROR</b>\n\n<pre>{err}</pre>",
-                    parse_mode=ParseMode.HTML
-                )
-            except Exception:
-                pass
+    try:
+        # discovery — на каждый новый снимок CMC (его цикл: CMC_REFRESH_SEC)
+        coins, listings_version = await rt.data.listings.wait_newer(0)
+
+        while True:
+            # профиль — весь проход: discovery + стадии candles / detect / alert,
+            # которые крутятся до следующего снимка CMC
+            with PROFILER.scan():
+                print(">>> SCAN LOOP TICK", rt.pipeline.summary(), flush=True)
+                rt.scan["started"] = time.time()
+                try:
+                    with metrics.SCAN_SECONDS.time():
+                        await scan_once(rt, coins)
+
+                except asyncio.CancelledError:
+                    raise
+
+                except Exception:
+                    rt.scan["errors"] += 1
+                    err = traceback.format_exc()[:3500]
+                    print("MAIN LOOP ERROR:", err, flush=True)
+
+                    rt.outbox.post(
+                        f"❌ <b>MAIN LOOP ERROR</b>\n\n<pre>{err}</pre>",
+                        priority=PRIORITY_HIGH,
+                    )
+
+                rt.scan["finished"] = time.time()
+                rt.scan["duration"] = round(rt.scan["finished"] - rt.scan["started"], 3)
+                rt.scan["count"] += 1
+
+                # всё, что скан накопил по монетам / в дайджест — в очередь отправки
+                rt.outbox.end_scan()
+
+                coins, listings_version = await rt.data.listings.wait_newer(listings_version)
+
+    finally:
+        # shutdown: фоновые воркеры стоп, всё накопленное — на диск / наружу
+        print(">>> SCANNER SHUTDOWN", flush=True)
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
 
-        await asyncio.sleep(settings.check_interval_min * 60)
+        await _shutdown_step("state", save_state_async(rt.state))
+        await _shutdown_step("sheets", rt.sheets.flush())
+        await _shutdown_step("telegram", rt.outbox.drain())
+        await _shutdown_step("trace", TRACE.drain())
+        await _shutdown_step("coord", asyncio.to_thread(rt.coord.release))
+        detectors.shutdown()
 
 
+def _due_markets(rt, sec):
+    out = []
+    for e in rt.scheduler.due_within(sec):
+        market = candle_market(e.trading)
+        if market:
+            out.append((market, e.symbol))
+    return out
 
+
+SHUTDOWN_STEP_SEC = float(os.getenv("SHUTDOWN_STEP_SEC", "10"))
+
+
+async def _shutdown_step(name, coro):
+    try:
+        await asyncio.wait_for(coro, SHUTDOWN_STEP_SEC)
+    except Exception as e:
+        print(f"SHUTDOWN {name} error:", repr(e), flush=True)
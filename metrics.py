@@ -0,0 +1,188 @@
+# metrics.py
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# =========================
+# Prometheus metrics (без prometheus_client)
+# =========================
+# Counter / Gauge / Histogram с метками + render() в text format 0.0.4
+# для GET /metrics. observe()/inc() дёшевы и потокобезопасны (их зовут
+# и из to_thread: Sheets, state save).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_REGISTRY: List["_Metric"] = []
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_num(v)}" for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_num(float(v))}" for k, v in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out = self._header()
+        for key, row in items:
+            acc = 0.0
+            for i, b in enumerate(self.buckets):
+                acc += row[i]
+                le = _fmt_labels(self.labelnames, key, f'le="{_fmt_num(float(b))}"')
+                out.append(f"{self.name}_bucket{le} {_fmt_num(acc)}")
+            le = _fmt_labels(self.labelnames, key, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{le} {_fmt_num(row[-1])}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_num(row[-2])}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {_fmt_num(row[-1])}")
+        return out
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# =========================
+# Metrics used by the scanner
+# =========================
+SCAN_SECONDS = Histogram("radar_scan_seconds", "Discovery pass over one CMC snapshot")
+FETCH_SECONDS = Histogram("radar_fetch_seconds", "Snapshot refresh (CMC, instrument lists)", ("source",))
+KLINES_SECONDS = Histogram("radar_klines_fetch_seconds", "Kline fetch per exchange", ("exchange", "tf"))
+DETECTOR_SECONDS = Histogram("radar_detector_seconds", "Single detector evaluation", ("detector",))
+STAGE_SECONDS = Histogram("radar_stage_seconds", "Pipeline stage handler duration", ("stage",))
+TELEGRAM_SECONDS = Histogram("radar_telegram_send_seconds", "Telegram send_message call")
+SHEETS_SECONDS = Histogram("radar_sheets_append_seconds", "Sheets append batch")
+STATE_SAVE_SECONDS = Histogram("radar_state_save_seconds", "State save (file / Sheets)")
+
+COINS = Counter("radar_coins_total", "Coins seen by discovery, by outcome", ("outcome",))
+SIGNALS = Counter("radar_signals_total", "Signals emitted", ("type",))
+COIN_ERRORS = Counter("radar_coin_errors_total", "Per-coin evaluation errors", ("stage",))
+QUEUE_DEPTH = Gauge("radar_queue_depth", "Pipeline stage / sink backlog", ("queue",))
+SINK_LAG_SECONDS = Gauge("radar_sink_lag_seconds", "Age of the oldest unwritten spool record", ("sink",))
+SCHEDULED = Gauge("radar_scheduled_coins", "Coins in the signal scheduler by tier", ("tier",))
+KLINES_CACHED = Gauge("radar_klines_cached", "Kline snapshots held in memory")
+HTTP_SECONDS = Histogram("radar_http_seconds", "Outbound HTTP latency", ("host", "endpoint"))
+HTTP_RESPONSES = Counter("radar_http_responses_total", "Outbound HTTP results (status code or error type)", ("host", "status"))
+HTTP_BYTES = Counter("radar_http_response_bytes_total", "Outbound HTTP response bytes", ("host",))
+HTTP_RATE_LIMIT = Gauge("radar_http_rate_limit", "Last seen rate-limit header value", ("host", "header"))
+ALERT_LATENCY_SECONDS = Histogram(
+    "radar_alert_latency_seconds",
+    "Bar close to alert delivery",
+    ("type", "exchange"),
+    buckets=(1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0, 300.0, 600.0, 900.0),
+)
+TELEGRAM_MESSAGES = Counter("radar_telegram_messages_total", "Telegram messages by result", ("result",))
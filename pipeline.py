@@ -0,0 +1,120 @@
+# pipeline.py
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from metrics import STAGE_SECONDS
+
+# =========================
+# Staged async pipeline
+# =========================
+# Каждая стадия: своя ограниченная очередь + N воркеров.
+# put() в полную очередь ждёт — медленная стадия (или sink за ней)
+# притормаживает только тех, кто её кормит, а не весь скан.
+# Размеры переопределяются env: PIPE_<STAGE>_CONCURRENCY / PIPE_<STAGE>_QUEUE.
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[None]],
+        concurrency: int,
+        maxsize: int,
+    ):
+        env = name.upper()
+        self.name = name
+        self.handler = handler
+        self.concurrency = int(os.getenv(f"PIPE_{env}_CONCURRENCY", str(concurrency)))
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=int(os.getenv(f"PIPE_{env}_QUEUE", str(maxsize))))
+
+        self.started_at = time.time()
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0
+        self.busy_sec = 0.0
+        # сколько раз put() упёрся в полную очередь
+        self.blocked = 0
+
+    async def put(self, item: Any) -> None:
+        if self.queue.full():
+            self.blocked += 1
+        await self.queue.put(item)
+
+    async def join(self) -> None:
+        await self.queue.join()
+
+    def start(self) -> List[asyncio.Task]:
+        return [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self.queue.get()
+            self.busy += 1
+            t0 = time.perf_counter()
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # обработчики сами репортят ошибки монеты; сюда — только неожиданное
+                self.errors += 1
+                print(f"⚠️ STAGE {self.name} ERROR:", repr(e), flush=True)
+            finally:
+                dt = time.perf_counter() - t0
+                self.busy -= 1
+                self.busy_sec += dt
+                STAGE_SECONDS.observe(dt, stage=self.name)
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = max(1e-9, time.time() - self.started_at)
+        return {
+            "depth": self.queue.qsize(),
+            "maxsize": self.queue.maxsize,
+            "concurrency": self.concurrency,
+            "busy": self.busy,
+            "processed": self.processed,
+            "errors": self.errors,
+            "blocked": self.blocked,
+            "per_min": round(self.processed / uptime * 60.0, 2),
+            "busy_sec": round(self.busy_sec, 3),
+        }
+
+
+class Pipeline:
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def add(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[None]],
+        concurrency: int = 1,
+        maxsize: int = 100,
+    ) -> Stage:
+        stage = self.stages[name] = Stage(name, handler, concurrency, maxsize)
+        return stage
+
+    def __getitem__(self, name: str) -> Stage:
+        return self.stages[name]
+
+    def start(self) -> List[asyncio.Task]:
+        tasks: List[asyncio.Task] = []
+        for stage in self.stages.values():
+            tasks.extend(stage.start())
+        return tasks
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    def summary(self) -> str:
+        """
+        Одна строка для лога: stage=depth/maxsize busy processed.
+        """
+        return " ".join(
+            f"{name}={s['depth']}/{s['maxsize']} busy={s['busy']} done={s['processed']}"
+            for name, s in self.stats().items()
+        )
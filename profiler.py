@@ -0,0 +1,218 @@
+# profiler.py
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import thread as _futures_thread
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from state import STATE_DIR
+
+# =========================
+# On-demand scan profiling
+# =========================
+# POST /debug/profile?scans=N&mode=sample|cprofile — следующие N проходов
+# профилируются (проход — discovery scan_once + стадии candles / detect /
+# alert до следующего снимка CMC), результат — файл в PROFILE_DIR:
+#   sample   — семплер sys._current_frames() в своём потоке (loop + to_thread
+#              воркеры), collapsed stacks (.folded) для flamegraph.pl / speedscope;
+#   cprofile — cProfile на потоке loop'а, pstats (.prof) для snakeviz / pstats.
+# Не включён — scan() это одна проверка int.
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(STATE_DIR, "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SCANS = int(os.getenv("PROFILE_MAX_SCANS", "20"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "80"))
+
+MODES = ("sample", "cprofile")
+
+# потоки asyncio.to_thread (default executor) — "asyncio_N"
+_WORKER_THREAD_PREFIX = "asyncio_"
+# воркер ждёт задачу в своей очереди — простой, не семплируем
+_IDLE_WORKER_CODE = _futures_thread._worker.__code__
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler:
+    def __init__(self, interval_sec: float, loop_thread: int):
+        self.interval_sec = interval_sec
+        self.loop_thread = loop_thread
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scan-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_sec):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                name = names.get(tid, "")
+                if tid == self.loop_thread:
+                    name = "loop"
+                elif not name.startswith(_WORKER_THREAD_PREFIX) or frame.f_code is _IDLE_WORKER_CODE:
+                    continue
+
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+class ScanProfiler:
+    def __init__(self):
+        self.remaining = 0
+        self.mode = "sample"
+        self.scans = 0
+        self.armed_at = 0.0
+        self.scan_sec = 0.0
+        self._interval_sec = PROFILE_INTERVAL_MS / 1000.0
+
+        self._sampler: Optional[_Sampler] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+        # внутри scan() — disarm() не трогает сборщики
+        self._running = False
+
+        self.last: Optional[Dict[str, Any]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.remaining > 0
+
+    def arm(self, scans: int, mode: str = "sample", interval_ms: float = PROFILE_INTERVAL_MS) -> Dict[str, Any]:
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        if self.active:
+            raise RuntimeError("profiling already armed")
+
+        self.mode = mode
+        self.remaining = max(1, min(int(scans), PROFILE_MAX_SCANS))
+        self.scans = 0
+        self.scan_sec = 0.0
+        self.armed_at = time.time()
+        self._interval_sec = max(0.001, float(interval_ms) / 1000.0)
+        return self.status()
+
+    def disarm(self) -> Dict[str, Any]:
+        """
+        Досрочно: то, что уже снято, всё равно пишется в файл.
+        """
+        if not self.active:
+            return self.status()
+
+        if self._running:
+            # проход идёт — его finally сам остановит сбор и запишет файл
+            self.remaining = 0
+            return self.status()
+
+        self.remaining = 0
+        if self._sampler is not None:
+            self._sampler.stop()
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.scans:
+            self._finish()
+        else:
+            self._sampler = self._cprofile = None
+        return self.status()
+
+    @contextmanager
+    def scan(self):
+        if self.remaining <= 0:
+            yield
+            return
+
+        if self.mode == "cprofile":
+            if self._cprofile is None:
+                self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        else:
+            if self._sampler is None:
+                self._sampler = _Sampler(self._interval_sec, threading.get_ident())
+            self._sampler.start()
+
+        self._running = True
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._running = False
+            self.scan_sec += time.perf_counter() - t0
+            if self._cprofile is not None:
+                self._cprofile.disable()
+            if self._sampler is not None:
+                self._sampler.stop()
+
+            self.scans += 1
+            # disarm() во время прохода уже выставил 0
+            self.remaining = max(0, self.remaining - 1)
+            if self.remaining <= 0:
+                self._finish()
+
+    def _finish(self) -> None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        info: Dict[str, Any] = {
+            "mode": self.mode,
+            "scans": self.scans,
+            "scan_sec": round(self.scan_sec, 3),
+            "finished_at": time.time(),
+        }
+
+        try:
+            if self._cprofile is not None:
+                path = os.path.join(PROFILE_DIR, f"scan-{stamp}.prof")
+                self._cprofile.dump_stats(path)
+            elif self._sampler is not None:
+                path = os.path.join(PROFILE_DIR, f"scan-{stamp}.folded")
+                self._sampler.dump(path)
+                info["samples"] = self._sampler.samples
+            else:
+                raise RuntimeError("nothing collected")
+            info["path"] = path
+        except Exception as e:
+            info["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            self._sampler = self._cprofile = None
+
+        self.last = info
+        print(f"PROFILE DONE: {info}", flush=True)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "mode": self.mode if self.active else None,
+            "remaining": self.remaining,
+            "scans_done": self.scans if self.active else 0,
+            "last": self.last,
+        }
+
+
+PROFILER = ScanProfiler()
@@ -0,0 +1,56 @@
+# rate_limit.py
+import asyncio
+import time
+from collections import deque
+
+# =========================
+# Token bucket (async)
+# =========================
+# rate/burst — сглаживание, per_min — жёсткое окно "не больше N за 60с".
+# Используется Telegram outbox и бюджетами запросов к источникам данных.
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, per_min: int):
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1)
+        self.per_min = per_min
+        self.tokens = float(self.burst)
+        self.ts = time.monotonic()
+        self.sent: deque = deque()
+        self.blocked_until = 0.0
+
+    def _wait_time(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+
+        while self.sent and now - self.sent[0] >= 60:
+            self.sent.popleft()
+        if self.per_min and len(self.sent) >= self.per_min:
+            wait = max(wait, 60 - (now - self.sent[0]))
+        return wait
+
+    async def acquire(self) -> None:
+        while True:
+            wait = self._wait_time()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        self.tokens -= 1
+        self.sent.append(time.monotonic())
+
+    def block(self, sec: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + sec)
+
+    @classmethod
+    def per_minute(cls, rpm: int) -> "TokenBucket":
+        """
+        Бюджет "rpm запросов в минуту" без резких всплесков.
+        """
+        rpm = max(int(rpm), 1)
+        return cls(rate=rpm / 60.0, burst=max(1, rpm // 10), per_min=rpm)
@@ -0,0 +1,220 @@
+# scheduler.py
+import heapq
+import itertools
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from state import BotState
+
+# =========================
+# Tiered per-symbol scheduler
+# =========================
+# Каждая отслеживаемая монета получает свою частоту проверки по состоянию:
+#   HOT  — свежий crowd-сигнал / FIRST MOVE / высокая волатильность
+#   WARM — молодой листинг или EARLY LISTING, который только что появился на CEX
+#   COLD — всё остальное
+# Min-heap по времени следующей проверки: работаем только с теми, кому пора.
+SCHED_HOT_SEC = float(os.getenv("SCHED_HOT_SEC", "60"))
+SCHED_WARM_SEC = float(os.getenv("SCHED_WARM_SEC", "300"))
+SCHED_COLD_SEC = float(os.getenv("SCHED_COLD_SEC", "3600"))
+
+SCHED_HOT_WINDOW_SEC = float(os.getenv("SCHED_HOT_WINDOW_SEC", "1800"))
+SCHED_WARM_AGE_DAYS = float(os.getenv("SCHED_WARM_AGE_DAYS", "1"))
+SCHED_VOLATILE_PCT = float(os.getenv("SCHED_VOLATILE_PCT", "3.0"))
+
+# Проверки выровнены по закрытию 5m-свечи: просыпаемся через несколько секунд
+# после закрытия (+ jitter, чтобы не бить биржу всем списком в одну секунду)
+# и оцениваем только монеты, у которых уже есть новый закрытый бар.
+CANDLE_CLOSE_DELAY_SEC = float(os.getenv("CANDLE_CLOSE_DELAY_SEC", "3"))
+CANDLE_CLOSE_JITTER_SEC = float(os.getenv("CANDLE_CLOSE_JITTER_SEC", "4"))
+# бар ещё не появился на бирже — повторить через
+CANDLE_RETRY_SEC = float(os.getenv("CANDLE_RETRY_SEC", "5"))
+CANDLE_RETRY_MAX = int(os.getenv("CANDLE_RETRY_MAX", "6"))
+
+TF_SEC = {"5m": 300, "15m": 900}
+
+
+class SchedEntry:
+    __slots__ = ("cid", "symbol", "trading", "due", "volatility", "tier", "last_bar", "retries")
+
+    def __init__(self, cid: int, symbol: str, trading: Dict[str, Any]):
+        self.cid = cid
+        self.symbol = symbol
+        self.trading = trading
+        self.due = 0.0
+        self.volatility = 0.0
+        self.tier = "NEW"
+        # open ts последнего оценённого закрытого 5m-бара
+        self.last_bar = 0.0
+        self.retries = 0
+
+
+# ---------- candle clock ----------
+def bar_ts(c: Dict[str, Any]) -> float:
+    """
+    Время открытия бара в секундах (Binance: "ts" в с, Bybit: "t" в мс).
+    """
+    if "ts" in c:
+        return float(c["ts"])
+    return float(c.get("t") or 0) / 1000.0
+
+
+def last_close(tf: str, now: Optional[float] = None) -> float:
+    now = time.time() if now is None else now
+    step = TF_SEC[tf]
+    return (now // step) * step
+
+
+def closed_bars(candles: List[Dict[str, Any]], tf: str, now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Без текущего (ещё не закрытого) бара.
+    """
+    if not candles:
+        return candles
+    cutoff = last_close(tf, now)
+    n = len(candles)
+    while n and bar_ts(candles[n - 1]) + TF_SEC[tf] > cutoff:
+        n -= 1
+    return candles if n == len(candles) else candles[:n]
+
+
+def aligned_due(now: float, cadence: float, tf: str = "5m") -> float:
+    """
+    Последнее закрытие бара tf не позже now + cadence (но строго после now)
+    + задержка на публикацию бара биржей + jitter. Оценка и так идёт сразу
+    после закрытия, поэтому интервал между проверками ≈ cadence.
+    """
+    step = TF_SEC[tf]
+    close = ((now + cadence) // step) * step
+    if close <= now:
+        close += step
+    return close + CANDLE_CLOSE_DELAY_SEC + random.uniform(0, CANDLE_CLOSE_JITTER_SEC)
+
+
+def candle_volatility_pct(candles: List[Dict[str, Any]], last_n: int = 3) -> float:
+    """
+    Диапазон последних N свечей в % от последнего close.
+    """
+    if not candles:
+        return 0.0
+    chunk = candles[-last_n:]
+    try:
+        hi = max(float(c.get("high", c.get("h"))) for c in chunk)
+        lo = min(float(c.get("low", c.get("l"))) for c in chunk)
+        close = float(chunk[-1].get("close", chunk[-1].get("c")))
+    except Exception:
+        return 0.0
+    if close <= 0:
+        return 0.0
+    return (hi - lo) / close * 100.0
+
+
+class SymbolScheduler:
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self.entries: Dict[int, SchedEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # ---------- membership ----------
+    def upsert(self, cid: int, symbol: str, trading: Dict[str, Any]) -> None:
+        e = self.entries.get(cid)
+        if e is None:
+            e = self.entries[cid] = SchedEntry(cid, symbol, trading)
+            self._push(e, time.time())
+        else:
+            e.symbol = symbol
+            e.trading = trading
+
+    def retain(self, cids) -> int:
+        """
+        Оставляем только монеты из последнего discovery; остальные выпали
+        из CMC-листинга или фильтров. Возвращает сколько убрали.
+        """
+        gone = [cid for cid in self.entries if cid not in cids]
+        for cid in gone:
+            del self.entries[cid]
+        return len(gone)
+
+    # ---------- heap ----------
+    def _push(self, e: SchedEntry, due: float) -> None:
+        e.due = due
+        heapq.heappush(self._heap, (due, next(self._seq), e.cid))
+
+    def pop_due(self, now: Optional[float] = None) -> List[SchedEntry]:
+        now = time.time() if now is None else now
+        out = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, cid = heapq.heappop(self._heap)
+            e = self.entries.get(cid)
+            # ленивое удаление: устаревшие записи heap просто пропускаем
+            if e is None or e.due != due:
+                continue
+            out.append(e)
+        return out
+
+    def next_due(self) -> Optional[float]:
+        while self._heap:
+            due, _, cid = self._heap[0]
+            e = self.entries.get(cid)
+            if e is not None and e.due == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def due_within(self, sec: float, now: Optional[float] = None) -> List[SchedEntry]:
+        """
+        Монеты, которым пора в ближайшие sec секунд (для прогрева свечей).
+        """
+        now = time.time() if now is None else now
+        return [e for e in self.entries.values() if e.due <= now + sec]
+
+    # ---------- cadence ----------
+    def cadence(self, e: SchedEntry, state: BotState, now: float) -> float:
+        cid = e.cid
+
+        crowd_ts = state.crowd_memory.get(cid, 0.0)
+        fm_ts = state.first_move_sent.get(cid, 0.0)
+        if now - max(crowd_ts, fm_ts) < SCHED_HOT_WINDOW_SEC or e.volatility >= SCHED_VOLATILE_PCT:
+            e.tier = "HOT"
+            return SCHED_HOT_SEC
+
+        added = state.coin_added.get(cid)
+        young = added is not None and now - added < SCHED_WARM_AGE_DAYS * 86400
+        if young or cid in state.early_sent:
+            e.tier = "WARM"
+            return SCHED_WARM_SEC
+
+        e.tier = "COLD"
+        return SCHED_COLD_SEC
+
+    def reschedule(self, e: SchedEntry, state: BotState, now: Optional[float] = None) -> None:
+        if e.cid not in self.entries:
+            return
+        now = time.time() if now is None else now
+        e.retries = 0
+        self._push(e, aligned_due(now, self.cadence(e, state, now)))
+
+    def retry_soon(self, e: SchedEntry, state: BotState, now: Optional[float] = None) -> None:
+        """
+        Нового бара ещё нет — заглянуть через CANDLE_RETRY_SEC
+        (после CANDLE_RETRY_MAX попыток — обычное расписание).
+        """
+        if e.cid not in self.entries:
+            return
+        now = time.time() if now is None else now
+        e.retries += 1
+        if e.retries > CANDLE_RETRY_MAX:
+            self.reschedule(e, state, now)
+            return
+        self._push(e, now + CANDLE_RETRY_SEC)
+
+    def tier_counts(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for e in self.entries.values():
+            out[e.tier] = out.get(e.tier, 0) + 1
+        return out
@@ -1,5 +1,5 @@
 import os
-import json
+import re
 import time
 from datetime import datetime, timezone
 from typing import Dict, Any, List
@@ -7,6 +7,10 @@ from typing import Dict, Any, List
 import gspread
 from google.oauth2.service_account import Credentials
 
+import http_stats
+from metrics import SHEETS_SECONDS
+from spool import Spool, drain_once, run_drainer
+
 
 # ===============================
 # helpers
@@ -34,12 +38,19 @@ class SheetsClient:
     Логика:
 
     Signals  -> только события (ULTRA / TRACK / FIRST_MOVE / CONFIRM_LIGHT)
-    State    -> хранит JSON состояния (одна строка)
+    State    -> вкладка состояния (чтение/запись — state.py, STATE_BACKEND=sheets)
 
     Таблица НЕ будет раздуваться.
     """
 
     MAX_ROWS = int(os.getenv("SHEETS_MAX_ROWS", "50000"))
+    KEEP_ARCHIVE_TABS = int(os.getenv("SHEETS_KEEP_ARCHIVE_TABS", "3"))
+    ROWS_RESYNC_EVERY = int(os.getenv("SHEETS_ROWS_RESYNC_EVERY", "50"))
+
+    BATCH_ROWS = int(os.getenv("SHEETS_BATCH_ROWS", "200"))
+    BATCH_SEC = float(os.getenv("SHEETS_BATCH_SEC", "10"))
+    # после аварии хвост spool уходит крупными батчами
+    REPLAY_BATCH_ROWS = int(os.getenv("SHEETS_REPLAY_BATCH_ROWS", "2000"))
 
     FIXED_HEADERS = [
         "detected_at",
@@ -61,6 +72,7 @@ class SheetsClient:
 
         creds = Credentials.from_service_account_info(service_account, scopes=scopes)
         self.gc = gspread.authorize(creds)
+        http_stats.instrument_session(self.gc.http_client.session)
         self.sh = self.gc.open_by_url(sheet_url)
 
         self.log_tab_name = log_tab_name or "Signals"
@@ -70,11 +82,14 @@ class SheetsClient:
         self.log_tab = self._get_or_create_ws(self.log_tab_name)
         self.state_tab = self._get_or_create_ws(self.state_tab_name)
 
-        self._buffer: List[Dict[str, Any]] = []
+        self.spool = Spool("sheets")
 
         self._ensure_log_headers()
         self._ensure_state_headers()
 
+        self._log_rows = self._count_log_rows()
+        self._appends = 0
+
     # ===============================
     # worksheets
     # ===============================
@@ -97,96 +112,143 @@ class SheetsClient:
             self.state_tab.append_row(["key", "json", "updated_at"])
 
     # ===============================
-    # LOG EVENTS
+    # LOG EVENTS (фоновый writer)
     # ===============================
+    # buffer_append только пишет строку в локальный spool — скан не ждёт
+    # Google API, а при его падении/рестарте бота строки не теряются.
+    # run_writer() в отдельной task собирает батчи (по размеру или по времени)
+    # и пишет их с экспоненциальным backoff + jitter.
     def buffer_append(self, row: Dict[str, Any]) -> None:
-        self._buffer.append(row)
-
-    def flush(self):
-
-        if not self._buffer:
-            return
-
-        values = []
-
-        for r in self._buffer:
-            values.append([
-                r.get("detected_at", ""),
-                r.get("cmc_id", ""),
-                r.get("symbol", ""),
-                r.get("name", ""),
-                r.get("age_days", ""),
-                r.get("market_cap_usd", ""),
-                r.get("volume24h_usd", ""),
-                r.get("status", ""),
-            ])
-
-        _safe(lambda: self.log_tab.append_rows(values, value_input_option="RAW"))
-
-        self._buffer.clear()
+        self.spool.append(row)
+
+    def queue_depth(self) -> int:
+        return self.spool.pending
+
+    def lag_sec(self) -> float:
+        """
+        Сколько секунд ждёт самая старая ещё не записанная строка.
+        """
+        return self.spool.lag_sec()
+
+    @staticmethod
+    def _row_values(r: Dict[str, Any]) -> List[Any]:
+        return [
+            r.get("detected_at", ""),
+            r.get("cmc_id", ""),
+            r.get("symbol", ""),
+            r.get("name", ""),
+            r.get("age_days", ""),
+            r.get("market_cap_usd", ""),
+            r.get("volume24h_usd", ""),
+            r.get("status", ""),
+        ]
 
+    def _append_sync(self, values: List[List[Any]]) -> None:
         # 🔥 авто-защита от переполнения
-        self._trim_if_needed()
-
-    def _trim_if_needed(self):
+        self._rotate_if_needed(len(values))
+
+        with SHEETS_SECONDS.time():
+            resp = self.log_tab.append_rows(values, value_input_option="RAW")
+        self._track_appended(resp, len(values))
+
+    def _deliver(self, rows: List[Dict[str, Any]]) -> int:
+        self._append_sync([self._row_values(r) for r in rows])
+        return len(rows)
+
+    async def run_writer(self) -> None:
+        await run_drainer(
+            self.spool,
+            self._deliver,
+            batch_max=self.REPLAY_BATCH_ROWS,
+            batch_min=self.BATCH_ROWS,
+            max_wait_sec=self.BATCH_SEC,
+        )
+
+    async def flush(self) -> None:
+        """
+        Дописать всё, что есть в spool, прямо сейчас (shutdown).
+        Если API недоступен — строки остаются в spool до следующего запуска.
+        """
+        while self.spool.pending:
+            if not await drain_once(self.spool, self._deliver, self.REPLAY_BATCH_ROWS):
+                return
 
+    # ===============================
+    # ROW COUNT + ROTATION
+    # ===============================
+    # Количество строк в лог-вкладке считаем локально (по updatedRange из
+    # ответа append_rows), а не через col_values() после каждого flush.
+    # Когда вкладка заполнена — она переименовывается в "<name> YYYY-MM-DD"
+    # и создаётся новая пустая: ничего не удаляется и не сдвигается.
+    def _count_log_rows(self) -> int:
+        return len(self.log_tab.col_values(1))
+
+    def _track_appended(self, resp: Any, count: int) -> None:
         try:
-            total_rows = len(self.log_tab.col_values(1))
+            rng = resp["updates"]["updatedRange"]  # "Signals!A101:H105"
+            self._log_rows = int(re.search(r":[A-Z]+(\d+)$", rng).group(1))
         except Exception:
-            return
+            self._log_rows += count
 
-        if total_rows <= self.MAX_ROWS:
-            return
+        self._appends += 1
+        if self._appends % self.ROWS_RESYNC_EVERY == 0:
+            self._resync_rows()
 
-        remove_count = total_rows - self.MAX_ROWS
+    def _resync_rows(self) -> None:
+        """
+        Изредка сверяемся с gridProperties: если локальный счётчик больше
+        размера сетки (строки удаляли руками) — пересчитываем честно.
+        """
+        try:
+            meta = self.sh.fetch_sheet_metadata()
+            for sheet in meta.get("sheets", []):
+                props = sheet.get("properties") or {}
+                if props.get("sheetId") == self.log_tab.id:
+                    grid_rows = int((props.get("gridProperties") or {}).get("rowCount") or 0)
+                    if self._log_rows > grid_rows:
+                        self._log_rows = self._count_log_rows()
+                    return
+        except Exception as e:
+            print("⚠️ SHEETS ROWS RESYNC ERROR:", e, flush=True)
 
-        if remove_count <= 0:
+    def _rotate_if_needed(self, incoming: int) -> None:
+        # header + MAX_ROWS строк данных
+        if self._log_rows + incoming <= self.MAX_ROWS + 1:
             return
 
-        # удаляем старые строки, оставляя header
-        start = 2
-        end = 1 + remove_count
-
-        _safe(lambda: self.log_tab.delete_rows(start, end))
-
-    # ===============================
-    # STATE JSON
-    # ===============================
-    def load_state(self) -> Dict[str, Any]:
+        archive = f"{self.log_tab_name} {datetime.now(timezone.utc):%Y-%m-%d %H%M}"
+        old_tab = self.log_tab
+        old_tab.update_title(archive)
 
-        col_keys = self.state_tab.col_values(1)
-
-        for idx, k in enumerate(col_keys[1:], start=2):
-            if (k or "").strip() == self.state_key:
-                row = self.state_tab.row_values(idx)
-                raw = row[1] if len(row) > 1 else ""
+        try:
+            new_tab = self.sh.add_worksheet(title=self.log_tab_name, rows=1000, cols=30)
+        except Exception:
+            # новая вкладка не создалась — возвращаем старой имя, иначе все
+            # следующие append ушли бы в архив; ротация повторится со следующим батчем
+            try:
+                old_tab.update_title(self.log_tab_name)
+            except Exception as e:
+                # имя занято (вкладка всё же создалась) — берём её по имени
+                print("⚠️ SHEETS ROTATE ROLLBACK ERROR:", e, flush=True)
                 try:
-                    return json.loads(raw) if raw else {}
-                except Exception:
-                    return {}
-
-        return {}
-
-    def save_state(self, state: Dict[str, Any]):
-
-        st = dict(state)
-        st["__ts"] = float(time.time())
-
-        payload = json.dumps(st, ensure_ascii=False)
-
-        col_keys = self.state_tab.col_values(1)
-
-        for idx, k in enumerate(col_keys[1:], start=2):
-            if (k or "").strip() == self.state_key:
-                _safe(lambda: self.state_tab.update(
-                    f"B{idx}:C{idx}",
-                    [[payload, now_iso_utc()]]
-                ))
-                return
-
-        _safe(lambda: self.state_tab.append_row(
-            [self.state_key, payload, now_iso_utc()],
-            value_input_option="RAW"
-        ))
-
-
+                    self.log_tab = self.sh.worksheet(self.log_tab_name)
+                    self._ensure_log_headers()
+                    self._log_rows = self._count_log_rows()
+                except Exception as e2:
+                    print("⚠️ SHEETS ROTATE REFETCH ERROR:", e2, flush=True)
+            raise
+
+        self.log_tab = new_tab
+        self.log_tab.append_row(self.FIXED_HEADERS, value_input_option="RAW")
+        self._log_rows = 1
+
+        self._prune_archives()
+
+    def _prune_archives(self) -> None:
+        prefix = f"{self.log_tab_name} "
+        archives = sorted(
+            (ws for ws in self.sh.worksheets() if ws.title.startswith(prefix)),
+            key=lambda ws: ws.title,
+        )
+        for ws in archives[:max(0, len(archives) - self.KEEP_ARCHIVE_TABS)]:
+            _safe(lambda: self.sh.del_worksheet(ws))
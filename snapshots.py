@@ -0,0 +1,416 @@
+# snapshots.py
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from candles_binance import get_candles_5m as get_binance_5m, get_candles_15m as get_binance_15m
+from candles_bybit import get_candles_5m as get_bybit_5m, get_candles_15m as get_bybit_15m
+from coordination import UNCHANGED
+from depth import fetch_depth_binance, fetch_depth_bybit
+from funding_flow import FUNDING
+from detect_trading import EXCHANGES, fetch_instruments
+from liquidity import Book, fetch_book_binance, fetch_book_bybit
+from metrics import FETCH_SECONDS, KLINES_SECONDS
+from rate_limit import TokenBucket
+from scheduler import CANDLE_CLOSE_DELAY_SEC, TF_SEC, bar_ts, closed_bars, last_close
+
+# =========================
+# Shared data snapshots
+# =========================
+# У каждого источника свой цикл обновления и свой бюджет запросов:
+#   CMC listings      — раз в CMC_REFRESH_SEC (по умолчанию CHECK_INTERVAL_MIN)
+#   списки инструментов 7 бирж — раз в INSTRUMENTS_REFRESH_SEC
+#   book tickers      — bid/ask всех символов Binance / Bybit, раз в BOOK_TICKER_REFRESH_SEC
+#   funding / OI      — bulk Bybit linear + Binance premiumIndex, раз в FUNDING_REFRESH_SEC
+#   order book depth  — только для монет с готовым алертом, кэш DEPTH_MAX_AGE_SEC
+#   5m / 15m klines   — кэш с max-age на символ (и не старше последнего
+#                        закрытия бара) + прогрев сразу после закрытия 5m
+#                        для монет, которым пора по расписанию
+# Стадии скана читают последний снимок, а не ходят в API сами.
+INSTRUMENTS_REFRESH_SEC = float(os.getenv("INSTRUMENTS_REFRESH_SEC", "600"))
+INSTRUMENTS_READY_TIMEOUT_SEC = float(os.getenv("INSTRUMENTS_READY_TIMEOUT_SEC", "60"))
+BOOK_TICKER_REFRESH_SEC = float(os.getenv("BOOK_TICKER_REFRESH_SEC", "30"))
+# старше — спред не доверяем (refresh падает): book_for() отдаёт None
+BOOK_TICKER_MAX_AGE_SEC = float(os.getenv("BOOK_TICKER_MAX_AGE_SEC", str(BOOK_TICKER_REFRESH_SEC * 3)))
+FUNDING_REFRESH_SEC = float(os.getenv("FUNDING_REFRESH_SEC", "60"))
+
+KLINES_5M_MAX_AGE_SEC = float(os.getenv("KLINES_5M_MAX_AGE_SEC", "60"))
+KLINES_15M_MAX_AGE_SEC = float(os.getenv("KLINES_15M_MAX_AGE_SEC", "300"))
+KLINES_PREWARM_AHEAD_SEC = float(os.getenv("KLINES_PREWARM_AHEAD_SEC", "10"))
+
+CMC_RPM = int(os.getenv("CMC_RPM", "10"))
+INSTRUMENTS_RPM = int(os.getenv("INSTRUMENTS_RPM", "20"))
+BOOK_TICKER_RPM = int(os.getenv("BOOK_TICKER_RPM", "12"))
+FUNDING_RPM = int(os.getenv("FUNDING_RPM", "6"))
+BINANCE_KLINES_RPM = int(os.getenv("BINANCE_KLINES_RPM", "600"))
+BYBIT_KLINES_RPM = int(os.getenv("BYBIT_KLINES_RPM", "300"))
+
+DEPTH_MAX_AGE_SEC = float(os.getenv("DEPTH_MAX_AGE_SEC", "10"))
+BINANCE_DEPTH_RPM = int(os.getenv("BINANCE_DEPTH_RPM", "120"))
+BYBIT_DEPTH_RPM = int(os.getenv("BYBIT_DEPTH_RPM", "120"))
+
+KLINE_FETCHERS = {
+    ("binance", "5m"): get_binance_5m,
+    ("binance", "15m"): get_binance_15m,
+    ("bybit", "5m"): get_bybit_5m,
+    ("bybit", "15m"): get_bybit_15m,
+}
+
+DEPTH_FETCHERS = {
+    "binance": fetch_depth_binance,
+    "bybit": fetch_depth_bybit,
+}
+
+BOOK_FETCHERS = {
+    "binance": fetch_book_binance,
+    "bybit": fetch_book_bybit,
+}
+
+KLINE_MAX_AGE = {
+    "5m": KLINES_5M_MAX_AGE_SEC,
+    "15m": KLINES_15M_MAX_AGE_SEC,
+}
+
+
+class Snapshot:
+    """
+    Последнее значение источника + версия (для ожидания следующего).
+    """
+
+    __slots__ = ("name", "value", "updated_at", "version", "fetches", "errors", "_event")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value: Any = None
+        self.updated_at = 0.0
+        self.version = 0
+        self.fetches = 0
+        self.errors = 0
+        self._event = asyncio.Event()
+
+    def publish(self, value: Any) -> None:
+        self.value = value
+        self.updated_at = time.time()
+        self.version += 1
+        self._event.set()
+        self._event = asyncio.Event()
+
+    def touch(self) -> None:
+        """
+        Источник подтвердил, что значение актуально: возраст сбрасывается,
+        версия — нет (ждущие wait_newer не просыпаются).
+        """
+        self.updated_at = time.time()
+
+    def age(self) -> float:
+        return float("inf") if not self.version else time.time() - self.updated_at
+
+    async def wait_newer(self, version: int) -> Tuple[Any, int]:
+        while self.version <= version:
+            await self._event.wait()
+        return self.value, self.version
+
+
+def snapshot_status(snap: Snapshot) -> Dict[str, Any]:
+    age = snap.age()
+    return {
+        "age_sec": None if age == float("inf") else round(age, 1),
+        "size": len(snap.value) if snap.value is not None else None,
+        "version": snap.version,
+        "fetches": snap.fetches,
+        "errors": snap.errors,
+    }
+
+
+async def refresh_loop(
+    snap: Snapshot,
+    fetch: Callable[[], Any],
+    interval: float,
+    bucket: TokenBucket,
+) -> None:
+    while True:
+        await bucket.acquire()
+        snap.fetches += 1
+        try:
+            with FETCH_SECONDS.time(source=snap.name):
+                value = await asyncio.to_thread(fetch)
+        except Exception as e:
+            value = None
+            print(f"⚠️ SNAPSHOT {snap.name} ERROR:", e, flush=True)
+
+        if value is None:
+            snap.errors += 1
+        elif value is UNCHANGED:
+            snap.touch()
+        else:
+            snap.publish(value)
+
+        await asyncio.sleep(interval)
+
+
+class KlineStore:
+    """
+    (exchange, symbol, tf) -> Snapshot со свечами.
+    get() отдаёт свежий снимок; если он старше max-age — один запрос
+    (параллельные get() того же ключа ждут его же) через бюджет биржи.
+    """
+
+    def __init__(self):
+        self._snaps: Dict[Tuple[str, str, str], Snapshot] = {}
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        self.buckets = {
+            "binance": TokenBucket.per_minute(BINANCE_KLINES_RPM),
+            "bybit": TokenBucket.per_minute(BYBIT_KLINES_RPM),
+        }
+        # exchange -> счётчики запросов свечей (для /status)
+        self.fetches = {ex: 0 for ex in self.buckets}
+        self.errors = {ex: 0 for ex in self.buckets}
+
+    def peek(self, exchange: str, symbol: str, tf: str) -> Optional[Snapshot]:
+        return self._snaps.get((exchange, symbol.upper(), tf))
+
+    async def get(self, exchange: str, symbol: str, tf: str) -> List[Dict[str, Any]]:
+        key = (exchange, symbol.upper(), tf)
+        snap = self._snaps.get(key)
+        if snap is not None and self._fresh(snap, tf):
+            return snap.value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._refresh(key, symbol))
+        await asyncio.shield(task)
+
+        snap = self._snaps.get(key)
+        return snap.value if snap is not None and snap.value is not None else []
+
+    @staticmethod
+    def _fresh(snap: Snapshot, tf: str) -> bool:
+        if snap.age() >= KLINE_MAX_AGE[tf]:
+            return False
+        now = time.time()
+        bars = closed_bars(snap.value, tf, now)
+        # пустой ответ (символа нет) — живёт max-age; иначе снимок должен
+        # содержать бар, закрывшийся последним
+        return not bars or bar_ts(bars[-1]) >= last_close(tf, now) - TF_SEC[tf]
+
+    async def _refresh(self, key: Tuple[str, str, str], symbol: str) -> None:
+        exchange, _, tf = key
+        snap = self._snaps.get(key)
+        if snap is None:
+            snap = self._snaps[key] = Snapshot(f"klines {exchange} {key[1]} {tf}")
+
+        try:
+            await self.buckets[exchange].acquire()
+            snap.fetches += 1
+            self.fetches[exchange] += 1
+            with KLINES_SECONDS.time(exchange=exchange, tf=tf):
+                candles = await asyncio.to_thread(KLINE_FETCHERS[(exchange, tf)], symbol)
+            snap.publish(candles or [])
+        except Exception as e:
+            # остаётся предыдущий снимок (если был)
+            snap.errors += 1
+            self.errors[exchange] += 1
+            print(f"⚠️ KLINES {exchange} {symbol} {tf} ERROR:", e, flush=True)
+        finally:
+            self._inflight.pop(key, None)
+
+    def retain(self, symbols: Set[str]) -> None:
+        for key in [k for k in self._snaps if k[1] not in symbols]:
+            del self._snaps[key]
+
+    def __len__(self) -> int:
+        return len(self._snaps)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "cached": len(self._snaps),
+            "inflight": len(self._inflight),
+            "exchanges": {
+                ex: {"fetches": self.fetches[ex], "errors": self.errors[ex]}
+                for ex in self.buckets
+            },
+        }
+
+
+class DepthStore:
+    """
+    (exchange, symbol) -> Snapshot стакана, живёт DEPTH_MAX_AGE_SEC.
+    Параллельные get() одного ключа ждут один запрос (как KlineStore).
+    """
+
+    def __init__(self):
+        self._snaps: Dict[Tuple[str, str], Snapshot] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.buckets = {
+            "binance": TokenBucket.per_minute(BINANCE_DEPTH_RPM),
+            "bybit": TokenBucket.per_minute(BYBIT_DEPTH_RPM),
+        }
+        self.fetches = {ex: 0 for ex in self.buckets}
+        self.errors = {ex: 0 for ex in self.buckets}
+
+    async def get(self, exchange: str, symbol: str) -> Optional[Dict[str, Any]]:
+        key = (exchange, symbol.upper())
+        snap = self._snaps.get(key)
+        if snap is None or snap.age() >= DEPTH_MAX_AGE_SEC:
+            task = self._inflight.get(key)
+            if task is None:
+                task = self._inflight[key] = asyncio.create_task(self._refresh(key, symbol))
+            await asyncio.shield(task)
+            snap = self._snaps.get(key)
+
+        # старше max-age не отдаём: стакан после ошибки — хуже, чем ничего
+        if snap is None or snap.value is None or snap.age() >= DEPTH_MAX_AGE_SEC:
+            return None
+        return snap.value
+
+    async def _refresh(self, key: Tuple[str, str], symbol: str) -> None:
+        exchange = key[0]
+        snap = self._snaps.get(key)
+        if snap is None:
+            snap = self._snaps[key] = Snapshot(f"depth {exchange} {key[1]}")
+
+        try:
+            await self.buckets[exchange].acquire()
+            snap.fetches += 1
+            self.fetches[exchange] += 1
+            with FETCH_SECONDS.time(source=f"depth {exchange}"):
+                snap.publish(await asyncio.to_thread(DEPTH_FETCHERS[exchange], symbol))
+        except Exception as e:
+            snap.errors += 1
+            self.errors[exchange] += 1
+            print(f"⚠️ DEPTH {exchange} {symbol} ERROR:", e, flush=True)
+        finally:
+            self._inflight.pop(key, None)
+
+    def retain(self, symbols: Set[str]) -> None:
+        for key in [k for k in self._snaps if k[1] not in symbols]:
+            del self._snaps[key]
+
+    def __len__(self) -> int:
+        return len(self._snaps)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "cached": len(self._snaps),
+            "exchanges": {
+                ex: {"fetches": self.fetches[ex], "errors": self.errors[ex]}
+                for ex in self.buckets
+            },
+        }
+
+
+class DataHub:
+    def __init__(self, cmc, cmc_limit: int, cmc_refresh_sec: float, coord=None):
+        self.cmc = cmc
+        # при нескольких воркерах CMC / списки инструментов тянет только лидер
+        self.coord = coord
+        self.cmc_limit = cmc_limit
+        self.cmc_refresh_sec = cmc_refresh_sec
+
+        self.listings = Snapshot("cmc listings")
+        self.instruments: Dict[str, Snapshot] = {ex: Snapshot(f"instruments {ex}") for ex in EXCHANGES}
+        self.book: Dict[str, Snapshot] = {ex: Snapshot(f"book {ex}") for ex in BOOK_FETCHERS}
+        # значение — число символов по биржам; сами ряды в funding_flow.FUNDING
+        self.funding = Snapshot("funding")
+        self.klines = KlineStore()
+        self.depth = DepthStore()
+
+        self._cmc_bucket = TokenBucket.per_minute(CMC_RPM)
+        self._instruments_bucket = TokenBucket.per_minute(INSTRUMENTS_RPM)
+        self._book_bucket = TokenBucket.per_minute(BOOK_TICKER_RPM)
+        self._funding_bucket = TokenBucket.per_minute(FUNDING_RPM)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "listings": snapshot_status(self.listings),
+            "instruments": {ex: snapshot_status(s) for ex, s in self.instruments.items()},
+            "book": {ex: snapshot_status(s) for ex, s in self.book.items()},
+            "funding": snapshot_status(self.funding),
+            "klines": self.klines.status(),
+            "depth": self.depth.status(),
+        }
+
+    def book_for(self, market: str) -> Optional[Book]:
+        """
+        Снимок bid/ask ("BINANCE" / "bybit" ...); None — ещё не загружен
+        или старше BOOK_TICKER_MAX_AGE_SEC.
+        """
+        snap = self.book.get((market or "").lower())
+        if snap is None or snap.age() > BOOK_TICKER_MAX_AGE_SEC:
+            return None
+        return snap.value
+
+    def instruments_for(self, exchange: str) -> Optional[Set[str]]:
+        return self.instruments[exchange].value
+
+    async def instruments_ready(self) -> None:
+        """
+        Ждём первый снимок всех бирж (но не дольше таймаута — упавшая
+        биржа не должна блокировать discovery).
+        """
+        pending = [
+            asyncio.ensure_future(s.wait_newer(0))
+            for s in self.instruments.values()
+            if not s.version
+        ]
+        if pending:
+            _, late = await asyncio.wait(pending, timeout=INSTRUMENTS_READY_TIMEOUT_SEC)
+            for f in late:
+                f.cancel()
+
+    def tasks(self, due_soon: Callable[[float], List[Tuple[str, str]]]) -> List[asyncio.Task]:
+        out = [
+            asyncio.create_task(refresh_loop(
+                self.listings,
+                self._singleton("cmc_listings", lambda: self.cmc.fetch_recent_listings(limit=self.cmc_limit)),
+                self.cmc_refresh_sec,
+                self._cmc_bucket,
+            )),
+            asyncio.create_task(self._prewarm_loop(due_soon)),
+        ]
+        for ex, snap in self.instruments.items():
+            out.append(asyncio.create_task(refresh_loop(
+                snap,
+                self._singleton(f"instruments:{ex}", lambda ex=ex: fetch_instruments(ex), encode=sorted, decode=set),
+                INSTRUMENTS_REFRESH_SEC,
+                self._instruments_bucket,
+            )))
+        # bid/ask — каждый воркер сам: 2-3 лёгких запроса за интервал
+        for ex, snap in self.book.items():
+            out.append(asyncio.create_task(refresh_loop(
+                snap,
+                BOOK_FETCHERS[ex],
+                BOOK_TICKER_REFRESH_SEC,
+                self._book_bucket,
+            )))
+        # ряды funding / OI копятся в памяти процесса — тоже без singleton
+        out.append(asyncio.create_task(refresh_loop(
+            self.funding,
+            FUNDING.refresh,
+            FUNDING_REFRESH_SEC,
+            self._funding_bucket,
+        )))
+        return out
+
+    def _singleton(self, name: str, fetch: Callable[[], Any], **codec) -> Callable[[], Any]:
+        if self.coord is None:
+            return fetch
+        return self.coord.singleton(name, fetch, **codec)
+
+    async def _prewarm_loop(self, due_soon: Callable[[float], List[Tuple[str, str]]]) -> None:
+        """
+        Через CANDLE_CLOSE_DELAY_SEC после каждого закрытия 5m грузим свечи
+        монет, которым пора в этом окне, — к моменту оценки они уже в снимке.
+        """
+        while True:
+            wake = last_close("5m") + TF_SEC["5m"] + CANDLE_CLOSE_DELAY_SEC
+            await asyncio.sleep(max(0.0, wake - time.time()))
+
+            jobs = [
+                self.klines.get(exchange, symbol, tf)
+                for exchange, symbol in due_soon(KLINES_PREWARM_AHEAD_SEC)
+                for tf in ("5m", "15m")
+            ]
+            if jobs:
+                await asyncio.gather(*jobs, return_exceptions=True)
@@ -0,0 +1,315 @@
+# spool.py
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from coordination import worker_slot
+from state import STATE_DIR
+
+# =========================
+# Offline spool
+# =========================
+# Всё, что уходит наружу (Sheets / confirm-entry), сначала пишется сюда:
+# append-only сегменты JSONL в STATE_DIR/spool/<sink>/.
+# Drainer вычитывает их батчами и подтверждает (ack) только доставленное,
+# поэтому падение API или рестарт бота не теряют ни одной строки.
+SPOOL_DIR = os.path.join(STATE_DIR, "spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+SPOOL_MAX_SEGMENTS = int(os.getenv("SPOOL_MAX_SEGMENTS", "64"))
+SPOOL_FSYNC = os.getenv("SPOOL_FSYNC", "0") == "1"
+
+SPOOL_POLL_SEC = float(os.getenv("SPOOL_POLL_SEC", "1"))
+SPOOL_BACKOFF_BASE_SEC = float(os.getenv("SPOOL_BACKOFF_BASE_SEC", "2"))
+SPOOL_BACKOFF_MAX_SEC = float(os.getenv("SPOOL_BACKOFF_MAX_SEC", "120"))
+
+
+class Spool:
+    """
+    Сегменты: 000000000001.jsonl, 000000000002.jsonl, ...
+    Прогресс чтения самого старого сегмента — байтовый offset в <seq>.ack.
+    Строка: {"ts": <enqueue ts>, "data": <record>}
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # при нескольких воркерах у каждого слота свой каталог (см. coordination.py)
+        self.dir = os.path.join(SPOOL_DIR, worker_slot(), name)
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._segments: List[int] = sorted(
+            int(f[:-6]) for f in os.listdir(self.dir) if f.endswith(".jsonl") and f[:-6].isdigit()
+        )
+        self._offset = self._read_ack(self._segments[0]) if self._segments else 0
+
+        # (end_offset, ts, data) — то, что отдали в peek() и ещё не подтвердили
+        self._peeked: List[Tuple[int, float, Any]] = []
+        # батч drain_once, который сейчас доставляется в потоке: пока он не
+        # подтверждён, peek / cap-drop не трогают _peeked и голову очереди
+        self.inflight: Optional[asyncio.Future] = None
+
+        self._fh = None
+        self._active: Optional[int] = None
+
+        self.pending = self._count_pending()
+        self.dropped = 0
+        self.delivered = 0
+        self.errors = 0
+
+    # ---------- files ----------
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.dir, f"{seq:012d}.jsonl")
+
+    def _ack_path(self, seq: int) -> str:
+        return os.path.join(self.dir, f"{seq:012d}.ack")
+
+    def _read_ack(self, seq: int) -> int:
+        try:
+            with open(self._ack_path(seq), "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except Exception:
+            return 0
+
+    def _write_ack(self, seq: int, offset: int) -> None:
+        tmp = self._ack_path(seq) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+        os.replace(tmp, self._ack_path(seq))
+
+    def _remove(self, seq: int) -> None:
+        for p in (self._path(seq), self._ack_path(seq)):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def _count_pending(self) -> int:
+        total = 0
+        for i, seq in enumerate(self._segments):
+            try:
+                with open(self._path(seq), "rb") as f:
+                    if i == 0:
+                        f.seek(self._offset)
+                    total += sum(1 for line in f if line.endswith(b"\n"))
+            except FileNotFoundError:
+                pass
+        return total
+
+    # ---------- write ----------
+    def _roll(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+        # после рестарта всегда новый сегмент: хвост старого мог оборваться
+        seq = (self._segments[-1] + 1) if self._segments else 1
+        self._segments.append(seq)
+        self._active = seq
+        self._fh = open(self._path(seq), "ab")
+
+    def append(self, data: Any, ts: Optional[float] = None) -> None:
+        if self._fh is None or self._fh.tell() >= SPOOL_SEGMENT_BYTES:
+            self._roll()
+
+        line = json.dumps(
+            {"ts": float(time.time() if ts is None else ts), "data": data},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        self._fh.write(line.encode("utf-8") + b"\n")
+        self._fh.flush()
+        if SPOOL_FSYNC:
+            os.fsync(self._fh.fileno())
+
+        self.pending += 1
+        self._enforce_cap()
+
+    def _enforce_cap(self) -> None:
+        # диск не бесконечный: при очень долгой аварии выкидываем самые старые сегменты
+        # (батч в доставке — позже: его ack указывает в голову очереди)
+        if self.inflight is not None:
+            return
+        while len(self._segments) > SPOOL_MAX_SEGMENTS and self._segments[0] != self._active:
+            seq = self._segments.pop(0)
+            with open(self._path(seq), "rb") as f:
+                f.seek(self._offset)
+                lost = sum(1 for line in f if line.endswith(b"\n"))
+            self._remove(seq)
+            self.pending -= lost
+            self.dropped += lost
+            self._offset = self._read_ack(self._segments[0]) if self._segments else 0
+            self._peeked = []
+            print(f"⚠️ SPOOL {self.name}: dropped {lost} old records (cap)", flush=True)
+
+    # ---------- read ----------
+    def peek(self, n: int) -> List[Tuple[float, Any]]:
+        """
+        До n записей из самого старого сегмента (без подтверждения).
+        """
+        if self.inflight is not None:
+            raise RuntimeError(f"spool {self.name}: batch in flight")
+        self._peeked = []
+        while self._segments and not self._peeked:
+            seq = self._segments[0]
+            try:
+                with open(self._path(seq), "rb") as f:
+                    f.seek(self._offset)
+                    while len(self._peeked) < n:
+                        line = f.readline()
+                        if not line.endswith(b"\n"):
+                            break
+                        try:
+                            rec = json.loads(line)
+                            self._peeked.append((f.tell(), float(rec.get("ts") or 0.0), rec.get("data")))
+                        except Exception:
+                            if self._peeked:
+                                break
+                            # битая строка в начале — просто пропускаем
+                            self._offset = f.tell()
+                            self.pending -= 1
+            except FileNotFoundError:
+                pass
+
+            if self._peeked or seq == self._active:
+                break
+
+            # старый сегмент вычитан до конца (или оборван) — удаляем
+            self._segments.pop(0)
+            self._remove(seq)
+            self._offset = self._read_ack(self._segments[0]) if self._segments else 0
+
+        return [(ts, data) for _, ts, data in self._peeked]
+
+    def ack(self, n: int) -> None:
+        if n <= 0 or not self._peeked:
+            return
+
+        n = min(n, len(self._peeked))
+        seq = self._segments[0]
+        self._offset = self._peeked[n - 1][0]
+        self._peeked = self._peeked[n:]
+        self.pending -= n
+        self.delivered += n
+
+        if seq == self._active and self._offset >= self._fh.tell():
+            # активный сегмент вычитан целиком — закрываем, следующий append откроет новый
+            self._fh.close()
+            self._fh = None
+            self._active = None
+            self._segments.pop(0)
+            self._remove(seq)
+            self._offset = 0
+        else:
+            self._write_ack(seq, self._offset)
+
+    def oldest_ts(self) -> Optional[float]:
+        """
+        ts головы очереди — только чтение: _peeked и offset'ы не меняются.
+        """
+        if not self.pending:
+            return None
+        if self._peeked:
+            return self._peeked[0][1]
+
+        for i, seq in enumerate(self._segments):
+            try:
+                with open(self._path(seq), "rb") as f:
+                    if i == 0:
+                        f.seek(self._offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        try:
+                            return float(json.loads(line).get("ts") or 0.0)
+                        except Exception:
+                            continue
+            except FileNotFoundError:
+                pass
+        return None
+
+    def lag_sec(self) -> float:
+        ts = self.oldest_ts()
+        return 0.0 if ts is None else max(0.0, time.time() - ts)
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            self._active = None
+
+
+# =========================
+# Drainer
+# =========================
+async def drain_once(spool: Spool, deliver: Callable[[List[Any]], int], batch_max: int) -> int:
+    """
+    Один батч: deliver(records) (в потоке) возвращает, сколько записей
+    с начала батча доставлено; их и подтверждаем.
+    """
+    if spool.inflight is not None:
+        # батч прежнего (отменённого) drain'а ещё в потоке — ждём его ack
+        try:
+            await asyncio.shield(spool.inflight)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+
+    batch = spool.peek(batch_max)
+    if not batch:
+        return 0
+
+    # ack — в callback'е по завершении потока, а не после await: отмена
+    # drainer'а (shutdown) не останавливает поток, и доставленное всё равно
+    # подтверждается до следующего peek
+    fut = spool.inflight = asyncio.ensure_future(asyncio.to_thread(deliver, [data for _, data in batch]))
+    fut.add_done_callback(lambda f: _settle(spool, f, len(batch)))
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        return 0
+
+
+def _settle(spool: Spool, fut: asyncio.Future, size: int) -> None:
+    spool.inflight = None
+    if fut.cancelled():
+        return
+    e = fut.exception()
+    if e is not None:
+        spool.errors += 1
+        print(f"⚠️ SPOOL {spool.name} DELIVER ERROR:", e, flush=True)
+        return
+
+    n = fut.result()
+    spool.ack(n)
+    if n < size:
+        spool.errors += 1
+
+
+async def run_drainer(
+    spool: Spool,
+    deliver: Callable[[List[Any]], int],
+    batch_max: int,
+    batch_min: int = 1,
+    max_wait_sec: float = 0.0,
+) -> None:
+    """
+    Бесконечный drainer: ждёт batch_min записей (или max_wait_sec с самой
+    старой), отдаёт батчами до batch_max. При ошибке — экспоненциальный
+    backoff с jitter; после восстановления sink'а хвост уходит большими батчами.
+    """
+    delay = SPOOL_BACKOFF_BASE_SEC
+
+    while True:
+        if not spool.pending or (spool.pending < batch_min and spool.lag_sec() < max_wait_sec):
+            await asyncio.sleep(SPOOL_POLL_SEC)
+            continue
+
+        if await drain_once(spool, deliver, batch_max):
+            delay = SPOOL_BACKOFF_BASE_SEC
+            continue
+
+        await asyncio.sleep(random.uniform(0, delay))
+        delay = min(delay * 2, SPOOL_BACKOFF_MAX_SEC)
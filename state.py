@@ -1,8 +1,19 @@
 # state.py
+import asyncio
+import base64
+import fcntl
+import itertools
 import json
 import os
+import re
+import threading
 import time
-from typing import Dict, Any, Set, Optional
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Set, Optional
+
+from metrics import STATE_SAVE_SECONDS
 
 # =========================
 # Backend selection
@@ -47,21 +58,44 @@ def _get_gspread_client():
         "https://www.googleapis.com/auth/drive",
     ]
     creds = Credentials.from_service_account_info(sa_dict, scopes=scopes)
-    return gspread.authorize(creds)
+    gc = gspread.authorize(creds)
+
+    import http_stats
+    http_stats.instrument_session(gc.http_client.session)
+    return gc
+
+
+# Кэш: worksheet + номер строки ключа.
+# Авторизация / open_by_url / проверка заголовка / поиск строки — один раз за процесс.
+_SHEETS_CACHE: Dict[str, Any] = {"ws": None, "row": None}
+
+
+def _reset_sheets_cache() -> None:
+    _SHEETS_CACHE["ws"] = None
+    _SHEETS_CACHE["row"] = None
 
 
 def _open_state_sheet():
+    ws = _SHEETS_CACHE["ws"]
+    if ws is not None:
+        return ws
+
     gc = _get_gspread_client()
     sh = gc.open_by_url(GOOGLE_SHEET_URL)
     ws = sh.worksheet(STATE_SHEET_TAB)
+    _ensure_state_header(ws)
+
+    _SHEETS_CACHE["ws"] = ws
     return ws
 
 
 def _ensure_state_header(ws):
     """
-    Ожидаем простую табличку:
+    Ожидаем простую табличку (совместимо с SheetsClient):
     A: key
-    B: json
+    B: json (первый кусок payload)
+    C: updated_at
+    D...: продолжение payload, если не влезло в одну ячейку
     """
     try:
         row1 = ws.row_values(1)
@@ -69,7 +103,7 @@ def _ensure_state_header(ws):
         row1 = []
 
     if len(row1) < 2 or (row1[0].strip().lower() != "key" or row1[1].strip().lower() != "json"):
-        ws.update("A1:B1", [["key", "json"]])
+        ws.update(values=[["key", "json", "updated_at"]], range_name="A1:C1")
 
 
 def _find_row_by_key(ws, key: str) -> Optional[int]:
@@ -83,36 +117,119 @@ def _find_row_by_key(ws, key: str) -> Optional[int]:
     return None
 
 
-def _sheets_load_state() -> Dict[str, Any]:
-    ws = _open_state_sheet()
-    _ensure_state_header(ws)
+def _state_row(ws) -> Optional[int]:
+    r = _SHEETS_CACHE["row"]
+    if r is None:
+        r = _find_row_by_key(ws, STATE_SHEET_KEY)
+        _SHEETS_CACHE["row"] = r
+    return r
 
-    r = _find_row_by_key(ws, STATE_SHEET_KEY)
-    if not r:
-        return {}
 
-    raw = ws.cell(r, 2).value or ""
-    raw = raw.strip()
-    if not raw:
+def _row_from_updated_range(resp: Any) -> Optional[int]:
+    """
+    "State!A5:E5" -> 5 (ответ append_row, чтобы не искать строку заново)
+    """
+    try:
+        rng = resp["updates"]["updatedRange"]
+    except Exception:
+        return None
+    m = re.search(r"![A-Z]+(\d+)", rng or "")
+    return int(m.group(1)) if m else None
+
+
+# =========================
+# Payload codec (zlib + base64, разбит на куски)
+# =========================
+# Лимит Google Sheets — 50 000 символов на ячейку, берём с запасом.
+STATE_SHEET_CHUNK = int(os.getenv("STATE_SHEET_CHUNK", "45000"))
+# "z2:<кусков>:" — число кусков в первой ячейке: хвост, не затёртый
+# после более длинного payload, при чтении не склеивается
+_PAYLOAD_PREFIX = "z2:"
+_PAYLOAD_PREFIX_V1 = "z1:"
+
+
+def encode_state_cells(state: Dict[str, Any]) -> List[str]:
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    body = base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+    chunks = [body[i:i + STATE_SHEET_CHUNK] for i in range(0, len(body), STATE_SHEET_CHUNK)] or [""]
+    chunks[0] = f"{_PAYLOAD_PREFIX}{len(chunks)}:" + chunks[0]
+    return chunks
+
+
+def decode_state_cells(cells: List[str]) -> Dict[str, Any]:
+    cells = [c or "" for c in cells]
+    head = cells[0].strip() if cells else ""
+    if not head:
         return {}
 
     try:
+        if head.startswith(_PAYLOAD_PREFIX):
+            n, first = head[len(_PAYLOAD_PREFIX):].split(":", 1)
+            body = first + "".join(c.strip() for c in cells[1:int(n)])
+            raw = zlib.decompress(base64.b64decode(body)).decode("utf-8")
+        else:
+            raw = "".join(c.strip() for c in cells)
+            if raw.startswith(_PAYLOAD_PREFIX_V1):
+                raw = zlib.decompress(base64.b64decode(raw[len(_PAYLOAD_PREFIX_V1):])).decode("utf-8")
+        # старый формат: обычный JSON в одной ячейке
         return json.loads(raw)
     except Exception:
         return {}
 
 
+def state_row_values(chunks: List[str], updated_at: str) -> List[str]:
+    """
+    Раскладка строки начиная с B: [chunk0, updated_at, chunk1, chunk2, ...]
+    """
+    return [chunks[0] if chunks else "", updated_at] + chunks[1:]
+
+
+def state_cells_from_row(row: List[str]) -> List[str]:
+    """
+    Обратно из row_values (с колонки A): B + D...
+    """
+    if len(row) < 2:
+        return []
+    return [row[1]] + row[3:]
+
+
+def _sheets_load_state() -> Dict[str, Any]:
+    ws = _open_state_sheet()
+
+    r = _state_row(ws)
+    if not r:
+        return {}
+
+    return decode_state_cells(state_cells_from_row(ws.row_values(r)))
+
+
 def _sheets_save_state(state: Dict[str, Any]) -> None:
+    from gspread.utils import rowcol_to_a1
+
     ws = _open_state_sheet()
-    _ensure_state_header(ws)
+    r = _state_row(ws)
 
-    r = _find_row_by_key(ws, STATE_SHEET_KEY)
-    payload = json.dumps(state, ensure_ascii=False)
+    chunks = encode_state_cells(state)
+    updated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    values = [STATE_SHEET_KEY] + state_row_values(chunks, updated_at)
 
-    if not r:
-        ws.append_row([STATE_SHEET_KEY, payload], value_input_option="RAW")
-    else:
-        ws.update_cell(r, 2, payload)
+    if len(values) > ws.col_count:
+        ws.add_cols(len(values) - ws.col_count)
+
+    try:
+        if not r:
+            resp = ws.append_row(values, value_input_option="RAW")
+            _SHEETS_CACHE["row"] = _row_from_updated_range(resp)
+        else:
+            # хвост от прошлого (более длинного) payload — пустыми ячейками до
+            # конца сетки, той же batched-записью всей строки: B{r}:<last col>{r}
+            values += [""] * (ws.col_count - len(values))
+            rng = f"B{r}:{rowcol_to_a1(r, len(values))}"
+            ws.update(values=[values[1:]], range_name=rng, value_input_option="RAW")
+    except Exception:
+        # строку могли сдвинуть/удалить руками — в следующий раз ищем заново
+        _reset_sheets_cache()
+        raise
 
 
 # =========================
@@ -134,24 +251,155 @@ def _file_save_state(state: Dict[str, Any]) -> None:
     os.replace(tmp, STATE_FILE)
 
 
+# =========================
+# Typed state (in-memory)
+# =========================
+_ID_SETS = ("seen", "tracked", "watch")
+
+# cid -> ts (float). В JSON ключи — строки, в памяти — int.
+_TS_MAPS = (
+    "ultra_lock",
+    "early_sent",
+    "first_move_sent",
+    "confirm_light_sent",
+    "crowd_memory",
+    "crowd_flow_sent",
+    "track_debug",
+    "liq_debug",
+    "coin_added",
+    "first_seen",
+)
+
+# при слиянии берётся меньший ts (первое появление), а не больший
+_EARLIEST_MAPS = ("first_seen",)
+
+
+def _ts_value(v: Any) -> float:
+    # значения бывают float ts или {"ts": ...} (старые track_debug / liq_debug)
+    if isinstance(v, dict):
+        v = v.get("ts")
+    try:
+        return float(v or 0.0)
+    except Exception:
+        return 0.0
+
+
+class BotState:
+    """
+    Состояние бота в памяти: множества id и int-ключевые мапы ts.
+    JSON (списки / строковые ключи) — только в from_dict / to_dict,
+    т.е. при загрузке и сохранении, а не на каждой проверке.
+    """
+
+    __slots__ = _ID_SETS + _TS_MAPS + ("startup_ts", "extra")
+
+    def __init__(self):
+        for name in _ID_SETS:
+            setattr(self, name, set())
+        for name in _TS_MAPS:
+            setattr(self, name, {})
+        self.startup_ts = 0.0
+        # неизвестные ключи (старые/чужие) сохраняем как есть
+        self.extra: Dict[str, Any] = {}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BotState":
+        st = cls()
+        for key, value in (data or {}).items():
+            try:
+                if key in _ID_SETS:
+                    setattr(st, key, {int(x) for x in value or []})
+                elif key in _TS_MAPS:
+                    setattr(st, key, {int(k): _ts_value(v) for k, v in (value or {}).items()})
+                elif key == "startup_ts":
+                    st.startup_ts = float(value or 0.0)
+                else:
+                    st.extra[key] = value
+            except Exception:
+                st.extra[key] = value
+        return st
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.extra)
+        for name in _ID_SETS:
+            out[name] = sorted(getattr(self, name))
+        for name in _TS_MAPS:
+            out[name] = {str(k): v for k, v in getattr(self, name).items()}
+        out["startup_ts"] = self.startup_ts
+        return out
+
+
 # =========================
 # Public API (used by main.py)
 # =========================
-def load_state() -> Dict[str, Any]:
+def load_state() -> BotState:
     """
     Единственная точка входа: main.py делает from state import load_state
     """
+    return BotState.from_dict(_load_state_dict())
+
+
+def _load_state_dict() -> Dict[str, Any]:
     if _sheets_enabled():
         try:
             return _sheets_load_state()
         except Exception as e:
             print("⚠️ SHEETS LOAD ERROR:", e, flush=True)
-            return _file_load_state()
 
     return _file_load_state()
 
 
-def save_state(data: Dict[str, Any]) -> None:
+def save_state(state: BotState) -> None:
+    _save_state_dict(state.to_dict(), _next_generation())
+
+
+async def save_state_async(state: BotState) -> None:
+    """
+    Снимок берём на event loop (state никто не меняет посередине),
+    а запись (файл / Sheets API) — в отдельном потоке.
+    """
+    data = state.to_dict()
+    gen = _next_generation()
+    with STATE_SAVE_SECONDS.time():
+        if _SHARED_MAX_AGE_DAYS is None:
+            await asyncio.to_thread(_save_state_dict, data, gen)
+            return
+
+        # чужие отметки, слитые при записи, — и в нашу копию в памяти
+        merged = await asyncio.to_thread(_save_shared_state, data, gen)
+    if merged is not None:
+        merge_state(state, merged)
+
+
+# Потоки несколько save_state_async подряд стартуют в любом порядке:
+# пишем под одним lock'ом, а снимок старше уже записанного — пропускаем
+# (иначе более старый state затрёт более новый).
+_SAVE_LOCK = threading.Lock()
+# next() у count атомарен — без _SAVE_LOCK, который держит идущая запись
+_SAVE_GEN = itertools.count(1)
+_SAVED_GEN = 0
+
+
+def _next_generation() -> int:
+    return next(_SAVE_GEN)
+
+
+def _claim_generation(gen: int) -> bool:
+    # вызывать под _SAVE_LOCK
+    global _SAVED_GEN
+    if gen <= _SAVED_GEN:
+        return False
+    _SAVED_GEN = gen
+    return True
+
+
+def _save_state_dict(data: Dict[str, Any], gen: int) -> None:
+    with _SAVE_LOCK:
+        if _claim_generation(gen):
+            _write_state_dict(data)
+
+
+def _write_state_dict(data: Dict[str, Any]) -> None:
     if _sheets_enabled():
         try:
             _sheets_save_state(data)
@@ -162,113 +410,318 @@ def save_state(data: Dict[str, Any]) -> None:
     _file_save_state(data)
 
 
+# =========================
+# Shared state (several workers)
+# =========================
+# Несколько процессов (COORD_ENABLED=1) пишут один state. Перед записью
+# читаем сохранённый, сливаем (объединение id, max ts) и применяем retention —
+# под файловым lock'ом, чтобы один воркер не затирал отметки другого.
+STATE_LOCK_FILE = os.path.join(STATE_DIR, "state.lock")
+
+# None — обычный режим (один процесс, просто перезапись)
+_SHARED_MAX_AGE_DAYS: Optional[float] = None
+
+
+def enable_shared_state(max_age_days: float) -> None:
+    global _SHARED_MAX_AGE_DAYS
+    _SHARED_MAX_AGE_DAYS = float(max_age_days)
+
+
+@contextmanager
+def file_lock(path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def merge_state(into: BotState, other: BotState) -> None:
+    """
+    Слияние без потерь: id-множества объединяются, ts — берётся больший.
+    Порядок слияния не важен, поэтому воркеры сходятся к одному состоянию.
+    """
+    for name in _ID_SETS:
+        getattr(into, name).update(getattr(other, name))
+    for name in _TS_MAPS:
+        mine = getattr(into, name)
+        earliest = name in _EARLIEST_MAPS
+        for cid, ts in getattr(other, name).items():
+            if cid not in mine or (ts < mine[cid] if earliest else ts > mine[cid]):
+                mine[cid] = ts
+    into.startup_ts = max(into.startup_ts, other.startup_ts)
+    for key, value in other.extra.items():
+        into.extra.setdefault(key, value)
+
+
+def _save_shared_state(data: Dict[str, Any], gen: int) -> Optional[BotState]:
+    with _SAVE_LOCK, file_lock(STATE_LOCK_FILE):
+        if not _claim_generation(gen):
+            return None
+        st = BotState.from_dict(data)
+        merge_state(st, BotState.from_dict(_load_state_dict()))
+        # retention после слияния — иначе выкинутое одним воркером
+        # вернулось бы из копии другого
+        compact_state(st, _SHARED_MAX_AGE_DAYS)
+        _write_state_dict(st.to_dict())
+        return st
+
+
 # -------------------------
 # SEEN / WATCH / TRACKED
 # -------------------------
-def seen_ids(state: Dict[str, Any]) -> Set[int]:
-    return set(state.get("seen", []))
+def seen_ids(state: BotState) -> Set[int]:
+    return state.seen
 
 
-def mark_seen(state: Dict[str, Any], cid: int) -> None:
-    s = set(state.get("seen", []))
-    s.add(int(cid))
-    state["seen"] = sorted(s)
+def mark_seen(state: BotState, cid: int) -> None:
+    state.seen.add(cid)
 
 
-def tracked_ids(state: Dict[str, Any]) -> Set[int]:
-    return set(state.get("tracked", []))
+def tracked_ids(state: BotState) -> Set[int]:
+    return state.tracked
 
 
-def mark_tracked(state: Dict[str, Any], cid: int) -> None:
-    s = set(state.get("tracked", []))
-    s.add(int(cid))
-    state["tracked"] = sorted(s)
+def mark_tracked(state: BotState, cid: int) -> None:
+    state.tracked.add(cid)
 
 
-def watch_ids(state: Dict[str, Any]) -> Set[int]:
-    return set(state.get("watch", []))
+def watch_ids(state: BotState) -> Set[int]:
+    return state.watch
 
 
-def mark_watch(state: Dict[str, Any], cid: int) -> None:
-    s = set(state.get("watch", []))
-    s.add(int(cid))
-    state["watch"] = sorted(s)
+def mark_watch(state: BotState, cid: int) -> None:
+    state.watch.add(cid)
 
 
-def unmark_watch(state: Dict[str, Any], cid: int) -> None:
-    s = set(state.get("watch", []))
-    s.discard(int(cid))
-    state["watch"] = sorted(s)
+def unmark_watch(state: BotState, cid: int) -> None:
+    state.watch.discard(cid)
 
 
 # =========================
 # ULTRA HARD ANTIDUPLICATE (PRO)
 # =========================
-def ultra_seen(state: Dict[str, Any], cid: int) -> bool:
-    lock = state.get("ultra_lock", {}) or {}
-    return str(int(cid)) in lock
+def ultra_seen(state: BotState, cid: int) -> bool:
+    return cid in state.ultra_lock
 
 
-def mark_ultra_seen(state: Dict[str, Any], cid: int) -> None:
-    lock = state.get("ultra_lock", {}) or {}
-    lock[str(int(cid))] = float(time.time())
-    state["ultra_lock"] = lock
+def mark_ultra_seen(state: BotState, cid: int) -> None:
+    state.ultra_lock[cid] = float(time.time())
 
-def early_sent(state, cid):
-    return str(cid) in state.get("early_sent", {})
 
+def early_sent(state: BotState, cid: int) -> bool:
+    return cid in state.early_sent
 
-def mark_early_sent(state, cid, ts):
-    state.setdefault("early_sent", {})[str(cid)] = ts
+
+def mark_early_sent(state: BotState, cid: int, ts: float) -> None:
+    state.early_sent[cid] = float(ts)
 
 
 # -------------------------
 # FIRST MOVE cooldown / sent
 # -------------------------
-def first_move_sent(state: Dict[str, Any], cid: int) -> bool:
-    sent = state.get("first_move_sent", {}) or {}
-    return str(cid) in sent
+def first_move_sent(state: BotState, cid: int) -> bool:
+    return cid in state.first_move_sent
 
 
-def mark_first_move_sent(state: Dict[str, Any], cid: int, ts: float) -> None:
-    sent = state.get("first_move_sent", {}) or {}
-    sent[str(cid)] = float(ts)
-    state["first_move_sent"] = sent
+def mark_first_move_sent(state: BotState, cid: int, ts: float) -> None:
+    state.first_move_sent[cid] = float(ts)
 
 
-def first_move_cooldown_ok(state: Dict[str, Any], cid: int, cooldown_sec: int) -> bool:
-    sent = state.get("first_move_sent", {}) or {}
-    last_ts = float(sent.get(str(cid), 0.0) or 0.0)
+def first_move_cooldown_ok(state: BotState, cid: int, cooldown_sec: int) -> bool:
+    last_ts = state.first_move_sent.get(cid, 0.0)
     return (time.time() - last_ts) >= cooldown_sec
 
 
 # -------------------------
 # CONFIRM LIGHT cooldown / sent
 # -------------------------
-def confirm_light_sent(state: Dict[str, Any], cid: int) -> bool:
-    sent = state.get("confirm_light_sent", {}) or {}
-    return str(cid) in sent
+def confirm_light_sent(state: BotState, cid: int) -> bool:
+    return cid in state.confirm_light_sent
+
+
+def mark_confirm_light_sent(state: BotState, cid: int, ts: float) -> None:
+    state.confirm_light_sent[cid] = float(ts)
+
+
+def confirm_light_cooldown_ok(state: BotState, cid: int, cooldown_sec: int) -> bool:
+    last_ts = state.confirm_light_sent.get(cid, 0.0)
+    return (time.time() - last_ts) >= cooldown_sec
+
+
+# -------------------------
+# CROWD MEMORY
+# -------------------------
+def mark_crowd_memory(state: BotState, cid: int, ts: float) -> None:
+    state.crowd_memory[cid] = float(ts)
+
 
+def crowd_memory_ts(state: BotState, cid: int) -> Optional[float]:
+    return state.crowd_memory.get(cid)
 
-def mark_confirm_light_sent(state: Dict[str, Any], cid: int, ts: float) -> None:
-    sent = state.get("confirm_light_sent", {}) or {}
-    sent[str(cid)] = float(ts)
-    state["confirm_light_sent"] = sent
+
+# -------------------------
+# CROWD FLOW cooldown / sent
+# -------------------------
+def mark_crowd_flow_sent(state: BotState, cid: int, ts: float) -> None:
+    state.crowd_flow_sent[cid] = float(ts)
 
 
-def confirm_light_cooldown_ok(state: Dict[str, Any], cid: int, cooldown_sec: int) -> bool:
-    sent = state.get("confirm_light_sent", {}) or {}
-    last_ts = float(sent.get(str(cid), 0.0) or 0.0)
+def crowd_flow_cooldown_ok(state: BotState, cid: int, cooldown_sec: int) -> bool:
+    last_ts = state.crowd_flow_sent.get(cid, 0.0)
     return (time.time() - last_ts) >= cooldown_sec
 
 
 # -------------------------
 # STARTUP GUARD (anti-spam "bot started")
 # -------------------------
-def startup_sent_recent(state: Dict[str, Any], cooldown_sec: int = 3600) -> bool:
-    last_ts = float(state.get("startup_ts", 0.0) or 0.0)
-    return (time.time() - last_ts) < cooldown_sec
+def startup_sent_recent(state: BotState, cooldown_sec: int = 3600) -> bool:
+    return (time.time() - state.startup_ts) < cooldown_sec
 
 
-def mark_startup_sent(state: Dict[str, Any]) -> None:
-    state["startup_ts"] = float(time.time())
+def mark_startup_sent(state: BotState) -> None:
+    state.startup_ts = float(time.time())
+
+
+# -------------------------
+# COIN AGE (для retention)
+# -------------------------
+def mark_coin_added(state: BotState, cid: int, ts: float) -> None:
+    state.coin_added.setdefault(cid, float(ts))
+
+
+def coin_first_seen(state: BotState, cid: int, ts: float) -> float:
+    """
+    Монета без date_added: первое появление в CMC — её суррогатная дата.
+    """
+    return state.first_seen.setdefault(cid, float(ts))
+
+
+# =========================
+# RETENTION / COMPACTION
+# =========================
+# Без этого ultra_lock / *_sent / crowd_memory / debug-мапы и seen/tracked
+# растут бесконечно, и каждый load/save/json-parse становится дороже.
+#
+# Политика на каждую мапу: (ttl_sec, max_count), 0 = без ограничения.
+# Переопределяется env: STATE_TTL_<NAME>_SEC / STATE_MAX_<NAME>
+# например STATE_TTL_CROWD_MEMORY_SEC=3600, STATE_MAX_SEEN=5000
+STATE_AGE_MARGIN_DAYS = float(os.getenv("STATE_AGE_MARGIN_DAYS", "2"))
+
+_DAY = 24 * 60 * 60
+
+_RETENTION_DEFAULTS = {
+    # антидубли: живут, пока монета может пройти фильтр возраста (+ margin)
+    "ultra_lock": (0, 20000),
+    "early_sent": (0, 20000),
+    "first_move_sent": (0, 20000),
+    "confirm_light_sent": (0, 20000),
+    # короткоживущие
+    "crowd_memory": (1 * _DAY, 5000),
+    "crowd_flow_sent": (1 * _DAY, 5000),
+    "track_debug": (2 * _DAY, 5000),
+    "liq_debug": (2 * _DAY, 5000),
+    # дата монет без date_added: по возрасту не выкидывается — иначе такая
+    # монета снова «новая» и CLEAN LISTING повторится
+    "first_seen": (0, 20000),
+    # множества id (ttl берётся из возраста монеты)
+    "seen": (0, 20000),
+    "tracked": (0, 20000),
+    "watch": (0, 20000),
+}
+
+
+def _env_num(name: str, default: float) -> float:
+    v = (os.getenv(name, "") or "").strip()
+    return float(v) if v else float(default)
+
+
+def retention_policy() -> Dict[str, tuple]:
+    out = {}
+    for name, (ttl, cap) in _RETENTION_DEFAULTS.items():
+        key = name.upper()
+        out[name] = (
+            _env_num(f"STATE_TTL_{key}_SEC", ttl),
+            int(_env_num(f"STATE_MAX_{key}", cap)),
+        )
+    return out
+
+
+def compact_state(
+    state: BotState,
+    max_age_days: float,
+    now: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    Применяет retention ко всем растущим мапам.
+    Возвращает {map_name: сколько выкинули} (только ненулевые).
+    """
+    now = float(time.time()) if now is None else float(now)
+    policy = retention_policy()
+    evicted: Dict[str, int] = {}
+
+    added = state.coin_added
+
+    # 1) возраст монеты. Монеты без date_added (есть first_seen) фильтр
+    #    возраста пропускает всегда — по возрасту их не выкидываем, только
+    #    cap по first_seen. Для старых id без обоих — самый ранний
+    #    известный ts (или now): они уйдут позже, но уйдут.
+    for name in _ID_SETS:
+        for cid in getattr(state, name):
+            if cid not in added:
+                if cid in state.first_seen:
+                    continue
+                first = [
+                    m[cid]
+                    for m in (state.ultra_lock, state.early_sent, state.first_move_sent)
+                    if cid in m
+                ]
+                added[cid] = min(first) if first else now
+
+    # Монета старше max_age_days не пройдёт фильтр возраста раньше любой
+    # проверки seen/ultra — значит её антидубли можно выкидывать без риска.
+    age_limit = (float(max_age_days) + STATE_AGE_MARGIN_DAYS) * _DAY
+    expired = {cid for cid, ts in added.items() if now - ts > age_limit}
+
+    # 2) множества id: возраст монеты + cap (старшие монеты уходят первыми)
+    for name in _ID_SETS:
+        ids = getattr(state, name)
+        if not ids:
+            continue
+        keep = ids - expired
+        _, cap = policy[name]
+        if cap and len(keep) > cap:
+            keep = set(sorted(keep, key=lambda c: added.get(c, state.first_seen.get(c, 0.0)), reverse=True)[:cap])
+        if len(keep) != len(ids):
+            evicted[name] = len(ids) - len(keep)
+            setattr(state, name, keep)
+
+    # 3) ts-мапы: возраст монеты + ttl + cap (свежие остаются)
+    for name, (ttl, cap) in policy.items():
+        if name in _ID_SETS:
+            continue
+        m = getattr(state, name)
+        if not m:
+            continue
+        keep_old = name == "first_seen"
+        items = [
+            (cid, ts) for cid, ts in m.items()
+            if (keep_old or cid not in expired) and not (ttl and now - ts > ttl)
+        ]
+        if cap and len(items) > cap:
+            items.sort(key=lambda kv: kv[1], reverse=True)
+            items = items[:cap]
+        if len(items) != len(m):
+            evicted[name] = len(m) - len(items)
+            setattr(state, name, dict(items))
+
+    # 4) сама мапа возрастов
+    n = len(added)
+    for cid in expired:
+        added.pop(cid, None)
+    if len(added) != n:
+        evicted["coin_added"] = n - len(added)
+
+    return evicted
@@ -0,0 +1,287 @@
+# telegram_out.py
+import asyncio
+import html
+import itertools
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+
+from http_stats import HTTPX_EVENT_HOOKS
+from metrics import TELEGRAM_MESSAGES, TELEGRAM_SECONDS
+from rate_limit import TokenBucket
+
+# =========================
+# Telegram outbound queue
+# =========================
+# Скан не ждёт Telegram: post() только кладёт сообщение в очередь,
+# отдельная task шлёт с token bucket (~1 msg/s, 20/min на групповой чат)
+# и честно ждёт retry_after при 429. При нескольких воркерах (COORD_ENABLED)
+# лимит чата общий: слот берётся ещё и в Coordinator.take_rate_slot.
+TG_RATE_PER_SEC = float(os.getenv("TG_RATE_PER_SEC", "1"))
+TG_BURST = int(os.getenv("TG_BURST", "3"))
+TG_PER_MIN = int(os.getenv("TG_PER_MIN", "20"))
+TG_SEND_RETRIES = int(os.getenv("TG_SEND_RETRIES", "3"))
+
+TG_RATE_NAME = "telegram"
+
+# лимит Telegram — 4096 символов, оставляем запас под HTML
+TG_MAX_TEXT = 4000
+
+PRIORITY_HIGH = 0    # FIRST MOVE / CONFIRM / ошибки — сразу в очередь
+PRIORITY_NORMAL = 1  # склеиваются по монете в рамках одного скана
+PRIORITY_LOW = 2     # уходят одним дайджестом в конце скана
+
+# снимок CMC (и end_scan) бывает раз в час — NORMAL / LOW столько не ждут
+TG_FLUSH_SEC = float(os.getenv("TG_FLUSH_SEC", "60"))
+
+_DIGEST_SEP = "\n\n———\n\n"
+_TAG_RE = re.compile(r"<[^>]*>")
+
+# пул соединений к api.telegram.org (по умолчанию в PTB — одно)
+TG_POOL_SIZE = int(os.getenv("TG_POOL_SIZE", "8"))
+
+
+def build_application(token: str) -> Application:
+    """
+    Один Application на event loop: бот + переиспользуемый httpx-пул.
+    """
+    request = HTTPXRequest(
+        connection_pool_size=TG_POOL_SIZE,
+        pool_timeout=5.0,
+        httpx_kwargs={"event_hooks": HTTPX_EVENT_HOOKS},
+    )
+    return Application.builder().token(token).request(request).build()
+
+
+class TelegramOutbox:
+    """
+    post(text, priority, key):
+      HIGH   → сразу в очередь отправки
+      NORMAL → копится до end_scan(), сообщения одной монеты (key) склеиваются
+      LOW    → копится до end_scan(), все вместе уходят одним дайджестом
+    run_flusher() дополнительно зовёт end_scan() каждые TG_FLUSH_SEC.
+    """
+
+    def __init__(self, app, chat_id: str, coord=None):
+        self.app = app
+        self.chat_id = chat_id
+        self.bucket = TokenBucket(TG_RATE_PER_SEC, TG_BURST, TG_PER_MIN)
+        # общий бюджет между воркерами (None / выключен — только локальный bucket)
+        self.coord = coord if coord is not None and coord.enabled else None
+
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+
+        # key -> [texts] (порядок ключей сохраняется)
+        self._coin_buf: Dict[str, List[str]] = {}
+        self._low_buf: List[str] = []
+
+        self.sent = 0
+        self.dropped = 0
+        self.retry_after_total = 0.0
+
+    # ---------- producer side ----------
+    def post(
+        self,
+        text: str,
+        priority: int = PRIORITY_NORMAL,
+        key: Optional[str] = None,
+        parse_mode: Optional[str] = ParseMode.HTML,
+        on_delivered: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        """
+        on_delivered(ts) — после успешной отправки (только HIGH: NORMAL / LOW
+        склеиваются с другими сообщениями).
+        """
+        if priority == PRIORITY_HIGH:
+            self._enqueue(priority, text, parse_mode, on_delivered)
+        elif priority == PRIORITY_LOW:
+            self._low_buf.append(text)
+        else:
+            self._coin_buf.setdefault(key or f"_{next(self._seq)}", []).append(text)
+
+    def end_scan(self) -> None:
+        for texts in self._coin_buf.values():
+            for chunk in _pack(texts):
+                self._enqueue(PRIORITY_NORMAL, chunk, ParseMode.HTML)
+        self._coin_buf.clear()
+
+        if self._low_buf:
+            header = f"🗂 <b>DIGEST</b> ({len(self._low_buf)})\n\n"
+            for chunk in _pack(self._low_buf, header=header):
+                self._enqueue(PRIORITY_LOW, chunk, ParseMode.HTML)
+            self._low_buf.clear()
+
+    def flush_key(self, key: str) -> None:
+        """
+        Отправить накопленное по одной монете сейчас, не дожидаясь end_scan()
+        (webhook-скан одного символа).
+        """
+        for chunk in _pack(self._coin_buf.pop(key, [])):
+            self._enqueue(PRIORITY_NORMAL, chunk, ParseMode.HTML)
+
+    def _enqueue(
+        self,
+        priority: int,
+        text: str,
+        parse_mode: Optional[str],
+        on_delivered: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        self._queue.put_nowait((priority, next(self._seq), text, parse_mode, on_delivered))
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() + len(self._low_buf) + sum(len(v) for v in self._coin_buf.values())
+
+    async def wait_room(self, high_water: int) -> None:
+        """
+        Backpressure для pipeline: пока очередь отправки длиннее high_water,
+        новые алерты ждут, а не копятся в памяти.
+        """
+        while self._queue.qsize() >= high_water:
+            await asyncio.sleep(0.5)
+
+    # ---------- sender side ----------
+    async def _shared_slot(self) -> None:
+        if self.coord is None:
+            return
+        while True:
+            try:
+                wait = await asyncio.to_thread(
+                    self.coord.take_rate_slot, TG_RATE_NAME, 1.0 / max(TG_RATE_PER_SEC, 1e-6), TG_PER_MIN
+                )
+            except Exception as e:
+                # SQLite недоступен — не молчим, но и не встаём: локальный bucket остаётся
+                print("⚠️ TG SHARED RATE ERROR:", repr(e), flush=True)
+                return
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def _block_shared(self, sec: float) -> None:
+        if self.coord is None:
+            return
+        try:
+            await asyncio.to_thread(self.coord.block_rate, TG_RATE_NAME, sec)
+        except Exception as e:
+            print("⚠️ TG SHARED RATE ERROR:", repr(e), flush=True)
+
+    async def _send(self, text: str, parse_mode: Optional[str]) -> bool:
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            await self._shared_slot()
+            try:
+                with TELEGRAM_SECONDS.time():
+                    await self.app.bot.send_message(
+                        chat_id=self.chat_id,
+                        text=text,
+                        parse_mode=parse_mode,
+                    )
+                self.sent += 1
+                TELEGRAM_MESSAGES.inc(result="sent")
+                return True
+            except RetryAfter as e:
+                # 429: ждём сколько сказали, попытку не считаем
+                ra = e.retry_after
+                sec = ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra)
+                self.retry_after_total += sec
+                self.bucket.block(sec)
+                await self._block_shared(sec)
+                TELEGRAM_MESSAGES.inc(result="retry_after")
+            except (BadRequest, Forbidden) as e:
+                self.dropped += 1
+                TELEGRAM_MESSAGES.inc(result="dropped")
+                print("TG SEND DROPPED:", e, flush=True)
+                return False
+            except Exception as e:
+                attempt += 1
+                if attempt >= TG_SEND_RETRIES:
+                    self.dropped += 1
+                    TELEGRAM_MESSAGES.inc(result="failed")
+                    print("TG SEND ERROR:", e, flush=True)
+                    return False
+                await asyncio.sleep(1.5 * attempt)
+
+    async def _deliver(self, item) -> None:
+        _, _, text, parse_mode, on_delivered = item
+        if await self._send(text, parse_mode) and on_delivered is not None:
+            try:
+                on_delivered(time.time())
+            except Exception as e:
+                print("TG on_delivered ERROR:", repr(e), flush=True)
+
+    async def run(self) -> None:
+        while True:
+            await self._deliver(await self._queue.get())
+
+    async def run_flusher(self) -> None:
+        while True:
+            await asyncio.sleep(TG_FLUSH_SEC)
+            self.end_scan()
+
+    async def drain(self) -> None:
+        self.end_scan()
+        while not self._queue.empty():
+            await self._deliver(self._queue.get_nowait())
+
+
+def _fit(text: str, limit: int) -> List[str]:
+    """
+    Сообщение длиннее limit режем по строкам. Посреди тега резать нельзя
+    (BadRequest — и весь кусок пропадёт), поэтому теги снимаем: дальше
+    это plain text, экранированный под HTML.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    plain = html.escape(html.unescape(_TAG_RE.sub("", text)), quote=False)
+    out: List[str] = []
+    cur = ""
+    for line in plain.split("\n"):
+        # одна строка длиннее лимита — жёсткий рез, но не посреди &amp;
+        while len(line) > limit:
+            cut = limit
+            amp = line.rfind("&", max(0, limit - 4), limit)
+            if amp != -1 and ";" not in line[amp:limit]:
+                cut = amp
+            if cur:
+                out.append(cur)
+                cur = ""
+            out.append(line[:cut])
+            line = line[cut:]
+        if cur and len(cur) + 1 + len(line) > limit:
+            out.append(cur)
+            cur = line
+        else:
+            cur = f"{cur}\n{line}" if cur else line
+    if cur:
+        out.append(cur)
+    return out
+
+
+def _pack(texts: List[str], header: str = "") -> List[str]:
+    """
+    Склейка в сообщения не длиннее TG_MAX_TEXT.
+    """
+    out: List[str] = []
+    cur: List[str] = []
+    size = len(header)
+
+    for piece in texts:
+        for t in _fit(piece, TG_MAX_TEXT - len(header)):
+            add = len(t) + (len(_DIGEST_SEP) if cur else 0)
+            if cur and size + add > TG_MAX_TEXT:
+                out.append(header + _DIGEST_SEP.join(cur))
+                cur, size, add = [], len(header), len(t)
+            cur.append(t)
+            size += add
+
+    if cur:
+        out.append(header + _DIGEST_SEP.join(cur))
+    return out
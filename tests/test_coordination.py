@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+import coordination
+from coordination import Coordinator, HashRing
+
+
+@pytest.fixture
+def pair(tmp_path):
+    path = str(tmp_path / "coord.sqlite")
+    a, b = Coordinator(enabled=True, path=path), Coordinator(enabled=True, path=path)
+    a.worker_id, b.worker_id = "w-a", "w-b"
+    a.heartbeat()
+    b.heartbeat()
+    a.heartbeat()
+    return a, b
+
+
+def test_hash_ring_moves_few_keys():
+    keys = [str(i) for i in range(2000)]
+    two = HashRing(["a", "b"])
+    three = HashRing(["a", "b", "c"])
+
+    moved = sum(1 for k in keys if two.owner(k) != three.owner(k))
+
+    assert {two.owner(k) for k in keys} == {"a", "b"}
+    # к новому воркеру уходит ~1/3, остальные остаются на месте
+    assert moved < len(keys) * 0.5
+    assert all(three.owner(k) == "c" for k in keys if two.owner(k) != three.owner(k))
+    assert HashRing([]).owner("1") is None
+
+
+def test_single_leader_and_shared_ring(pair):
+    a, b = pair
+
+    assert a.leader and not b.leader
+    assert a.ring.members == b.ring.members == ["w-a", "w-b"]
+    assert sum(a.owns(cid) for cid in range(100)) + sum(b.owns(cid) for cid in range(100)) == 100
+
+
+def test_lease_moves_when_leader_stops(pair):
+    a, b = pair
+
+    a.release()
+    b.heartbeat()
+
+    assert b.leader
+    assert b.ring.members == ["w-b"]
+
+
+def test_rate_slot_shared(pair):
+    a, b = pair
+
+    assert a.take_rate_slot("tg", 1.0, 20) == 0.0
+    # второй воркер — уже в интервале первого
+    assert b.take_rate_slot("tg", 1.0, 20) > 0.9
+
+    b.block_rate("tg", 30.0)
+    assert a.take_rate_slot("tg", 0.0, 20) > 29.0
+
+
+def test_publish_only_on_change(pair):
+    a, b = pair
+
+    assert a.publish("listings", [1, 2])
+    assert not a.publish("listings", [1, 2])
+    assert b.published("listings") == [1, 2]
+    assert b.published("listings") is coordination.UNCHANGED
+
+
+def test_claim_once_across_workers(pair):
+    a, b = pair
+
+    assert a.claim_once("webhook", "ABC|buy", 60)
+    assert not b.claim_once("webhook", "ABC|buy", 60)
+    assert b.claim_once("webhook", "ABC|sell", 60)
+    assert Coordinator(enabled=False).claim_once("webhook", "ABC|buy", 60)
+
+
+def test_inbox_of_dead_worker_rerouted(pair):
+    a, b = pair
+    a.forward("w-dead", "webhook", {"symbol": "ABC"}, key="42")
+    a.forward("w-dead", "webhook", {"symbol": "XYZ"})
+
+    a.heartbeat()
+
+    owner = a if a.ring.owner("42") == "w-a" else b
+    assert owner.take_forwarded("webhook") == [{"symbol": "ABC"}]
+    # без ключа переадресовать некуда — строка удалена
+    assert a.take_forwarded("webhook") == [] and b.take_forwarded("webhook") == []
+
+
+def test_inbox_expires(pair, monkeypatch):
+    a, b = pair
+    a.forward("w-b", "webhook", {"symbol": "ABC"}, key="1")
+    monkeypatch.setattr(coordination, "COORD_INBOX_TTL_SEC", -1.0)
+
+    a.heartbeat()
+
+    assert b.take_forwarded("webhook") == []
+
+
+def test_rebalance_reloads_before_new_ring(pair, monkeypatch):
+    a, b = pair
+    monkeypatch.setattr(coordination, "COORD_HEARTBEAT_SEC", 0.01)
+    seen = []
+
+    async def reload():
+        # ring ещё старый, пока state не подтянут
+        seen.append(list(b.ring.members))
+
+    b.on_rebalance = reload
+    a.release()
+
+    async def run():
+        task = asyncio.create_task(b.run())
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run())
+
+    assert seen == [["w-a", "w-b"]]
+    assert b.ring.members == ["w-b"]
@@ -0,0 +1,42 @@
+import detectors
+
+
+def _candles():
+    # плавный рост + два всплеска объёма + импульсная последняя свеча
+    out = []
+    for i in range(29):
+        close = 1 + 0.01 * i
+        open_ = close - 0.005
+        out.append({
+            "ts": i * 300.0,
+            "open": open_,
+            "high": close + 0.002,
+            "low": open_ - 0.002,
+            "close": close,
+            "volume": 100 + 10 * i + (400 if i == 26 else 0),
+        })
+    out.append({"ts": 29 * 300.0, "open": 1.29, "high": 1.352, "low": 1.288, "close": 1.35, "volume": 1000})
+    return out
+
+
+def test_first_move_crowd_line_dict_candles():
+    out = detectors.evaluate_stack("ABC", _candles(), [], first_move=True, funding_flow=True)
+
+    assert out["error"] is None
+    assert out["gates"] == {"anti_scam": True, "liquidity_growth": True, "liquidity_memory": True}
+    assert out["first_move"]["ok"]
+    assert "Толпа вошла" in out["first_move"]["text"]
+
+
+def test_first_move_no_crowd_line_without_funding_flow():
+    out = detectors.evaluate_stack("ABC", _candles(), [], first_move=True, funding_flow=False)
+
+    assert out["first_move"]["ok"]
+    assert "Толпа вошла" not in out["first_move"]["text"]
+
+
+def test_crowd_engine_dict_candles():
+    out = detectors.evaluate_stack("ABC", _candles(), [], first_move=False, funding_flow=False)
+
+    assert out["crowd"]
+    assert "Толпа начала активно входить" in out["crowd_explain"]
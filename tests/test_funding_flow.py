@@ -0,0 +1,65 @@
+import funding_flow
+from funding_flow import FundingStore
+
+T0 = 1_800_000_000.0
+
+
+def _store(points, exchange="bybit", history=120):
+    # points: [(минут от T0, funding, oi_usd)]
+    store = FundingStore(history=history)
+    for minute, fr, oi in points:
+        store._append(exchange, {"ABCUSDT": (T0 + minute * 60, fr, oi)})
+    return store
+
+
+def test_ring_buffer_keeps_last_n():
+    store = _store([(i, 0.0001, 100.0 + i) for i in range(10)], history=3)
+
+    series = store._series["bybit"]["ABCUSDT"]
+
+    assert [p[2] for p in series] == [107.0, 108.0, 109.0]
+
+
+def test_delisted_symbol_dropped():
+    store = _store([(0, 0.0001, 100.0)])
+
+    store._append("bybit", {"XYZUSDT": (T0 + 60, 0.0001, 1.0)})
+
+    assert store.status() == {"bybit": 1, "binance": 0}
+    assert store.funding("ABC") is None
+
+
+def test_window_compares_with_point_an_hour_ago():
+    # каждые 10 минут, 2 часа: OI 100 → 220
+    store = _store([(m, 0.0001 + m * 1e-6, 100.0 + m) for m in range(0, 121, 10)])
+
+    then, last = store._window("bybit", "ABC")
+
+    assert last[0] - then[0] == funding_flow.FUNDING_WINDOW_SEC
+    assert store.oi_growth_pct("ABC") == (220.0 / 160.0 - 1.0) * 100.0
+    assert store.funding_rising("ABC")
+
+
+def test_needs_two_points():
+    store = _store([(0, 0.0001, 100.0)])
+
+    assert store.oi_growth_pct("ABC") is None
+    assert not store.funding_rising("ABC")
+
+
+def test_funding_averages_exchanges():
+    store = _store([(0, 0.0002, 100.0)])
+    store._append("binance", {"ABCUSDT": (T0, 0.0004, None)})
+
+    assert abs(store.funding("abc") - 0.0003) < 1e-12
+
+
+def test_crowd_ok_band(monkeypatch):
+    store = _store([(0, 0.0005, 100.0), (60, 0.0005, 120.0)])
+    monkeypatch.setattr(funding_flow, "FUNDING", store)
+
+    assert funding_flow.funding_crowd_ok("ABC")
+
+    # перегретый funding — толпа уже внутри
+    store._append("bybit", {"ABCUSDT": (T0 + 3600, 0.01, 130.0)})
+    assert not funding_flow.funding_crowd_ok("ABC")
@@ -0,0 +1,50 @@
+import pytest
+
+import http_stats
+from http_stats import endpoint_of
+
+TOKEN = "123456789:AAHdqTcvCH1vGWJxfSeofSAs0K5PALDsaw"
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(http_stats, "_STATS", {})
+    monkeypatch.setattr(http_stats, "_RECENT", {})
+
+
+def test_bot_token_redacted():
+    host, endpoint = endpoint_of(f"https://api.telegram.org/bot{TOKEN}/sendMessage")
+
+    assert host == "api.telegram.org"
+    assert endpoint == "/bot*/sendMessage"
+    assert TOKEN.split(":")[1] not in endpoint
+
+
+def test_sheet_ids_and_ranges_collapsed():
+    url = "https://sheets.googleapis.com/v4/spreadsheets/1AbCdEfGhIjKlMnOpQrStUvWxYz0123456789/values/Log!A1:append"
+
+    assert endpoint_of(url) == ("sheets.googleapis.com", "/v4/spreadsheets/*/values/*:append")
+
+
+def test_plain_endpoints_kept():
+    assert endpoint_of("https://api.binance.com/api/v3/klines?symbol=ABCUSDT") == (
+        "api.binance.com",
+        "/api/v3/klines",
+    )
+
+
+def test_record_groups_by_endpoint():
+    for chat in ("1", "2"):
+        http_stats.record(
+            f"https://api.telegram.org/bot{TOKEN}/sendMessage?chat_id={chat}",
+            200, 0.1, 10, headers={"retry-after": "3"},
+        )
+    http_stats.record_error(f"https://api.telegram.org/bot{TOKEN}/sendMessage", TimeoutError("slow"), 1.0)
+
+    st = http_stats.snapshot()["api.telegram.org"]["/bot*/sendMessage"]
+
+    assert st["requests"] == 3
+    assert st["errors"] == 1
+    assert st["status"] == {"200": 2, "TimeoutError": 1}
+    assert st["rate_limit"] == {"retry-after": "3"}
+    assert http_stats.error_rates()["telegram"]["errors"] == 1
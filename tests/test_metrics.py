@@ -0,0 +1,54 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # метрики теста не смешиваем с метриками сканера
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+
+
+def test_counter_and_gauge_text_format():
+    c = metrics.Counter("t_events_total", "Events", ("kind",))
+    g = metrics.Gauge("t_depth", "Depth")
+    c.inc(kind="a")
+    c.inc(2, kind='q"x\n')
+    g.set(3)
+
+    assert metrics.render() == (
+        "# HELP t_events_total Events\n"
+        "# TYPE t_events_total counter\n"
+        't_events_total{kind="a"} 1.0\n'
+        't_events_total{kind="q\\"x\\n"} 2.0\n'
+        "# HELP t_depth Depth\n"
+        "# TYPE t_depth gauge\n"
+        "t_depth 3.0\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram("t_seconds", "Latency", ("stage",), buckets=(1.0, 0.1))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v, stage="x")
+
+    lines = metrics.render().splitlines()
+
+    assert lines == [
+        "# HELP t_seconds Latency",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{stage="x",le="0.1"} 1.0',
+        't_seconds_bucket{stage="x",le="1.0"} 2.0',
+        't_seconds_bucket{stage="x",le="+Inf"} 3.0',
+        't_seconds_sum{stage="x"} 5.55',
+        't_seconds_count{stage="x"} 3.0',
+    ]
+
+
+def test_histogram_time_observes():
+    h = metrics.Histogram("t_block_seconds", "Block")
+
+    with h.time():
+        pass
+
+    assert "t_block_seconds_count 1.0" in metrics.render()
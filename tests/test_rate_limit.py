@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from rate_limit import TokenBucket
+
+
+def _take(bucket, n):
+    async def run():
+        for _ in range(n):
+            await bucket.acquire()
+
+    asyncio.run(run())
+
+
+def test_burst_then_rate():
+    b = TokenBucket(rate=1.0, burst=3, per_min=0)
+
+    _take(b, 3)
+
+    assert b._wait_time() == pytest.approx(1.0, abs=0.05)
+
+
+def test_per_min_window():
+    b = TokenBucket(rate=1000.0, burst=1000, per_min=2)
+
+    _take(b, 2)
+
+    assert b._wait_time() == pytest.approx(60.0, abs=0.5)
+
+
+def test_block_delays_next_token():
+    b = TokenBucket(rate=1000.0, burst=10, per_min=0)
+    assert b._wait_time() == 0.0
+
+    b.block(5.0)
+
+    assert b._wait_time() == pytest.approx(5.0, abs=0.05)
+
+
+def test_per_minute_budget():
+    b = TokenBucket.per_minute(120)
+
+    assert b.rate == 2.0
+    assert b.burst == 12
+    assert b.per_min == 120
@@ -0,0 +1,89 @@
+import scheduler
+from scheduler import SymbolScheduler
+from state import BotState
+
+NOW = 1_800_000_000.0
+
+
+def _entry(sched, cid=1):
+    sched.upsert(cid, f"C{cid}", {"any": True})
+    return sched.entries[cid]
+
+
+def test_tiers():
+    sched = SymbolScheduler()
+    st = BotState()
+    e = _entry(sched)
+
+    assert sched.cadence(e, st, NOW) == scheduler.SCHED_COLD_SEC
+    assert e.tier == "COLD"
+
+    st.early_sent[1] = NOW - 10
+    assert sched.cadence(e, st, NOW) == scheduler.SCHED_WARM_SEC
+    assert e.tier == "WARM"
+
+    st.crowd_memory[1] = NOW - 10
+    assert sched.cadence(e, st, NOW) == scheduler.SCHED_HOT_SEC
+    assert e.tier == "HOT"
+
+
+def test_young_and_volatile_tiers():
+    sched = SymbolScheduler()
+    st = BotState()
+    e = _entry(sched)
+
+    st.coin_added[1] = NOW - 3600
+    assert sched.cadence(e, st, NOW) == scheduler.SCHED_WARM_SEC
+
+    e.volatility = scheduler.SCHED_VOLATILE_PCT
+    assert sched.cadence(e, st, NOW) == scheduler.SCHED_HOT_SEC
+
+
+def test_pop_due_skips_stale_heap_rows():
+    sched = SymbolScheduler()
+    a, b = _entry(sched, 1), _entry(sched, 2)
+    sched._push(a, NOW + 100)
+    sched._push(b, NOW + 10)
+    sched.retain({1})
+
+    assert sched.pop_due(NOW + 50) == []
+    assert sched.next_due() == NOW + 100
+    assert sched.pop_due(NOW + 100) == [a]
+    assert sched.next_due() is None
+
+
+# ---------- candle clock ----------
+def test_aligned_due_lands_after_bar_close(monkeypatch):
+    monkeypatch.setattr(scheduler.random, "uniform", lambda lo, hi: hi)
+    delay = scheduler.CANDLE_CLOSE_DELAY_SEC + scheduler.CANDLE_CLOSE_JITTER_SEC
+    now = 1_800_000_010.0  # 10с после закрытия 5m-бара
+
+    # последнее закрытие не позже now + cadence
+    assert scheduler.aligned_due(now, 300) == 1_800_000_300.0 + delay
+    assert scheduler.aligned_due(now, 3600) == 1_800_003_600.0 + delay
+    # cadence меньше бара — всё равно следующее закрытие, а не прошедшее
+    assert scheduler.aligned_due(now, 60) == 1_800_000_300.0 + delay
+
+
+def test_closed_bars_drops_forming_bar():
+    now = 1_800_000_010.0
+    candles = [{"ts": now - 610}, {"ts": now - 310}, {"ts": now - 10}]
+
+    assert scheduler.closed_bars(candles, "5m", now) == candles[:2]
+    assert scheduler.closed_bars(candles[:2], "5m", now) == candles[:2]
+    assert scheduler.bar_ts({"t": 1_800_000_000_000}) == 1_800_000_000.0
+
+
+def test_retry_soon_falls_back_to_schedule():
+    sched = SymbolScheduler()
+    st = BotState()
+    e = _entry(sched)
+
+    for _ in range(scheduler.CANDLE_RETRY_MAX):
+        sched.retry_soon(e, st, NOW)
+        assert e.due == NOW + scheduler.CANDLE_RETRY_SEC
+
+    sched.retry_soon(e, st, NOW)
+
+    assert e.retries == 0
+    assert e.due > NOW + scheduler.SCHED_COLD_SEC - scheduler.TF_SEC["5m"]
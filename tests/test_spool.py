@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+import spool
+
+
+@pytest.fixture
+def sp(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path))
+    s = spool.Spool("test")
+    yield s
+    s.close()
+
+
+def test_ack_only_delivered(sp):
+    for i in range(5):
+        sp.append({"i": i}, ts=100.0 + i)
+
+    batch = sp.peek(3)
+    sp.ack(2)
+
+    assert [d["i"] for _, d in batch] == [0, 1, 2]
+    assert sp.pending == 3
+    assert [d["i"] for _, d in sp.peek(10)] == [2, 3, 4]
+
+
+def test_ack_survives_restart(sp):
+    for i in range(3):
+        sp.append({"i": i})
+    sp.peek(1)
+    sp.ack(1)
+    sp.close()
+
+    again = spool.Spool("test")
+
+    assert again.pending == 2
+    assert [d["i"] for _, d in again.peek(10)] == [1, 2]
+    again.close()
+
+
+def test_cap_drops_oldest_segments(sp, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_SEGMENT_BYTES", 1)
+    monkeypatch.setattr(spool, "SPOOL_MAX_SEGMENTS", 2)
+
+    for i in range(4):
+        sp.append({"i": i})
+
+    assert sp.dropped == 2
+    assert sp.pending == 2
+    assert [d["i"] for _, d in sp.peek(10)] == [2]
+
+
+def test_oldest_ts_does_not_consume(sp):
+    assert sp.oldest_ts() is None
+
+    sp.append({"i": 0}, ts=100.0)
+    sp.append({"i": 1}, ts=200.0)
+
+    assert sp.oldest_ts() == 100.0
+    assert sp.oldest_ts() == 100.0
+    assert [ts for ts, _ in sp.peek(10)] == [100.0, 200.0]
+
+
+def test_drain_once_acks_partial_delivery(sp):
+    for i in range(4):
+        sp.append({"i": i})
+
+    done = asyncio.run(spool.drain_once(sp, lambda records: 3, batch_max=10))
+
+    assert done == 3
+    assert sp.pending == 1
+    assert sp.errors == 1
+    assert sp.inflight is None
+
+
+def test_drainer_backoff_grows_and_caps(sp, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_BACKOFF_BASE_SEC", 1.0)
+    monkeypatch.setattr(spool, "SPOOL_BACKOFF_MAX_SEC", 4.0)
+    sp.append({"i": 0})
+
+    delays = []
+
+    class Stop(Exception):
+        pass
+
+    def uniform(lo, hi):
+        delays.append(hi)
+        if len(delays) == 5:
+            raise Stop
+        return 0.0
+
+    monkeypatch.setattr(spool.random, "uniform", uniform)
+
+    with pytest.raises(Stop):
+        asyncio.run(spool.run_drainer(sp, lambda records: 0, batch_max=10))
+
+    assert delays == [1.0, 2.0, 4.0, 4.0, 4.0]
+    assert sp.pending == 1
@@ -0,0 +1,141 @@
+import state
+
+
+def _payload(n=2000):
+    # разные строки, чтобы zlib не сжал всё в один кусок
+    return {"seen": list(range(n)), "note": "".join(chr(0x400 + i % 200) for i in range(n))}
+
+
+def test_state_cells_round_trip_chunked(monkeypatch):
+    monkeypatch.setattr(state, "STATE_SHEET_CHUNK", 100)
+    data = _payload()
+
+    cells = state.encode_state_cells(data)
+
+    assert len(cells) > 1
+    assert cells[0].startswith(f"z2:{len(cells)}:")
+    assert state.decode_state_cells(cells) == data
+
+
+def test_state_cells_ignore_stale_tail(monkeypatch):
+    # после более длинного payload в строке остаются старые куски
+    monkeypatch.setattr(state, "STATE_SHEET_CHUNK", 100)
+    old = state.encode_state_cells(_payload(4000))
+    new = state.encode_state_cells({"seen": [1, 2, 3]})
+
+    cells = new + old[len(new):]
+
+    assert state.decode_state_cells(cells) == {"seen": [1, 2, 3]}
+
+
+def test_state_cells_legacy_formats():
+    assert state.decode_state_cells(['{"seen": [7]}']) == {"seen": [7]}
+    assert state.decode_state_cells([]) == {}
+    assert state.decode_state_cells(["z2:1:not-base64!"]) == {}
+
+
+def test_state_row_layout():
+    row = ["BOT_STATE_V1"] + state.state_row_values(["a", "b", "c"], "2026-01-01")
+
+    assert row == ["BOT_STATE_V1", "a", "2026-01-01", "b", "c"]
+    assert state.state_cells_from_row(row) == ["a", "b", "c"]
+
+
+# ---------- retention / compaction ----------
+DAY = 24 * 60 * 60
+NOW = 2_000_000_000.0
+
+
+def test_compact_drops_anti_dup_of_old_coins():
+    st = state.BotState()
+    for cid, age_days in ((1, 1), (2, 100)):
+        state.mark_coin_added(st, cid, NOW - age_days * DAY)
+        state.mark_seen(st, cid)
+        state.mark_ultra_seen(st, cid)
+
+    evicted = state.compact_state(st, max_age_days=30, now=NOW)
+
+    assert st.seen == {1}
+    assert set(st.ultra_lock) == {1}
+    assert set(st.coin_added) == {1}
+    assert evicted == {"seen": 1, "ultra_lock": 1, "coin_added": 1}
+
+
+def test_compact_ttl_and_cap(monkeypatch):
+    monkeypatch.setenv("STATE_MAX_CROWD_MEMORY", "2")
+    st = state.BotState()
+    state.mark_coin_added(st, 9, NOW)
+    st.crowd_memory = {1: NOW - 2 * DAY, 2: NOW - 30, 3: NOW - 20, 4: NOW - 10}
+
+    state.compact_state(st, max_age_days=30, now=NOW)
+
+    # просроченный по ttl (1 день) ушёл, из свежих остались 2 последних
+    assert st.crowd_memory == {3: NOW - 20, 4: NOW - 10}
+
+
+def test_compact_keeps_undated_coins():
+    # без date_added фильтр возраста монету пропускает — антидубли не выкидываем
+    st = state.BotState()
+    state.coin_first_seen(st, 5, NOW - 400 * DAY)
+    state.mark_seen(st, 5)
+    state.mark_ultra_seen(st, 5)
+
+    assert state.compact_state(st, max_age_days=30, now=NOW) == {}
+    assert st.seen == {5}
+    assert 5 in st.ultra_lock
+    assert 5 not in st.coin_added
+
+
+def test_coin_first_seen_keeps_first():
+    st = state.BotState()
+
+    assert state.coin_first_seen(st, 5, 100.0) == 100.0
+    assert state.coin_first_seen(st, 5, 200.0) == 100.0
+
+
+# ---------- BotState / shared save ----------
+def test_bot_state_dict_round_trip():
+    data = {
+        "seen": ["3", 1],
+        "ultra_lock": {"7": 10.0},
+        "track_debug": {"8": {"ts": 5, "why": "x"}},
+        "startup_ts": "12",
+        "custom": {"keep": True},
+    }
+
+    st = state.BotState.from_dict(data)
+
+    assert st.seen == {1, 3}
+    assert st.ultra_lock == {7: 10.0}
+    assert st.track_debug == {8: 5.0}
+    assert st.extra == {"custom": {"keep": True}}
+
+    out = st.to_dict()
+    assert out["seen"] == [1, 3]
+    assert out["ultra_lock"] == {"7": 10.0}
+    assert out["startup_ts"] == 12.0
+    assert out["custom"] == {"keep": True}
+
+
+def test_merge_state_is_lossless():
+    a = state.BotState.from_dict({"seen": [1], "ultra_lock": {"1": 10.0}, "first_seen": {"1": 50.0}})
+    b = state.BotState.from_dict({"seen": [2], "ultra_lock": {"1": 20.0}, "first_seen": {"1": 40.0}})
+
+    state.merge_state(a, b)
+
+    assert a.seen == {1, 2}
+    assert a.ultra_lock == {1: 20.0}
+    # first_seen — самый ранний
+    assert a.first_seen == {1: 40.0}
+
+
+def test_stale_save_skipped(monkeypatch):
+    writes = []
+    monkeypatch.setattr(state, "_write_state_dict", lambda data: writes.append(data["startup_ts"]))
+    older = state._next_generation()
+    newer = state._next_generation()
+
+    state._save_state_dict({"startup_ts": 2.0}, newer)
+    state._save_state_dict({"startup_ts": 1.0}, older)
+
+    assert writes == [2.0]
@@ -0,0 +1,99 @@
+import asyncio
+
+import telegram_out
+from rate_limit import TokenBucket
+from telegram_out import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, TG_MAX_TEXT, TelegramOutbox, _pack
+
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.sent.append(text)
+
+
+class _App:
+    def __init__(self):
+        self.bot = _Bot()
+
+
+def _outbox():
+    out = TelegramOutbox(_App(), "chat")
+    out.bucket = TokenBucket(rate=1000.0, burst=1000, per_min=0)
+    return out
+
+
+def _queued(out):
+    return [(prio, text) for prio, _, text, _, _ in sorted(out._queue._queue)]
+
+
+def test_pack_joins_under_limit():
+    chunks = _pack(["a", "b", "c"], header="H\n")
+
+    assert chunks == ["H\na" + telegram_out._DIGEST_SEP + "b" + telegram_out._DIGEST_SEP + "c"]
+
+
+def test_pack_splits_long_html_on_lines():
+    line = "<b>x</b> a&b\n"
+    text = "<i>start</i>\n" + line * 1000
+
+    chunks = _pack([text])
+
+    assert len(chunks) > 1
+    assert all(len(c) <= TG_MAX_TEXT for c in chunks)
+    # длинное — уже plain text, без разрезанных тегов
+    assert not any("<" in c or ">" in c for c in chunks)
+    assert all(c.count("&") == c.count("&amp;") for c in chunks)
+
+
+def test_pack_hard_cut_never_splits_entity():
+    chunks = _pack(["&" * (TG_MAX_TEXT * 2)])
+
+    assert all(c.endswith("&amp;") for c in chunks)
+    assert all(len(c) <= TG_MAX_TEXT for c in chunks)
+
+
+def test_priorities_and_end_scan():
+    out = _outbox()
+    out.post("err", priority=PRIORITY_HIGH)
+    out.post("coin 1", key="ABC")
+    out.post("coin 2", key="ABC")
+    out.post("early", priority=PRIORITY_LOW)
+
+    # HIGH — сразу, остальное ждёт end_scan
+    assert _queued(out) == [(PRIORITY_HIGH, "err")]
+    assert out.queue_depth() == 4
+
+    out.end_scan()
+
+    sep = telegram_out._DIGEST_SEP
+    assert _queued(out) == [
+        (PRIORITY_HIGH, "err"),
+        (PRIORITY_NORMAL, "coin 1" + sep + "coin 2"),
+        (PRIORITY_LOW, "🗂 <b>DIGEST</b> (1)\n\nearly"),
+    ]
+
+
+def test_flush_key_sends_one_coin():
+    out = _outbox()
+    out.post("a", key="A")
+    out.post("b", key="B")
+
+    out.flush_key("A")
+
+    assert _queued(out) == [(PRIORITY_NORMAL, "a")]
+
+
+def test_drain_delivers_in_priority_order():
+    out = _outbox()
+    delivered = []
+    out.post("low", priority=PRIORITY_LOW)
+    out.post("normal", key="X")
+    out.post("high", priority=PRIORITY_HIGH, on_delivered=delivered.append)
+
+    asyncio.run(out.drain())
+
+    assert out.app.bot.sent == ["high", "normal", "🗂 <b>DIGEST</b> (1)\n\nlow"]
+    assert out.sent == 3
+    assert len(delivered) == 1
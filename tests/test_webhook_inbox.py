@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+import webhook_inbox
+from webhook_inbox import WebhookInbox, normalize_symbol
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("BINANCE:FOGOUSDT", "FOGO"),
+    ("FOGOUSDT.P", "FOGO"),
+    ("fogo", "FOGO"),
+    (" bybit:abc-usdt ", "ABC"),
+    ("USDT", "USDT"),
+    (None, ""),
+])
+def test_normalize_symbol(raw, expected):
+    assert normalize_symbol(raw) == expected
+
+
+def test_duplicate_in_window_dropped():
+    inbox = WebhookInbox()
+
+    assert inbox.submit({"symbol": "BINANCE:ABCUSDT", "action": "Buy"}) == "queued"
+    assert inbox.submit({"symbol": "ABC", "action": "buy"}) == "duplicate"
+    assert inbox.submit({"symbol": "ABC", "action": "sell"}) == "queued"
+
+    assert inbox.accepted == 2
+    assert inbox.duplicates == 1
+    assert inbox.depth() == 2
+
+
+def test_duplicate_after_window_accepted(monkeypatch):
+    inbox = WebhookInbox()
+    monkeypatch.setattr(webhook_inbox, "WEBHOOK_DEDUPE_SEC", 0.0)
+
+    assert inbox.submit({"symbol": "ABC"}) == "queued"
+    assert inbox.submit({"symbol": "ABC"}) == "queued"
+
+
+def test_full_queue_is_busy(monkeypatch):
+    monkeypatch.setattr(webhook_inbox, "WEBHOOK_QUEUE_MAX", 1)
+    inbox = WebhookInbox()
+
+    assert inbox.submit({"symbol": "A"}) == "queued"
+    assert inbox.submit({"symbol": "B"}) == "busy"
+    assert inbox.dropped == 1
+
+
+class _Coord:
+    enabled = True
+
+    def __init__(self):
+        self.claimed = set()
+
+    def claim_once(self, kind, key, window):
+        if key in self.claimed:
+            return False
+        self.claimed.add(key)
+        return True
+
+
+def test_shared_dedupe_across_inboxes():
+    coord = _Coord()
+    first, second = WebhookInbox(coord=coord), WebhookInbox(coord=coord)
+    first.submit({"symbol": "ABC", "action": "buy"})
+    second.submit({"symbol": "ABC", "action": "buy"})
+    second.resubmit({"symbol": "XYZ", "action": "buy", "forwarded": True})
+
+    async def run():
+        item = await first.get()
+        # дубль из второго воркера отброшен, пересланный — без dedupe
+        other = await second.get()
+        return item, other
+
+    item, other = asyncio.run(run())
+
+    assert item["symbol"] == "ABC"
+    assert other["symbol"] == "XYZ"
+    assert second.duplicates == 1
@@ -1,22 +1,21 @@
 import time
-from typing import Dict, Any, Optional
+from typing import Optional
 
+from state import BotState
 
-def should_send_track_debug(state: Dict[str, Any], cid: int, every_sec: int = 3600) -> bool:
+
+def should_send_track_debug(state: BotState, cid: int, every_sec: int = 3600) -> bool:
     """
     Чтобы не спамить: 1 раз в every_sec на токен.
     """
-    state.setdefault("track_debug", {})
-    rec = state["track_debug"].get(str(int(cid)))
-    if not rec:
+    last_ts = state.track_debug.get(cid)
+    if last_ts is None:
         return True
-    last_ts = float(rec.get("ts") or 0)
     return (time.time() - last_ts) >= float(every_sec)
 
 
-def mark_track_debug_sent(state: Dict[str, Any], cid: int) -> None:
-    state.setdefault("track_debug", {})
-    state["track_debug"][str(int(cid))] = {"ts": time.time()}
+def mark_track_debug_sent(state: BotState, cid: int) -> None:
+    state.track_debug[cid] = float(time.time())
 
 
 def build_track_debug_text(
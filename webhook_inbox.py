@@ -0,0 +1,101 @@
+# webhook_inbox.py
+import asyncio
+import os
+import time
+from typing import Any, Dict, Tuple
+
+# =========================
+# TradingView webhook inbox
+# =========================
+# POST /webhook только кладёт алерт сюда и сразу отвечает 200.
+# Повтор того же symbol/action в окне WEBHOOK_DEDUPE_SEC — отбрасывается:
+# в submit() — в рамках процесса, в get() — через Coordinator на все воркеры
+# (TradingView может попасть с повтором в другой воркер).
+WEBHOOK_QUEUE_MAX = int(os.getenv("WEBHOOK_QUEUE_MAX", "200"))
+WEBHOOK_DEDUPE_SEC = float(os.getenv("WEBHOOK_DEDUPE_SEC", "60"))
+
+
+def normalize_symbol(raw: Any) -> str:
+    """
+    "BINANCE:FOGOUSDT" / "FOGOUSDT.P" / "fogo" -> "FOGO"
+    """
+    s = str(raw or "").strip().upper()
+    s = s.split(":")[-1]
+    if s.endswith(".P"):
+        s = s[:-2]
+    if s.endswith("USDT") and len(s) > 4:
+        s = s[:-4]
+    return s.rstrip("-_/")
+
+
+class WebhookInbox:
+    def __init__(self, coord=None):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_MAX)
+        # общий dedupe между воркерами (None / выключен — только локальный)
+        self.coord = coord
+        self._last: Dict[Tuple[str, str], float] = {}
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    def submit(self, data: Dict[str, Any]) -> str:
+        """
+        Возвращает "queued" | "duplicate" | "busy".
+        """
+        symbol = normalize_symbol(data.get("symbol"))
+        action = str(data.get("action") or "signal").strip().lower()
+        now = time.time()
+
+        key = (symbol, action)
+        last = self._last.get(key)
+        if last is not None and now - last < WEBHOOK_DEDUPE_SEC:
+            self.duplicates += 1
+            return "duplicate"
+
+        try:
+            self.queue.put_nowait({"symbol": symbol, "action": action, "raw": data, "ts": now})
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return "busy"
+
+        self._last[key] = now
+        self.accepted += 1
+
+        if len(self._last) > 4 * WEBHOOK_QUEUE_MAX:
+            self._last = {k: ts for k, ts in self._last.items() if now - ts < WEBHOOK_DEDUPE_SEC}
+
+        return "queued"
+
+    def resubmit(self, item: Dict[str, Any]) -> str:
+        """
+        Уже принятый (другим воркером) алерт — без повторного dedupe.
+        """
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return "busy"
+        return "queued"
+
+    async def get(self) -> Dict[str, Any]:
+        while True:
+            item = await self.queue.get()
+            if item.get("forwarded") or await self._claim(item):
+                return item
+            self.duplicates += 1
+
+    async def _claim(self, item: Dict[str, Any]) -> bool:
+        if self.coord is None or not self.coord.enabled:
+            return True
+        try:
+            return await asyncio.to_thread(
+                self.coord.claim_once, "webhook", f"{item['symbol']}|{item['action']}", WEBHOOK_DEDUPE_SEC
+            )
+        except Exception as e:
+            # SQLite недоступен — лучше дубль, чем потерянный алерт
+            print("⚠️ WEBHOOK DEDUPE ERROR:", repr(e), flush=True)
+            return True
+
+    def depth(self) -> int:
+        return self.queue.qsize()